@@ -0,0 +1,67 @@
+-- DRUMBANGER: Dump Pattern
+-- ------------------------
+-- Writes DRUMBANGER's current pattern as text for tools/pattern_render.py:
+-- one line per step, 16 velocities (0-127) per line, pads left to right.
+-- The file lands next to the project (or in REAPER's resource folder for an
+-- unsaved project) as drumbanger_pattern_<N>.txt, and the console shows the
+-- render command to go with it.
+--
+-- The numbers come from the sequencer mirror the plugin keeps in gmem at
+-- 1000 + pattern*1024 + step*16 + pad, rewritten every audio block -- so
+-- DRUMBANGER has to be on a track that is processing (any project with audio
+-- running will do) for the dump to be current.
+--
+-- Install: Actions > Show Action List > New Action > Load ReaScript
+
+local GMEM_NAME = "DrumBanger"
+local MIRROR = 1000               -- gmem[1000 + N*1024 + S*16 + P]
+local MIRROR_STEPS = 64           -- per pattern, whatever the bar count
+local NUM_PADS = 16
+
+local function out_dir()
+  local proj = reaper.GetProjectPath("")
+  if proj and proj ~= "" then return proj end
+  return reaper.GetResourcePath()
+end
+
+local function write_steps(f, pattern, steps)
+  local base = MIRROR + pattern * 1024
+  for s = 0, steps - 1 do
+    local row = {}
+    for p = 0, NUM_PADS - 1 do
+      row[#row + 1] = string.format("%3d", math.floor(reaper.gmem_read(base + s * 16 + p)))
+    end
+    f:write(table.concat(row, " ") .. "\n")
+  end
+end
+
+local function main()
+  reaper.gmem_attach(GMEM_NAME)
+  local pattern = math.floor(reaper.gmem_read(309))
+  local bars    = math.floor(reaper.gmem_read(310))
+  local per_bar = math.floor(reaper.gmem_read(12))
+  local bpm     = reaper.gmem_read(14)
+  if bars < 1 or per_bar < 1 then
+    reaper.ShowConsoleMsg("DRUMBANGER: no pattern in gmem -- is the plugin loaded and running?\n")
+    return
+  end
+
+  local steps = math.min(bars * per_bar, MIRROR_STEPS)
+  local path = out_dir() .. "/" .. string.format("drumbanger_pattern_%d.txt", pattern + 1)
+  local f = io.open(path, "w")
+  if not f then
+    reaper.ShowConsoleMsg("DRUMBANGER: can't write " .. path .. "\n")
+    return
+  end
+  f:write(string.format("# DRUMBANGER pattern %d, %d bar(s) x %d steps, %.2f BPM\n",
+    pattern + 1, bars, per_bar, bpm))
+  write_steps(f, pattern, steps)
+  f:close()
+
+  reaper.ShowConsoleMsg("DRUMBANGER: pattern written to " .. path .. "\n")
+  reaper.ShowConsoleMsg(string.format(
+    "  python tools/pattern_render.py \"%s\" --kit <kit folder> --bpm %g -o render.wav\n",
+    path, bpm))
+end
+
+main()
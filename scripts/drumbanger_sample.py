@@ -14,68 +14,144 @@ How to use:
 
 Install: Actions > Show Action List > New Action > Load ReaScript
 Assign a keyboard shortcut for instant sampling.
+
+For loops and whole bars, set STREAM_CAPTURE below: the whole selection is
+captured at the project sample rate as 24-bit or float, streamed to disk.
 """
 
 import os
 import struct
+import sys
 import time
+from array import array
+
+# numpy turns each chunk's convert-and-clip into one call. REAPER's Python
+# may not have it, so without it the same work is done a chunk at a time
+# with the stdlib -- slower, but still no per-sample file writes.
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # reaper module provides new_array(), gmem_attach/read/write, defer, etc.
 # It's injected by REAPER's Python environment but needs explicit import.
 import reaper
 
+# pool_manifest.py sits next to this script; it owns pool/manifest.txt
+try:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+except NameError:
+    pass
+from pool_manifest import Manifest
+
 GMEM_NAME = "DrumBanger"
 MAX_DURATION = 5.0    # DRUMBANGER buffer limit (seconds)
 SAMPLE_RATE = 48000
 NUM_CHANNELS = 2
-BITS = 16
-
-
-def write_wav(filepath, samples, srate, nch, num_frames):
-    """Write interleaved float samples as 16-bit PCM WAV."""
-    bps = BITS
-    byte_rate = srate * nch * bps // 8
-    block_align = nch * bps // 8
-    data_size = num_frames * nch * bps // 8
-
-    with open(filepath, 'wb') as f:
-        # RIFF header
-        f.write(b'RIFF')
-        f.write(struct.pack('<I', 36 + data_size))
-        f.write(b'WAVE')
-
-        # fmt chunk
-        f.write(b'fmt ')
-        f.write(struct.pack('<I', 16))
-        f.write(struct.pack('<H', 1))         # PCM
-        f.write(struct.pack('<H', nch))
-        f.write(struct.pack('<I', srate))
-        f.write(struct.pack('<I', byte_rate))
-        f.write(struct.pack('<H', block_align))
-        f.write(struct.pack('<H', bps))
-
-        # data chunk
-        f.write(b'data')
-        f.write(struct.pack('<I', data_size))
-
-        # Convert float samples to 16-bit signed PCM
-        scale = 32767
-        for s in samples:
-            s = max(-1.0, min(1.0, s))
-            f.write(struct.pack('<h', int(s * scale)))
-
-
-def update_manifest(pool_dir):
-    """Regenerate pool/manifest.txt from wav files in directory."""
-    wav_files = sorted(
-        f for f in os.listdir(pool_dir)
-        if f.lower().endswith('.wav')
-    )
-    manifest_path = os.path.join(pool_dir, "manifest.txt")
-    with open(manifest_path, 'w') as f:
-        for wav in wav_files:
-            f.write(wav + '\n')
-    return wav_files
+FORMAT = "pcm16"
+
+# Long captures for resampling (loops, whole bars): no length cap, the
+# project's own sample rate and a format that doesn't requantise. Audio goes
+# to disk chunk by chunk either way, so memory stays constant.
+STREAM_CAPTURE = False
+STREAM_FORMAT = "float32"    # "pcm16", "pcm24" or "float32"
+
+# format -> (WAV format tag, bits per sample)
+FORMATS = {"pcm16": (1, 16), "pcm24": (1, 24), "float32": (3, 32)}
+
+
+def chunk_samples(buf, count):
+    """The first `count` doubles of a reaper.new_array buffer, as bytes.
+
+    Buffers that expose the buffer protocol are copied out in one go; otherwise a
+    slice copies the chunk at C speed. Indexing element by element is only
+    the last resort.
+    """
+    try:
+        return memoryview(buf).cast('B')[:count * 8].tobytes()
+    except TypeError:
+        pass
+    try:
+        return array('d', buf[0:count]).tobytes()
+    except TypeError:
+        return array('d', (buf[i] for i in range(count))).tobytes()
+
+
+def encode(chunk, fmt):
+    """Native float64 bytes -> little-endian sample bytes in `fmt`.
+
+    PCM is clipped to full scale; float32 keeps overs as they are.
+    """
+    if fmt == "float32":
+        if np is not None:
+            return np.frombuffer(chunk, dtype=np.float64).astype('<f4').tobytes()
+        x = array('d')
+        x.frombytes(chunk)
+        return array('f', x).tobytes()
+    bits = FORMATS[fmt][1]
+    scale = (1 << (bits - 1)) - 1
+    if np is not None:
+        x = np.frombuffer(chunk, dtype=np.float64)
+        pcm = (np.clip(x, -1.0, 1.0) * scale).astype('<i2' if bits == 16 else '<i4')
+        if bits == 24:
+            return pcm.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        return pcm.tobytes()
+    x = array('d')
+    x.frombytes(chunk)
+    pcm = struct.pack('<%d%s' % (len(x), 'h' if bits == 16 else 'i'),
+                      *[int(max(-1.0, min(1.0, s)) * scale) for s in x])
+    if bits == 24:
+        # drop the top byte of each little-endian int32
+        out = bytearray(len(x) * 3)
+        for k in range(3):
+            out[k::3] = pcm[k::4]
+        return bytes(out)
+    return pcm
+
+
+class WavWriter:
+    """A WAV file written as it is captured.
+
+    The header goes out with zero sizes; close() patches the RIFF and data
+    sizes once the length is known, so nothing is held back in memory.
+    """
+
+    def __init__(self, filepath, srate, nch, fmt):
+        tag, bps = FORMATS[fmt]
+        self.fmt = fmt
+        self.data_size = 0
+        self.f = open(filepath, 'wb')
+        self.f.write(b'RIFF' + struct.pack('<I', 0) + b'WAVE')
+        self.f.write(b'fmt ' + struct.pack('<IHHIIHH', 16, tag, nch, srate,
+                                           srate * nch * bps // 8, nch * bps // 8, bps))
+        self.f.write(b'data' + struct.pack('<I', 0))
+
+    def write(self, chunk):
+        data = encode(chunk, self.fmt)
+        self.f.write(data)
+        self.data_size += len(data)
+
+    def close(self):
+        if self.data_size & 1:
+            self.f.write(b'\0')      # chunks are word aligned
+        self.f.seek(4)
+        self.f.write(struct.pack('<I', 36 + self.data_size + (self.data_size & 1)))
+        self.f.seek(40)
+        self.f.write(struct.pack('<I', self.data_size))
+        self.f.close()
+
+
+def project_srate():
+    """The project sample rate, else the audio device's, else SAMPLE_RATE."""
+    if RPR_GetSetProjectInfo(0, "PROJECT_SRATE_USE", 0, False):
+        rate = int(RPR_GetSetProjectInfo(0, "PROJECT_SRATE", 0, False))
+        if rate > 0:
+            return rate
+    (ok, _, rate, _) = RPR_GetAudioDeviceInfo("SRATE", "", 64)
+    try:
+        return int(float(rate)) if ok else SAMPLE_RATE
+    except ValueError:
+        return SAMPLE_RATE
 
 
 def main():
@@ -100,9 +176,10 @@ def main():
         )
         return
 
-    # Cap duration
-    duration = min(end - start, MAX_DURATION)
-    if end - start > MAX_DURATION:
+    # Cap duration (streamed captures take the whole selection)
+    duration = end - start
+    if not STREAM_CAPTURE and duration > MAX_DURATION:
+        duration = MAX_DURATION
         end = start + MAX_DURATION
 
     # ---- Get track to sample from ----
@@ -113,29 +190,6 @@ def main():
         track = RPR_GetMasterTrack(0)
         track_name = "Master"
 
-    # ---- Read audio via AudioAccessor ----
-    accessor = RPR_CreateTrackAudioAccessor(track)
-    srate = SAMPLE_RATE
-    nch = NUM_CHANNELS
-    num_samples = int(duration * srate)
-
-    # Read in chunks to avoid huge single buffer
-    chunk_size = 8192
-    all_samples = []
-    pos = start
-    remaining = num_samples
-
-    while remaining > 0:
-        to_read = min(chunk_size, remaining)
-        buf = reaper.new_array(to_read * nch)
-        RPR_GetAudioAccessorSamples(accessor, srate, nch, pos, to_read, buf.cfunc())
-        for i in range(to_read * nch):
-            all_samples.append(buf[i])
-        pos += to_read / srate
-        remaining -= to_read
-
-    RPR_DestroyAudioAccessor(accessor)
-
     # ---- Determine pool path ----
     resource_path = RPR_GetResourcePath()
     pool_dir = os.path.join(resource_path, "Effects", "DRUMBANGER", "pool")
@@ -150,17 +204,37 @@ def main():
     filename = "samp_{}_{}.wav".format(safe_name, timestamp)
     filepath = os.path.join(pool_dir, filename)
 
-    # ---- Write WAV ----
-    write_wav(filepath, all_samples, srate, nch, num_samples)
+    # ---- Read audio via AudioAccessor, writing each chunk as it arrives ----
+    accessor = RPR_CreateTrackAudioAccessor(track)
+    srate = project_srate() if STREAM_CAPTURE else SAMPLE_RATE
+    nch = NUM_CHANNELS
+    num_samples = int(duration * srate)
+    out = WavWriter(filepath, srate, nch, STREAM_FORMAT if STREAM_CAPTURE else FORMAT)
 
-    # ---- Update manifest and find new sample index ----
-    wav_list = update_manifest(pool_dir)
-    new_idx = wav_list.index(filename) if filename in wav_list else -1
+    chunk_size = 8192
+    buf = reaper.new_array(chunk_size * nch)
+    done = 0
+    try:
+        while done < num_samples:
+            to_read = min(chunk_size, num_samples - done)
+            # position from the frame count, so long captures don't drift
+            pos = start + done / srate
+            RPR_GetAudioAccessorSamples(accessor, srate, nch, pos, to_read, buf.cfunc())
+            out.write(chunk_samples(buf, to_read * nch))
+            done += to_read
+    finally:
+        out.close()
+        RPR_DestroyAudioAccessor(accessor)
+
+    # ---- Insert into the manifest; its position is the pool index ----
+    new_idx = Manifest(pool_dir).add(filename)
 
     # ---- Signal DRUMBANGER via gmem ----
     reaper.gmem_attach(GMEM_NAME)
     reaper.gmem_write(1, new_idx)    # pool index of new sample
-    reaper.gmem_write(2, 1)          # auto-load onto selected pad
+    # auto-load onto the selected pad, if it fits DRUMBANGER's buffer: that
+    # holds MAX_DURATION at SAMPLE_RATE in frames, whatever rate this ran at
+    reaper.gmem_write(2, 1 if num_samples <= int(MAX_DURATION * SAMPLE_RATE) else 0)
     reaper.gmem_write(0, 1)          # rescan signal (set last!)
 
     RPR_ShowConsoleMsg(
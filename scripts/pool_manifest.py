@@ -0,0 +1,144 @@
+"""
+DRUMBANGER: Pool Manifest
+-------------------------
+One place that owns pool/manifest.txt for the Python side and scan_pool.sh.
+
+manifest.txt is the plugin's index space: line N is pool index N, every
+.wav under pool/ (subfolders = kits), sorted bytewise like the Lua rescan.
+Next to it, manifest.idx keeps the same paths with their size and mtime,
+so adding a sample is a bisect into the sorted list and one atomic rewrite,
+not a walk of the whole pool.
+
+Usage:
+    python3 pool_manifest.py scan <pool_dir>          full rescan
+    python3 pool_manifest.py add <pool_dir> <rel>...  insert, print indices
+"""
+
+import bisect
+import os
+import sys
+import tempfile
+
+MANIFEST = "manifest.txt"
+INDEX = "manifest.idx"     # path \t size \t mtime_ns, in manifest order
+
+
+def _write_atomic(path, lines):
+    """Replace `path` with `lines` so readers never see a half-written file."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".manifest")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as f:
+            f.writelines(lines)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Manifest:
+    """The pool's sorted sample list plus size/mtime for each entry.
+
+    `paths` is sorted and mirrors manifest.txt line for line; `meta` maps
+    each path to (size, mtime_ns).
+    """
+
+    def __init__(self, pool_dir, rescan=False):
+        self.pool_dir = pool_dir
+        self.paths = []
+        self.meta = {}
+        if rescan or not self._load():
+            self.scan()
+
+    def _load(self):
+        """Read manifest.idx; False if missing or out of step with the
+        manifest (another tool rewrote it), which calls for a rescan."""
+        try:
+            with open(os.path.join(self.pool_dir, INDEX), encoding="utf-8") as f:
+                rows = [line.rstrip("\n").split("\t") for line in f if line.strip()]
+            with open(os.path.join(self.pool_dir, MANIFEST), encoding="utf-8") as f:
+                listed = [line.strip() for line in f if line.strip()]
+        except OSError:
+            return False
+        paths = [r[0] for r in rows]
+        if paths != listed or any(len(r) != 3 for r in rows):
+            return False
+        self.paths = paths
+        self.meta = {p: (int(s), int(m)) for p, s, m in rows}
+        return True
+
+    def scan(self):
+        """Walk pool/ recursively and rewrite both files."""
+        found = {}
+        for root, dirs, files in os.walk(self.pool_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            rel_dir = os.path.relpath(root, self.pool_dir).replace(os.sep, "/")
+            for name in files:
+                if name.lower().endswith(".wav"):
+                    st = os.stat(os.path.join(root, name))
+                    rel = name if rel_dir == "." else rel_dir + "/" + name
+                    found[rel] = (st.st_size, st.st_mtime_ns)
+        self.paths = sorted(found)
+        self.meta = found
+        self.save()
+        return self.paths
+
+    def save(self):
+        _write_atomic(os.path.join(self.pool_dir, MANIFEST),
+                      [p + "\n" for p in self.paths])
+        _write_atomic(os.path.join(self.pool_dir, INDEX),
+                      ["%s\t%d\t%d\n" % ((p,) + self.meta[p]) for p in self.paths])
+
+    def index(self, rel):
+        """Pool index of `rel`, or -1."""
+        i = bisect.bisect_left(self.paths, rel)
+        return i if i < len(self.paths) and self.paths[i] == rel else -1
+
+    def add(self, rel, save=True):
+        """Insert (or refresh) one file, given relative to pool/ with '/'
+        separators; returns its pool index."""
+        st = os.stat(os.path.join(self.pool_dir, *rel.split("/")))
+        i = bisect.bisect_left(self.paths, rel)
+        if i == len(self.paths) or self.paths[i] != rel:
+            self.paths.insert(i, rel)
+        self.meta[rel] = (st.st_size, st.st_mtime_ns)
+        if save:
+            self.save()
+        return i
+
+    def remove(self, rel, save=True):
+        i = self.index(rel)
+        if i >= 0:
+            del self.paths[i]
+            del self.meta[rel]
+            if save:
+                self.save()
+        return i
+
+    def kits(self):
+        """Distinct kit folders, in manifest order."""
+        folders = (p.rpartition("/")[0] for p in self.paths)
+        return [f for f in dict.fromkeys(folders) if f]
+
+
+def main(argv):
+    if len(argv) < 2 or argv[0] not in ("scan", "add"):
+        sys.stderr.write(__doc__)
+        return 2
+    pool_dir = argv[1]
+    if argv[0] == "scan":
+        m = Manifest(pool_dir, rescan=True)
+        print("Pool: {} samples, {} kits (folders)".format(len(m.paths), len(m.kits())))
+        return 0
+    m = Manifest(pool_dir)
+    rels = [rel.replace(os.sep, "/") for rel in argv[2:]]
+    for rel in rels:
+        m.add(rel, save=False)
+    m.save()
+    # later inserts shift earlier ones, so report final positions
+    for rel in rels:
+        print(m.index(rel))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
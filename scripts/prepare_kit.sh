@@ -8,6 +8,10 @@ set -euo pipefail
 #   ./prepare_kit.sh synth [kit_name]              — Generate synthetic drum kit (ffmpeg)
 #   ./prepare_kit.sh convert <source_folder> [kit_name] — Convert existing samples
 #
+# convert hands off to tools/kit_prep.py when python3 and numpy are there:
+# same pad mapping, all cores, and unchanged sources are skipped on re-runs.
+# Without them it falls back to ffmpeg, one file at a time.
+#
 # Output: ~/.config/REAPER/Effects/DRUMBANGER/pool/<kit_name>/
 #
 # Subfolders in pool/ become kits in DRUMBANGER.
@@ -55,6 +59,8 @@ PAD_KEYWORDS=(
 SAMPLE_RATE=48000
 FORMAT="pcm_s24le"  # 24-bit WAV
 
+KIT_PREP="$(cd "$(dirname "$0")/.." && pwd)/tools/kit_prep.py"
+
 # ============================================================
 # Helper functions
 # ============================================================
@@ -369,10 +375,9 @@ usage() {
   done
 }
 
-check_ffmpeg
-
 case "${1:-}" in
   synth)
+    check_ffmpeg
     generate_synth_kit "${2:-default}"
     ;;
   convert)
@@ -381,6 +386,12 @@ case "${1:-}" in
       echo "Usage: $(basename "$0") convert <source_folder> [kit_name]"
       exit 1
     fi
+    if [ -f "$KIT_PREP" ] && python3 -c "import numpy" 2>/dev/null; then
+      python3 "$KIT_PREP" --pool "$POOL_DIR" kit "$2" "${3:-custom}"
+      echo "Run the DRUMBANGER Rescan action in REAPER to detect the new kit."
+      exit 0
+    fi
+    check_ffmpeg
     convert_existing_kit "$2" "${3:-custom}"
     ;;
   -h|--help|help)
@@ -9,22 +9,32 @@
 #
 # Subfolders in pool/ become kits. Drop a folder of .wav files to add a kit.
 # First 16 .wav files (alphabetical) per folder map to pads 1-16.
+#
+# pool_manifest.py does the scan when python3 is around, so the manifest
+# (and its manifest.idx) match what drumbanger_sample.py maintains.
 
 set -e
 
 BASE_DIR="${1:-$HOME/.config/REAPER/Effects/DRUMBANGER}"
 POOL_DIR="$BASE_DIR/pool"
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
 
 # ---- Pool scan (includes subfolders = kits) ----
 if [ -d "$POOL_DIR" ]; then
-    cd "$POOL_DIR"
-    find . -iname "*.wav" | sed 's|^\./||' | sort > manifest.txt
-    POOL_COUNT=$(wc -l < manifest.txt)
+    if command -v python3 >/dev/null 2>&1; then
+        python3 "$SCRIPT_DIR/pool_manifest.py" scan "$POOL_DIR"
+    else
+        cd "$POOL_DIR"
+        # bytewise order, the same as the Lua rescan and pool_manifest.py
+        find . -iname "*.wav" | sed 's|^\./||' | LC_ALL=C sort > manifest.txt
+        rm -f manifest.idx    # stale now; pool_manifest.py rebuilds it
+        POOL_COUNT=$(wc -l < manifest.txt)
 
-    # Count subfolders (= kits)
-    KIT_COUNT=$(find . -mindepth 1 -maxdepth 1 -type d | wc -l)
+        # Count subfolders (= kits)
+        KIT_COUNT=$(find . -mindepth 1 -maxdepth 1 -type d | wc -l)
 
-    echo "Pool: $POOL_COUNT samples, $KIT_COUNT kits (folders)"
+        echo "Pool: $POOL_COUNT samples, $KIT_COUNT kits (folders)"
+    fi
 else
     echo "Pool: directory not found ($POOL_DIR)"
     echo "  Create it and drop .wav files there for loose samples."
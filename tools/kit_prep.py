@@ -0,0 +1,1095 @@
+#!/usr/bin/env python3
+"""Kit preparation for DRUMBANGER, in-process and on every core.
+
+DRUMBANGER wants 48 kHz / 24-bit stereo in pool/<kit>/, one kit per folder,
+pads 01-16 in the order below. prepare_kit.sh convert got there by starting
+ffmpeg's two-pass loudnorm once per file, one file after another, and did
+it all again on every run. This reads the WAVs with lms_measure's reader,
+resamples, normalises and writes them in a process pool, and remembers what
+it did: an output whose source bytes haven't changed is left alone.
+
+Commands
+    kit      a folder of samples mapped onto pads 01-16 by name, the way
+             prepare_kit.sh convert does it
+    library  a whole tree, every sample, one kit per folder
+    trim     a copy of the pool with leading silence and dead tails cut
+    mirror   pool@44100/, pool@96000/...: the pool resampled for other rates
+    index    measure every pool sample once, into pool/.features.npz
+    suggest  16 pads, one per drum class, answered from the index
+    check    suggest each kit folder back onto its own pads, by sound alone
+    dedup    copies of the same sound across the pool, exact and near;
+             byte-identical ones can become hard links
+
+WAV is decoded here. FLAC, AIFF, OGG and MP3 go through ffmpeg, if it is
+installed, to a temporary float WAV first.
+
+Loudness is BS.1770 integrated loudness (what ffmpeg's loudnorm targets),
+brought to -16 LUFS by a plain gain, pulled back if the 4x-oversampled true
+peak would pass -1 dBTP. loudnorm rides a limiter instead; a one-shot's
+transient is the part worth keeping, so this never compresses it.
+"""
+import argparse, filecmp, functools, hashlib, json, math, os, re, shutil, subprocess, sys, tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+
+from lms_measure import Wav, wav_write
+
+SR = 48000
+BITS = 24
+TARGET_LUFS = -16.0
+TRUE_PEAK_DB = -1.0
+AUDIO_EXT = ('.wav', '.flac', '.aif', '.aiff', '.ogg', '.mp3')
+POOL = os.path.join(os.path.expanduser('~/.config/REAPER'), 'Data', 'pool')
+STATE = '.kit_prep.json'        # in the pool: what each output was made from
+VERSION = 1                     # bump when the processing changes
+
+PAD_BUF_FRAMES = 480000 // 2    # lms_drumbanger.jsfx PAD_BUF_SIZE, stereo frames
+
+PAD_NAMES = ('Kick', 'Snare', 'Rimshot', 'Clap', 'Closed HH', 'Open HH',
+             'Low Tom', 'Mid Tom', 'Hi Tom', 'Crash', 'Ride', 'Shaker',
+             'Perc 1', 'Perc 2', 'FX 1', 'FX 2')
+
+# Matched against the lower-cased file name, first hit in sorted order wins.
+# Same table as prepare_kit.sh.
+PAD_KEYWORDS = (
+    r'kick|bd|bassdrum|bass_drum',
+    r'snare|sn|sd',
+    r'rim|rimshot|sidestick|side_stick|cross_stick',
+    r'clap|cp|handclap',
+    r'closed|chh|cl_hh|hihat_cl|hh_cl|pedal_hh',
+    r'open|ohh|op_hh|hihat_op|hh_op',
+    r'low.?tom|tom.?low|tom.?1|floor',
+    r'mid.?tom|tom.?mid|tom.?2',
+    r'hi.?tom|tom.?hi|tom.?3|rack',
+    r'crash|cr',
+    r'ride|rd',
+    r'shaker|shake|tambourine|tamb',
+    r'perc|conga|bongo|block',
+    r'cowbell|bell|agogo|triangle',
+    r'fx|clav|click|noise|zap',
+    r'fx|sweep|reverse|rev|sub',
+)
+
+
+# ---------------------------------------------------------------- resample
+# Polyphase windowed sinc. For a ratio up/down, outputs n, n + up, n + 2up...
+# all sit at the same fraction between input samples, `down` inputs apart.
+# So each of the `up` phases is one matrix-vector product over a strided
+# window view of the input: no per-sample gather, no copy.
+
+RESAMPLE_HALF = 64              # taps either side of the output point
+RESAMPLE_ROLLOFF = 0.92         # cutoff, fraction of the lower Nyquist
+
+
+@functools.lru_cache(maxsize=16)
+def _phases(up, down, half=RESAMPLE_HALF):
+    """[up, 2*half] taps: row p is the filter for an output sitting p/up of
+    the way from one input sample to the next."""
+    c = min(1.0, up / down) * RESAMPLE_ROLLOFF
+    d = np.arange(-half + 1, half + 1)[None, :] - np.arange(up)[:, None] / up
+    w = np.i0(8.6 * np.sqrt(np.maximum(0.0, 1 - (d / (half + 1)) ** 2))) / np.i0(8.6)
+    taps = c * np.sinc(c * d) * w
+    return taps / taps.sum(axis=1, keepdims=True)
+
+
+def resample(x, sr_in, sr_out, half=RESAMPLE_HALF):
+    """float [n, ch] at sr_in -> float [ceil(n * sr_out / sr_in), ch]."""
+    g = math.gcd(sr_in, sr_out)
+    up, down = sr_out // g, sr_in // g
+    if up == down:
+        return x
+    taps = _phases(up, down, half)
+    # win[j] = the 2*half inputs around position j - half + 1 .. j + half
+    win = np.lib.stride_tricks.sliding_window_view(
+        np.pad(x, ((half, half), (0, 0))), 2 * half, axis=0)
+    n_out = -(-len(x) * up // down)
+    out = np.empty((n_out, x.shape[1]))
+    for n0 in range(min(up, n_out)):
+        base, count = n0 * down // up, len(range(n0, n_out, up))
+        out[n0::up] = win[base + 1:base + 1 + count * down:down] @ taps[n0 * down % up]
+    return out
+
+
+# ---------------------------------------------------------------- loudness
+# @cite itu-bs1770 -- K-weighting, gated integrated loudness, 4x true peak
+
+def _k_weighting(freqs, sr):
+    """|H|^2 of the BS.1770 K-weighting (shelf, then high-pass) at `freqs`.
+    The shelf and high-pass are re-derived for the rate; at 48 kHz they give
+    the spec's published coefficients."""
+    z = np.exp(-2j * np.pi * freqs / sr)
+
+    def biquad(b, a):
+        return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+    A = 10 ** (4.0 / 40)
+    w0 = 2 * np.pi * 1500.0 / sr
+    cw, sa = np.cos(w0), np.sqrt(2 * A) * np.sin(w0)        # Q = 1/sqrt(2)
+    shelf = biquad((A * ((A + 1) + (A - 1) * cw + sa), -2 * A * ((A - 1) + (A + 1) * cw),
+                    A * ((A + 1) + (A - 1) * cw - sa)),
+                   ((A + 1) - (A - 1) * cw + sa, 2 * ((A - 1) - (A + 1) * cw),
+                    (A + 1) - (A - 1) * cw - sa))
+    w0 = 2 * np.pi * 38.0 / sr
+    al = np.sin(w0)                                         # Q = 0.5
+    hp = biquad((1.0, -2.0, 1.0), (1.0, -2 * np.cos(w0) / (1 + al), (1 - al) / (1 + al)))
+    return np.abs(shelf * hp) ** 2
+
+
+def loudness(x, sr):
+    """Integrated loudness, LUFS: K-weighted, 400 ms blocks at 75% overlap,
+    -70 LUFS absolute and -10 LU relative gates. A sample shorter than a
+    block is one block. -inf for silence."""
+    nfft = 1 << int(math.ceil(math.log2(len(x) + sr // 2)))   # room for the tail
+    X = np.fft.rfft(x, nfft, axis=0)
+    H = np.sqrt(_k_weighting(np.fft.rfftfreq(nfft, 1.0 / sr), sr))
+    p = (np.fft.irfft(X * H[:, None], nfft, axis=0)[:len(x)] ** 2).sum(axis=1)
+    size = int(0.4 * sr)
+    if len(p) <= size:
+        z = np.array([p.mean()])
+    else:
+        c = np.concatenate(([0.0], np.cumsum(p)))
+        starts = np.arange(0, len(p) - size + 1, size // 4)
+        z = (c[starts + size] - c[starts]) / size
+    lk = -0.691 + 10 * np.log10(np.maximum(z, 1e-30))
+    z, lk = z[lk > -70.0], lk[lk > -70.0]
+    if not len(z):
+        return -math.inf
+    rel = -0.691 + 10 * math.log10(z.mean()) - 10.0
+    return -0.691 + 10 * math.log10(z[lk > rel].mean())
+
+
+def true_peak(x, sr):
+    """Peak of the 4x-oversampled signal, linear."""
+    return float(np.abs(resample(x, sr, 4 * sr, half=16)).max()) if len(x) else 0.0
+
+
+def normalise(x, sr, target=TARGET_LUFS, ceiling=TRUE_PEAK_DB):
+    """-> (x * gain, loudness before, gain dB)."""
+    lufs = loudness(x, sr)
+    if not math.isfinite(lufs):
+        return x, lufs, 0.0
+    gain = target - lufs
+    tp = true_peak(x, sr)
+    if tp > 0 and 20 * math.log10(tp) + gain > ceiling:
+        gain = ceiling - 20 * math.log10(tp)
+    return x * 10 ** (gain / 20), lufs, gain
+
+
+# ---------------------------------------------------------------- one file
+
+def decode(path):
+    """-> (float [n, 2], sr). Mono is doubled; past two channels, L and R."""
+    if path.lower().endswith('.wav'):
+        w = Wav(path)
+        x, sr = w.read(), w.sr
+    else:
+        if not shutil.which('ffmpeg'):
+            raise ValueError('not a WAV and ffmpeg is not installed')
+        fd, tmp = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        try:
+            subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', path, '-c:a', 'pcm_f32le', tmp],
+                           check=True, capture_output=True)
+            w = Wav(tmp)
+            x, sr = w.read(), w.sr
+            del w
+        except subprocess.CalledProcessError as e:
+            raise ValueError(e.stderr.decode(errors='replace').strip() or 'ffmpeg failed')
+        finally:
+            os.unlink(tmp)
+    if x.shape[1] == 1:
+        x = np.repeat(x, 2, axis=1)
+    return x[:, :2], sr
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params():
+    return {'sr': SR, 'bits': BITS, 'lufs': TARGET_LUFS, 'tp': TRUE_PEAK_DB, 'v': VERSION}
+
+
+def prepare_one(job):
+    """Worker: (src, dst, old state entry or None) -> state row. Never raises.
+
+    The source is hashed first; if it matches the entry the output was made
+    from, nothing is decoded or written.
+    """
+    src, dst, old = job
+    row = {'src': os.path.abspath(src), 'params': params()}
+    try:
+        st = os.stat(src)
+        row.update(size=st.st_size, mtime_ns=st.st_mtime_ns, hash=file_hash(src))
+        if old and old.get('hash') == row['hash'] and old.get('params') == row['params'] \
+                and os.path.exists(dst):
+            row.update(status='same', lufs=old.get('lufs'), gain_db=old.get('gain_db'))
+            return row
+        x, sr = decode(src)
+        x = resample(x, sr, SR)
+        y, lufs, gain = normalise(x, SR)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + '.tmp'
+        wav_write(tmp, y, SR, bits=BITS)
+        os.replace(tmp, dst)
+        row.update(status='converted', lufs=round(lufs, 2) if math.isfinite(lufs) else None,
+                   gain_db=round(gain, 2))
+    except (OSError, ValueError) as e:
+        row.update(status='failed', error=str(e))
+    return row
+
+
+# ---------------------------------------------------------------- batch
+
+def load_state(pool):
+    try:
+        with open(os.path.join(pool, STATE)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(pool, state):
+    path = os.path.join(pool, STATE)
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(state, fh, indent=0, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def run(pairs, pool, jobs=None):
+    """Prepare (src, dst) pairs -> {dst: row}. Outputs whose source still has
+    the size and mtime it was made from are skipped without being opened;
+    the rest are hashed in the workers, and converted only if the bytes
+    really changed."""
+    state = load_state(pool)
+    rows, todo = {}, []
+    for src, dst in pairs:
+        rel = os.path.relpath(dst, pool).replace(os.sep, '/')
+        old = state.get(rel)
+        st = os.stat(src)
+        if (old and old.get('src') == os.path.abspath(src) and old.get('params') == params()
+                and (old.get('size'), old.get('mtime_ns')) == (st.st_size, st.st_mtime_ns)
+                and os.path.exists(dst)):
+            rows[rel] = dict(old, status='same')
+        else:
+            todo.append((rel, (src, dst, old if old and old.get('src') == os.path.abspath(src)
+                               else None)))
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs or None) as ex:
+            done = ex.map(prepare_one, [job for _, job in todo],
+                          chunksize=max(1, len(todo) // 64))
+            for (rel, _), row in zip(todo, done):
+                rows[rel] = row
+    for rel, row in rows.items():
+        if row['status'] != 'failed':
+            state[rel] = {k: v for k, v in row.items() if k != 'status'}
+    save_state(pool, state)
+    return rows
+
+
+def sources(folder, depth=2):
+    """Audio files under `folder`, at most `depth` levels down, sorted."""
+    found = []
+    root_depth = folder.rstrip(os.sep).count(os.sep)
+    for root, dirs, files in os.walk(folder):
+        if root.rstrip(os.sep).count(os.sep) - root_depth >= depth - 1:
+            dirs[:] = []
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        found.extend(os.path.join(root, f) for f in files if f.lower().endswith(AUDIO_EXT))
+    return sorted(found)
+
+
+def pool_wavs(folder):
+    """Every .wav under `folder`, relative to it with '/' separators, sorted."""
+    return sorted(os.path.relpath(f, folder).replace(os.sep, '/')
+                  for f in sources(folder, depth=64) if f.lower().endswith('.wav'))
+
+
+def pad_map(files):
+    """[(pad 0-15, file)]: each pad takes the first file whose name matches
+    its keywords. Under 8 matches, the pads left over take the files no pad
+    claimed, in order -- prepare_kit.sh's sequential fallback."""
+    names = [os.path.basename(f).lower() for f in files]
+    pads = {}
+    for pad, pattern in enumerate(PAD_KEYWORDS):
+        rx = re.compile(pattern)
+        hit = next((f for f, n in zip(files, names) if rx.search(n)), None)
+        if hit:
+            pads[pad] = hit
+    if len(pads) < 8:
+        spare = iter(f for f in files if f not in pads.values())
+        for pad in range(16):
+            if pad not in pads:
+                f = next(spare, None)
+                if f is None:
+                    break
+                pads[pad] = f
+    return sorted(pads.items())
+
+
+def report(rows):
+    counts = {}
+    for rel in sorted(rows):
+        r = rows[rel]
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+        if r['status'] == 'failed':
+            print(f'  {rel}: FAILED {r["error"]}', file=sys.stderr)
+    print('  ' + ', '.join(f'{n} {s}' for s, n in sorted(counts.items())))
+
+
+# ---------------------------------------------------------------- trim
+# DRUMBANGER reads each pad with file_mem(handle, buf, PAD_BUF_SIZE): a fixed
+# buffer, and silence before the hit or a tail 70 dB down spends it for
+# nothing. The envelope is the per-millisecond peak across channels; the
+# useful extent is first to last millisecond within `floor` dB of the peak.
+
+TRIM_FLOOR_DB = -60.0           # relative to the sample's own peak
+TRIM_PRE_MS = 1.0               # kept ahead of the onset, faded in
+TRIM_FADE_MS = 5.0              # fade-out where a tail is cut
+
+
+def trim_extent(x, sr, floor_db=TRIM_FLOOR_DB, pre_ms=TRIM_PRE_MS):
+    """-> (start, stop) frames of the useful part; (0, n) if silent."""
+    blk = max(1, sr // 1000)
+    a = np.abs(x).max(axis=1)
+    env = np.pad(a, (0, -len(a) % blk)).reshape(-1, blk).max(axis=1)
+    if not len(env) or env.max() <= 0:
+        return 0, len(x)
+    above = np.flatnonzero(env >= env.max() * 10 ** (floor_db / 20))
+    start = max(0, above[0] * blk - int(pre_ms * sr / 1000))
+    return start, min(len(x), (above[-1] + 1) * blk)
+
+
+def _fade(n):
+    return 0.5 - 0.5 * np.cos(np.pi * (np.arange(n) + 0.5) / n)
+
+
+def trim_one(job):
+    """Worker: (src, dst, floor_db, fade_ms) -> row. Never raises: a file
+    that cannot be trimmed is copied as-is ('error'), and one that cannot
+    be written at all says why ('unwritten')."""
+    src, dst, floor_db, fade_ms = job
+    row = {'bytes': 0, 'bytes_out': 0}
+    try:
+        row['bytes'] = os.path.getsize(src)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        w = Wav(src)
+        x = w.read()
+        start, stop = trim_extent(x, w.sr, floor_db)
+        if (start, stop) == (0, len(x)):
+            shutil.copy2(src, dst)
+        else:
+            y = x[start:stop].copy()
+            if start:
+                n = min(len(y), int(TRIM_PRE_MS * w.sr / 1000)) or 1
+                y[:n] *= _fade(n)[:, None]
+            if stop < len(x):
+                n = min(len(y), int(fade_ms * w.sr / 1000)) or 1
+                y[-n:] *= _fade(n)[::-1, None]
+            wav_write(dst, y, w.sr, bits=w.bits if w.bits in (16, 24) else 32)
+        row.update(frames=stop - start, cut=len(x) - (stop - start),
+                   over=(stop - start) * max(1, w.channels) > 2 * PAD_BUF_FRAMES)
+    except (OSError, ValueError) as e:
+        row['error'] = str(e)
+        try:
+            shutil.copy2(src, dst)
+        except OSError as e:
+            row['unwritten'] = str(e)
+            return row
+    try:
+        row['bytes_out'] = os.path.getsize(dst)
+    except OSError as e:
+        row['unwritten'] = str(e)
+    return row
+
+
+# ---------------------------------------------------------------- mirror
+# Kits are made at 48 kHz. A session at 44.1 or 96 kHz plays them through
+# the plugin's rate conversion; a sibling pool@<rate>/ holds the same tree,
+# the same manifest order, already at that rate. A mirror file carries its
+# source's mtime, so a rebuild only touches what changed.
+
+def mirror_one(job):
+    """Worker: (src, dst, rate) -> None, or the error. Never raises."""
+    src, dst, rate = job
+    try:
+        w = Wav(src)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + '.tmp'
+        wav_write(tmp, resample(w.read(), w.sr, rate), rate,
+                  bits=w.bits if w.bits in (16, 24) else 32)
+        st = os.stat(src)
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, dst)
+    except (OSError, ValueError) as e:
+        return str(e)
+
+
+def bounded_map(fn, jobs, workers=None):
+    """fn over jobs on a process pool, at most 2 * workers in flight, so a
+    pool of any size never queues its whole job list at once. -> results
+    in job order."""
+    workers = workers or os.cpu_count() or 1
+    results, pending, it = [None] * len(jobs), {}, iter(enumerate(jobs))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        while True:
+            for i, job in it:
+                pending[ex.submit(fn, job)] = i
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                return results
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                results[pending.pop(f)] = f.result()
+
+
+def mirror_path(pool, rate):
+    return os.path.abspath(pool).rstrip(os.sep) + f'@{rate}'
+
+
+def mirror(pool, rate, workers=None):
+    """Bring pool@rate up to date -> (rebuilt, unchanged, removed, errors)."""
+    out = mirror_path(pool, rate)
+    rels = pool_wavs(pool)
+    todo = []
+    for rel in rels:
+        src, dst = os.path.join(pool, rel), os.path.join(out, rel)
+        try:
+            if os.stat(dst).st_mtime_ns == os.stat(src).st_mtime_ns:
+                continue
+        except OSError:
+            pass
+        todo.append((src, dst, rate))
+    errors = [(job[0], e) for job, e in zip(todo, bounded_map(mirror_one, todo, workers)) if e]
+
+    keep = set(rels)
+    removed = 0
+    for f in sources(out, depth=64) if os.path.isdir(out) else ():
+        if os.path.relpath(f, out).replace(os.sep, '/') not in keep:
+            os.unlink(f)
+            removed += 1
+    os.makedirs(out, exist_ok=True)
+    with open(os.path.join(out, 'manifest.txt'), 'w', newline='\n') as fh:
+        fh.writelines(r + '\n' for r in rels)
+    return len(todo) - len(errors), len(rels) - len(todo), removed, errors
+
+
+# ---------------------------------------------------------------- features
+# File names only go so far: most libraries aren't called kick_01.wav. The
+# index measures every sample once -- peak, RMS, attack, spectral centroid
+# and rolloff, pitch, length -- and keeps the numbers in a structured array
+# with the paths in one string table, so a kit query never opens audio.
+
+FEATURES = '.features.npz'
+FEATURE_DTYPE = np.dtype([
+    ('path_off', '<u4'), ('path_len', '<u2'), ('size', '<i8'), ('mtime_ns', '<i8'),
+    ('sr', '<u4'), ('frames', '<u4'), ('length_s', '<f4'), ('peak_db', '<f4'),
+    ('rms_db', '<f4'), ('attack_ms', '<f4'), ('centroid_hz', '<f4'),
+    ('rolloff_hz', '<f4'), ('pitch_hz', '<f4')])
+
+# Per pad class, the range a typical hit of that class falls in: spectral
+# centroid Hz, length s, attack ms, pitch Hz, each (lo, hi). Pitch (0, 0)
+# means unpitched; lo 0 means either, as for a kick, whose glide the
+# autocorrelation often misses. Written down from how the instruments
+# sound -- a kick's energy sits under a few hundred Hz with a 40-120 Hz
+# fundamental, hats and cymbals above 4 kHz, cymbals ring for seconds, a
+# shaker or clap swells over tens of ms -- not measured from any one kit, so
+# the kits in pool/ stay something to test against. Ranking, not a
+# classifier: the ranges overlap, and the FX pads take what fits nowhere.
+PAD_RANGES = (
+    ((30, 300), (0.15, 2.0), (0.25, 10), (0, 120)),         # Kick
+    ((1000, 6000), (0.1, 0.8), (0.25, 5), (0, 0)),          # Snare
+    ((500, 5000), (0.02, 0.3), (0.25, 2), (250, 1200)),     # Rimshot
+    ((800, 3500), (0.1, 1.0), (2, 40), (0, 0)),             # Clap
+    ((5000, 16000), (0.02, 0.25), (0.25, 3), (0, 0)),       # Closed HH
+    ((4000, 14000), (0.25, 2.0), (0.25, 5), (0, 0)),        # Open HH
+    ((60, 500), (0.3, 2.0), (0.25, 10), (50, 110)),         # Low Tom
+    ((90, 700), (0.2, 1.5), (0.25, 10), (90, 180)),         # Mid Tom
+    ((120, 1000), (0.15, 1.2), (0.25, 10), (150, 350)),     # Hi Tom
+    ((4000, 12000), (1.2, 8.0), (0.25, 10), (0, 0)),        # Crash
+    ((1500, 6000), (1.5, 8.0), (0.25, 5), (0, 0)),          # Ride
+    ((3000, 12000), (0.05, 0.5), (5, 80), (0, 0)),          # Shaker
+    ((200, 3000), (0.03, 0.8), (0.25, 5), (150, 900)),      # Perc 1
+    ((500, 8000), (0.1, 3.0), (0.25, 5), (400, 2000)),      # Perc 2
+    ((20, 20000), (0.01, 30.0), (0.25, 1000), (0, 20000)),  # FX 1
+    ((20, 20000), (0.01, 30.0), (0.25, 1000), (0, 20000)),  # FX 2
+)
+NAME_BONUS = 1.5                # subtracted from the distance when the file name agrees
+
+
+def features(x, sr):
+    """float [n, ch] -> dict of FEATURE_DTYPE's measured fields."""
+    m = x.mean(axis=1)
+    n = len(m)
+    peak = float(np.abs(m).max()) if n else 0.0
+    f = {'sr': sr, 'frames': n, 'length_s': n / sr,
+         'peak_db': 20 * math.log10(max(peak, 1e-10)),
+         'rms_db': 10 * math.log10(max(float(np.mean(m * m)) if n else 0.0, 1e-20)),
+         'attack_ms': 0.0, 'centroid_hz': 0.0, 'rolloff_hz': 0.0, 'pitch_hz': 0.0}
+    if peak <= 0:
+        return f
+
+    # attack: 10% to 90% of the peak envelope, at 0.25 ms resolution
+    blk = max(1, sr // 4000)
+    env = np.pad(np.abs(m), (0, -n % blk)).reshape(-1, blk).max(axis=1)
+    onset = int(np.argmax(env >= 0.1 * env.max()))
+    f['attack_ms'] = (int(np.argmax(env >= 0.9 * env.max())) - onset) * blk * 1000 / sr
+
+    # spectrum of the first half second from the onset
+    seg = m[onset * blk:onset * blk + sr // 2]
+    nfft = 1 << max(8, int(math.ceil(math.log2(len(seg)))))
+    power = np.abs(np.fft.rfft(seg * np.hanning(len(seg)), nfft)) ** 2
+    freqs = np.fft.rfftfreq(nfft, 1.0 / sr)
+    total = power.sum()
+    if total > 0:
+        f['centroid_hz'] = float((freqs * power).sum() / total)
+        f['rolloff_hz'] = float(freqs[np.searchsorted(np.cumsum(power), 0.85 * total)])
+
+    # pitch: autocorrelation peak between 30 Hz and 2 kHz, from the peak on
+    at = int(np.argmax(np.abs(m)))
+    seg = m[at:at + sr // 10]
+    lo, hi = sr // 2000, sr // 30
+    if len(seg) > 2 * hi:
+        r = np.fft.irfft(np.abs(np.fft.rfft(seg, 2 * len(seg))) ** 2)[:hi + 2]
+        neg = np.flatnonzero(r[lo:hi] < 0) if r[0] > 0 else ()
+        if len(neg):
+            # past the first dip, or the slope off lag 0 wins for low notes
+            r = r / r[0]
+            k = lo + neg[0] + int(np.argmax(r[lo + neg[0]:hi]))
+            if r[k] > 0.5:
+                a, b, c = r[k - 1], r[k], r[k + 1]
+                shift = 0.5 * (a - c) / (a - 2 * b + c) if a - 2 * b + c < 0 else 0.0
+                f['pitch_hz'] = sr / (k + shift)
+    return f
+
+
+def feature_one(path):
+    """Worker: path -> feature dict, or the error string. Never raises."""
+    try:
+        w = Wav(path)
+        return features(w.read(), w.sr)
+    except (OSError, ValueError) as e:
+        return str(e)
+
+
+def _load_table(pool, name, dtype):
+    """-> (rows, paths) from a pool sidecar: a structured array plus the
+    UTF-8 string table its path_off/path_len point into."""
+    try:
+        with np.load(os.path.join(pool, name)) as z:
+            rows, blob = z['rows'], z['strings'].tobytes()
+    except (OSError, KeyError, ValueError):
+        return np.zeros(0, dtype), []
+    if rows.dtype != dtype:
+        return np.zeros(0, dtype), []
+    return rows, [blob[o:o + n].decode('utf-8') for o, n in zip(rows['path_off'], rows['path_len'])]
+
+
+def _refresh_table(pool, name, dtype, paths, worker, workers=None):
+    """Bring a sidecar up to date for `paths` (relative to the pool): only
+    files whose size or mtime moved go through `worker` -> (rows, paths, measured)."""
+    old_rows, old_paths = _load_table(pool, name, dtype)
+    old = dict(zip(old_paths, old_rows))
+    stats = [os.stat(os.path.join(pool, p)) for p in paths]
+    todo = [i for i, (p, st) in enumerate(zip(paths, stats))
+            if p not in old or (old[p]['size'], old[p]['mtime_ns']) != (st.st_size, st.st_mtime_ns)]
+    measured = bounded_map(worker, [os.path.join(pool, paths[i]) for i in todo], workers)
+
+    fresh = dict(zip(todo, measured))
+    keep, rows = [], np.zeros(len(paths), dtype)
+    for i, (p, st) in enumerate(zip(paths, stats)):
+        f = fresh.get(i, old.get(p))
+        if isinstance(f, str):
+            print(f'  {p}: {f}', file=sys.stderr)
+            continue
+        if isinstance(f, dict):
+            for k, v in f.items():
+                rows[i][k] = v
+        else:
+            rows[i] = f
+        rows[i]['size'], rows[i]['mtime_ns'] = st.st_size, st.st_mtime_ns
+        keep.append(i)
+    rows, paths = rows[keep], [paths[i] for i in keep]
+    encoded = [p.encode('utf-8') for p in paths]
+    rows['path_len'] = [len(e) for e in encoded]
+    rows['path_off'] = np.concatenate(([0], np.cumsum(rows['path_len'][:-1], dtype=np.int64)))
+    strings = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    tmp = os.path.join(pool, name + '.tmp.npz')
+    np.savez(tmp, rows=rows, strings=strings)
+    os.replace(tmp, os.path.join(pool, name))
+    return rows, paths, len(todo)
+
+
+def load_index(pool):
+    """-> (rows, paths): the structured array and its decoded string table."""
+    return _load_table(pool, FEATURES, FEATURE_DTYPE)
+
+
+def build_index(pool, workers=None):
+    """Measure what is new or changed since the last index -> (rows, paths, measured)."""
+    return _refresh_table(pool, FEATURES, FEATURE_DTYPE, pool_wavs(pool), feature_one, workers)
+
+
+def pad_scores(rows, paths, names=True):
+    """[n samples, 16 pads]: higher fits better. How far, in log units, each
+    feature sits outside the class's range (0 inside), plus NAME_BONUS when
+    the file name agrees, unless names is False."""
+    rng = np.array(PAD_RANGES, dtype=np.float64)                # [16, 4, (lo, hi)]
+    lg = lambda v: np.log2(np.maximum(np.asarray(v, dtype=np.float64), 1e-3))
+
+    def outside(v, k):
+        v = lg(v)[:, None]
+        return (np.maximum(lg(rng[:, k, 0]) - v, 0)
+                + np.maximum(v - lg(rng[:, k, 1]), 0))
+
+    d = (outside(rows['centroid_hz'], 0)
+         + 0.5 * outside(rows['length_s'], 1)
+         + 0.3 * outside(np.maximum(rows['attack_ms'], 0.25), 2))
+    pitched = rows['pitch_hz'][:, None] > 0
+    wants, either = rng[:, 3, 1] > 0, rng[:, 3, 0] == 0
+    d += np.where(wants, np.where(pitched, 0.5 * outside(rows['pitch_hz'], 3),
+                                  np.where(either, 0.0, 1.0)),
+                  np.where(pitched, 0.3, 0.0))
+    if names:
+        names = [os.path.basename(p).lower() for p in paths]
+        for pad, pattern in enumerate(PAD_KEYWORDS):
+            rx = re.compile(pattern)
+            d[:, pad] -= NAME_BONUS * np.fromiter((bool(rx.search(n)) for n in names),
+                                                  bool, len(names))
+    return -d
+
+
+def assign(cost):
+    """cost [r, c], r <= c -> int [r]: the column for each row, no column
+    twice, with the least total cost (Hungarian method, shortest augmenting
+    paths; the inner loops run across all c columns at once)."""
+    r, c = cost.shape
+    u, v = np.zeros(r + 1), np.zeros(c + 1)
+    owner = np.zeros(c + 1, dtype=np.int64)       # row + 1 holding each column, 0 = free
+    way = np.zeros(c + 1, dtype=np.int64)
+    for i in range(1, r + 1):
+        owner[0], j0 = i, 0
+        slack = np.full(c + 1, np.inf)
+        used = np.zeros(c + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = ~used[1:] & (cur < slack[1:])
+            slack[1:][better] = cur[better]
+            way[1:][better] = j0
+            free = np.where(used[1:], np.inf, slack[1:])
+            j1 = int(np.argmin(free)) + 1
+            delta = free[j1 - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            slack[~used] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    out = np.zeros(r, dtype=np.int64)
+    taken = np.flatnonzero(owner[1:])
+    out[owner[1:][taken] - 1] = taken
+    return out
+
+
+def suggest(rows, paths, folder=None, names=True):
+    """[(pad, path, score)]: one sample per pad, no sample twice, with the
+    best total score over the 16 pads. With fewer than 16 samples, each
+    sample takes its pad and the rest stay empty. names=False scores on the
+    sound alone."""
+    if folder:
+        sel = [i for i, p in enumerate(paths) if p.startswith(folder.rstrip('/') + '/')]
+        rows, paths = rows[sel], [paths[i] for i in sel]
+    if not len(rows):
+        return []
+    scores = pad_scores(rows, paths, names)
+    if len(rows) >= 16:
+        picks = enumerate(assign(-scores.T).tolist())
+    else:
+        picks = sorted((pad, i) for i, pad in enumerate(assign(-scores).tolist()))
+    return [(pad, paths[i], float(scores[i, pad])) for pad, i in picks]
+
+
+# ---------------------------------------------------------------- dedup
+# Kit copies and repeated grabs leave the same drum under several names.
+# Each file gets three fingerprints, cached in pool/.fingerprints.npz on the
+# same size/mtime terms as the feature index: a hash of its bytes; a hash
+# of its PCM peak-normalised to 16 bits, so a re-save at another gain or
+# with other chunks still matches; and a coarse signature -- band energies in dB over
+# the first moments after the onset -- that survives a resample or a trim.
+# Byte-identical copies can share one inode: less disk, and a kit that is
+# loaded from two paths is read from the page cache the second time. The
+# manifest keeps every entry, since pool indices and pad order hang off it.
+
+FINGERPRINTS = '.fingerprints.npz'
+SIG_SLICES = 4                  # onset-aligned time slices ...
+SIG_SLICE_S = 0.05              # ... this long
+SIG_BANDS = 8                   # log-spaced bands per slice, 40 Hz - 16 kHz
+SIG_FLOOR_DB = -60.0
+NEAR_DB = 2.0                   # RMS signature difference that counts as the same sound
+FINGERPRINT_DTYPE = np.dtype([
+    ('path_off', '<u4'), ('path_len', '<u2'), ('size', '<i8'), ('mtime_ns', '<i8'),
+    ('file', 'V16'), ('pcm', 'V16'), ('sr', '<u4'), ('frames', '<u4'),
+    ('sig', '<f4', (SIG_SLICES * SIG_BANDS,))])
+
+
+def signature(m, sr):
+    """Mono float -> SIG_SLICES x SIG_BANDS band energies, dB from the loudest."""
+    peak = float(np.abs(m).max()) if len(m) else 0.0
+    if peak <= 0:
+        return np.full(SIG_SLICES * SIG_BANDS, SIG_FLOOR_DB, np.float32)
+    onset = int(np.argmax(np.abs(m) >= 0.1 * peak))
+    n = max(16, int(sr * SIG_SLICE_S))
+    seg = np.pad(m[onset:onset + n * SIG_SLICES], (0, max(0, onset + n * SIG_SLICES - len(m))))
+    nfft = 1 << int(math.ceil(math.log2(n)))
+    power = np.abs(np.fft.rfft(seg.reshape(SIG_SLICES, n) * np.hanning(n), nfft)) ** 2
+    edges = np.searchsorted(np.fft.rfftfreq(nfft, 1.0 / sr),
+                            np.geomspace(40.0, 16000.0, SIG_BANDS + 1))
+    bands = np.stack([power[:, a:b].sum(axis=1) for a, b in zip(edges[:-1], edges[1:])], axis=1)
+    db = 10 * np.log10(bands + 1e-30)
+    return np.maximum(db - db.max(), SIG_FLOOR_DB).astype(np.float32).ravel()
+
+
+def fingerprint_one(path):
+    """Worker: path -> fingerprint dict, or the error string. Never raises."""
+    try:
+        w = Wav(path)
+        x = w.read()
+        peak = float(np.abs(x).max()) if len(x) else 0.0
+        if x.shape[1] > 1 and (x == x[:, :1]).all():
+            x = x[:, :1]        # dual mono is mono
+        q = np.round(x * (32767 / peak) if peak > 0 else x).astype('<i2')
+        h = hashlib.blake2b(digest_size=16)
+        h.update(b'%d %d ' % (w.sr, q.shape[1]))
+        h.update(q.tobytes())
+        return {'file': bytes.fromhex(file_hash(path)), 'pcm': h.digest(),
+                'sr': w.sr, 'frames': len(x), 'sig': signature(x.mean(axis=1), w.sr)}
+    except (OSError, ValueError) as e:
+        return str(e)
+
+
+def near_pairs(sig, limit=NEAR_DB, block=256):
+    """(i, j, dB) with i < j for every pair of signatures within `limit` dB
+    RMS. Sorted by their mean, a pair can only be that close if the means
+    are, so each block is only compared against a window, not the whole set."""
+    sig = np.asarray(sig, dtype=np.float32)
+    if not len(sig):
+        return []
+    order = np.argsort(sig.mean(axis=1), kind='stable')
+    s = sig[order]
+    mean, sq, dims = s.mean(axis=1), (s * s).sum(axis=1), s.shape[1]
+    out = []
+    for i0 in range(0, len(s), block):
+        i1 = min(i0 + block, len(s))
+        j1 = int(np.searchsorted(mean, mean[i1 - 1] + limit, side='right'))
+        d2 = (sq[i0:i1, None] + sq[None, i0:j1] - 2 * s[i0:i1] @ s[i0:j1].T) / dims
+        ii, jj = np.nonzero(np.triu(d2 <= limit * limit, k=1))
+        for a, b in zip(ii + i0, jj + i0):
+            out.append((int(min(order[a], order[b])), int(max(order[a], order[b])),
+                        math.sqrt(max(float(d2[a - i0, b - i0]), 0.0))))
+    return out
+
+
+def dedup_plan(rows, paths, near=True):
+    """Group copies of one sound -> [(action, path, canonical, bytes, dB)].
+
+    action is 'link' (byte-identical: can share the canonical's inode),
+    'same' (identical audio, different level or header) or 'near'
+    (signatures within NEAR_DB: a resample, a trim -- worth a listen).
+    Each group's canonical is its first path inside the pool."""
+    n = len(paths)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        a, b = find(i), find(j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    for key in ('file', 'pcm'):
+        first = {}
+        for i, v in enumerate(rows[key]):
+            union(first.setdefault(bytes(v), i), i)
+    dist = {}
+    if near:
+        for i, j, d in near_pairs(rows['sig']):
+            union(i, j)
+            dist[i, j] = d
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+
+    plan = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda i: (paths[i].startswith('../'), paths[i]))
+        c = members[0]
+        for i in members[1:]:
+            if bytes(rows[i]['file']) == bytes(rows[c]['file']):
+                action = 'link'
+            elif bytes(rows[i]['pcm']) == bytes(rows[c]['pcm']):
+                action = 'same'
+            else:
+                action = 'near'
+            d = dist.get((min(i, c), max(i, c)))
+            if d is None:
+                d = float(np.sqrt(np.mean((rows[i]['sig'] - rows[c]['sig']) ** 2.0)))
+            plan.append((action, paths[i], paths[c], int(rows[i]['size']),
+                         0.0 if action != 'near' else d))
+    return sorted(plan, key=lambda r: (r[2], r[1]))
+
+
+def hardlink(path, canonical):
+    """Replace `path` with a hard link to `canonical` -> False if they were
+    already one file, or the bytes turn out to differ."""
+    a, b = os.stat(path), os.stat(canonical)
+    if a.st_ino == b.st_ino and a.st_dev == b.st_dev:
+        return False
+    if not filecmp.cmp(path, canonical, shallow=False):
+        return False
+    tmp = path + '.link'
+    os.link(canonical, tmp)
+    os.replace(tmp, path)
+    return True
+
+
+# ---------------------------------------------------------------- commands
+
+def cmd_kit(a):
+    files = sources(a.source)
+    if not files:
+        sys.exit(f'no audio files in {a.source}')
+    out = os.path.join(a.pool, a.name)
+    mapping = pad_map(files)
+    for pad, f in mapping:
+        print(f'  {pad + 1:02d} ({PAD_NAMES[pad]}) <- {os.path.basename(f)}')
+    rows = run([(f, os.path.join(out, f'{pad + 1:02d}.wav')) for pad, f in mapping],
+               a.pool, a.jobs)
+    report(rows)
+    print(f'Kit {a.name!r}: {len(mapping)}/16 pads in {out}')
+
+
+def cmd_library(a):
+    name = a.name or os.path.basename(os.path.abspath(a.source))
+    files = sources(a.source, depth=a.depth)
+    if not files:
+        sys.exit(f'no audio files in {a.source}')
+    pairs = []
+    for f in files:
+        rel = os.path.splitext(os.path.relpath(f, a.source))[0] + '.wav'
+        pairs.append((f, os.path.join(a.pool, name, rel)))
+    report(run(pairs, a.pool, a.jobs))
+    print(f'{len(files)} sample(s) -> {os.path.join(a.pool, name)}')
+
+
+def cmd_trim(a):
+    pool, out = os.path.abspath(a.pool), os.path.abspath(a.out)
+    if out == pool or out.startswith(pool + os.sep):
+        sys.exit('--out must be outside the pool: trim never works in place')
+    rels = pool_wavs(pool)
+    if not rels:
+        sys.exit(f'no WAVs in {pool}')
+    jobs = [(os.path.join(pool, r), os.path.join(out, r), a.floor, a.fade_ms) for r in rels]
+    with ProcessPoolExecutor(max_workers=a.jobs or None) as ex:
+        rows = list(ex.map(trim_one, jobs, chunksize=max(1, len(jobs) // 64)))
+    with open(os.path.join(out, 'manifest.txt'), 'w', newline='\n') as fh:
+        fh.writelines(r + '\n' for r in rels)
+
+    kits = {}
+    for rel, r in zip(rels, rows):
+        k = kits.setdefault(rel.rpartition('/')[0] or '(loose)', [0, 0, 0, 0, 0])
+        k[0] += 1
+        k[1] += r.get('cut', 0) > 0
+        k[2] += r['bytes']
+        k[3] += r['bytes_out']
+        k[4] += r.get('over', False)
+        if 'unwritten' in r:
+            print(f'  {rel}: not written, {r["unwritten"]}', file=sys.stderr)
+        elif 'error' in r:
+            print(f'  {rel}: copied as-is, {r["error"]}', file=sys.stderr)
+    print(f'  {"kit":<28} {"files":>5} {"trim":>5} {"before":>10} {"after":>10} {"saved":>7}'
+          f' {"over":>4}')
+    for name, (n, cut, before, after, over) in sorted(kits.items()) + [
+            ('TOTAL', [sum(v[i] for v in kits.values()) for i in range(5)])]:
+        print(f'  {name[:28]:<28} {n:>5} {cut:>5} {before:>10} {after:>10}'
+              f' {100 * (before - after) / max(1, before):>6.1f}% {over:>4}')
+    print(f'-> {out} ("over": still longer than a pad buffer, '
+          f'{PAD_BUF_FRAMES} stereo frames)')
+
+
+def cmd_mirror(a):
+    for rate in a.rates:
+        rebuilt, same, removed, errors = mirror(a.pool, rate, a.jobs)
+        print(f'  {mirror_path(a.pool, rate)}: {rebuilt} resampled, {same} up to date'
+              f'{f", {removed} removed" if removed else ""}')
+        for src, e in errors:
+            print(f'    {src}: {e}', file=sys.stderr)
+
+
+def cmd_index(a):
+    rows, paths, measured = build_index(a.pool, a.jobs)
+    print(f'  {len(paths)} sample(s) indexed, {measured} measured'
+          f' -> {os.path.join(a.pool, FEATURES)}')
+
+
+def cmd_suggest(a):
+    rows, paths = load_index(a.pool)
+    if not paths:
+        sys.exit(f'no index in {a.pool}: run the index command first')
+    picks = suggest(rows, paths, a.folder)
+    if not picks:
+        sys.exit('no samples match')
+    for pad, path, score in picks:
+        print(f'  {pad + 1:02d} ({PAD_NAMES[pad]:<9}) {score:6.2f}  {path}')
+    if a.make:
+        out = os.path.join(a.pool, a.make)
+        os.makedirs(out, exist_ok=True)
+        for pad, path, _ in picks:
+            shutil.copy2(os.path.join(a.pool, path), os.path.join(out, f'{pad + 1:02d}.wav'))
+        print(f'Kit {a.make!r}: {len(picks)} pads in {out}')
+
+
+def cmd_check(a):
+    failed = 0
+    for folder in a.kits:
+        files = [f for f in sources(folder, depth=1) if f.lower().endswith('.wav')][:16]
+        measured = bounded_map(feature_one, files, a.jobs)
+        keep = [i for i, f in enumerate(measured) if isinstance(f, dict)]
+        rows = np.zeros(len(keep), FEATURE_DTYPE)
+        for r, i in zip(rows, keep):
+            for k, v in measured[i].items():
+                r[k] = v
+        names = [os.path.basename(files[i]) for i in keep]
+        wrong = [(pad, name) for pad, name, _ in suggest(rows, names, names=a.names)
+                 if names[pad] != name]
+        failed += bool(wrong) or len(keep) < len(files)
+        print(f'  {folder}: {len(keep) - len(wrong)}/{len(keep)} pads back in place')
+        for i, f in enumerate(measured):
+            if not isinstance(f, dict):
+                print(f'    {os.path.basename(files[i])}: {f}', file=sys.stderr)
+        for pad, name in wrong:
+            print(f'    {pad + 1:02d} ({PAD_NAMES[pad]:<9}) <- {name}, not {names[pad]}')
+    sys.exit(1 if failed else 0)
+
+
+def cmd_dedup(a):
+    pool = os.path.abspath(a.pool)
+    paths = set(pool_wavs(pool))
+    for folder in a.also:
+        root = os.path.abspath(folder)
+        paths.update(os.path.relpath(os.path.join(root, r), pool).replace(os.sep, '/')
+                     for r in pool_wavs(root))
+    rows, paths, measured = _refresh_table(pool, FINGERPRINTS, FINGERPRINT_DTYPE,
+                                           sorted(paths), fingerprint_one, a.jobs)
+    print(f'  {len(paths)} file(s) fingerprinted, {measured} measured'
+          f' -> {os.path.join(pool, FINGERPRINTS)}')
+
+    plan, linked = [], 0
+    for row in dedup_plan(rows, paths, near=not a.exact):
+        if row[0] == 'link' and os.path.samefile(os.path.join(pool, row[1]),
+                                                 os.path.join(pool, row[2])):
+            linked += 1
+        else:
+            plan.append(row)
+    for action, path, canonical, size, db in plan:
+        note = f'{db:4.1f} dB' if action == 'near' else f'{size / 1024:6.0f} KB'
+        print(f'  {action:<4}  {path}  ->  {canonical}  ({note.strip()})')
+    counts = {k: sum(1 for r in plan if r[0] == k) for k in ('link', 'same', 'near')}
+    saved = sum(r[3] for r in plan if r[0] == 'link')
+    print(f'  {counts["link"]} byte-identical ({saved / 1048576:.1f} MB in links), '
+          f'{counts["same"]} same audio, {counts["near"]} near'
+          f'{f", {linked} already linked" if linked else ""}')
+
+    if a.plan:
+        with open(a.plan, 'w', newline='\n') as fh:
+            fh.write('action\tpath\tcanonical\tbytes\tdb\n')
+            fh.writelines(f'{r[0]}\t{r[1]}\t{r[2]}\t{r[3]}\t{r[4]:.2f}\n' for r in plan)
+    if a.apply:
+        done = 0
+        for action, path, canonical, _, _ in plan:
+            if action != 'link':
+                continue
+            try:
+                done += hardlink(os.path.join(pool, path), os.path.join(pool, canonical))
+            except OSError as e:
+                print(f'    {path}: {e}', file=sys.stderr)
+        print(f'  {done} file(s) replaced by hard links')
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--pool', default=POOL, help=f'pool folder (default {POOL})')
+    p.add_argument('--jobs', type=int, help='worker processes (default: all cores)')
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    k = sub.add_parser('kit', help='map a folder onto pads 01-16 by file name')
+    k.add_argument('source')
+    k.add_argument('name', nargs='?', default='custom', help='kit folder (default custom)')
+    k.set_defaults(func=cmd_kit)
+
+    lib = sub.add_parser('library', help='convert a whole tree, one kit per folder')
+    lib.add_argument('source')
+    lib.add_argument('--name', help='folder in the pool (default: the source folder name)')
+    lib.add_argument('--depth', type=int, default=8, help='folder levels to descend')
+    lib.set_defaults(func=cmd_library)
+
+    t = sub.add_parser('trim', help='copy the pool with silence and dead tails cut')
+    t.add_argument('--out', required=True, help='the optimised pool (never the pool itself)')
+    t.add_argument('--floor', type=float, default=TRIM_FLOOR_DB,
+                   help=f'dB below each sample\'s peak that counts as silence '
+                        f'(default {TRIM_FLOOR_DB:g})')
+    t.add_argument('--fade-ms', type=float, default=TRIM_FADE_MS,
+                   help=f'fade-out where a tail is cut (default {TRIM_FADE_MS:g})')
+    t.set_defaults(func=cmd_trim)
+
+    m = sub.add_parser('mirror', help='per-rate copies of the pool: pool@44100/, pool@96000/')
+    m.add_argument('rates', nargs='*', type=int, default=[44100, 96000],
+                   help='sample rates (default 44100 96000)')
+    m.set_defaults(func=cmd_mirror)
+
+    ix = sub.add_parser('index', help='measure the pool into pool/.features.npz')
+    ix.set_defaults(func=cmd_index)
+
+    sg = sub.add_parser('suggest', help='one sample per pad class, from the index')
+    sg.add_argument('--folder', help='only samples under this pool folder')
+    sg.add_argument('--make', metavar='KIT', help='copy the picks into pool/KIT/01..16.wav')
+    sg.set_defaults(func=cmd_suggest)
+
+    ck = sub.add_parser('check', help='suggest kits back onto their own pads (01-16 in file order)')
+    ck.add_argument('kits', nargs='+', metavar='FOLDER', help='kit folders, e.g. pool/Kit1-808')
+    ck.add_argument('--names', action='store_true',
+                    help='let file names count too (default: the sound alone)')
+    ck.set_defaults(func=cmd_check)
+
+    dd = sub.add_parser('dedup', help='find copies of the same sound; hard-link exact ones')
+    dd.add_argument('also', nargs='*', metavar='FOLDER',
+                    help='more folders to check against the pool (e.g. the legacy kits/)')
+    dd.add_argument('--exact', action='store_true', help='skip the near-duplicate search')
+    dd.add_argument('--plan', metavar='FILE', help='write the plan as TSV')
+    dd.add_argument('--apply', action='store_true',
+                    help='replace byte-identical copies with hard links to the first')
+    dd.set_defaults(func=cmd_dedup)
+
+    a = p.parse_args()
+    a.func(a)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""The lms_cab presets as a response library.
+
+lms_cab_table_init writes the preset table into plugin memory on every
+@init, and lms_cab_set / lms_cab_set_mic turn a preset and a mic distance
+into a chain of biquads. Seeing what any of them does meant rendering an
+impulse through an amp. This reads the table out of lms_core.jsfx-inc,
+evaluates every preset x mic x density in one pass, and keeps the complex
+responses (and, optionally, an FIR of each) in a single .npz, so comparing
+cabs afterwards is a lookup.
+
+    python tools/lms_cab.py build -o cabs.npz --fir 4096
+    python tools/lms_cab.py show cabs.npz mesa@0 mesa@100 --tap 8
+    python tools/lms_cab.py show cabs.npz 5@30+8@30 --csv dual.csv
+    python tools/lms_cab.py export cabs.npz sheffield@50 sheffield.wav
+    python tools/lms_measure.py response sheffield.wav
+
+Commands
+    cabs     the table as parsed: presets, ratings, breakup frequency, bands
+    build    every preset x mic x density -> the library
+    show     responses at the RESPONSE_HZ points, side by side
+    export   one combination's FIR as a WAV, for lms_measure.py response
+
+A combination is PRESET[@MIC][+PRESET[@MIC]]: a preset by number or by
+part of its name, a mic distance 0-100 (default 0), and optionally Cab B,
+which the amps average with Cab A. --tap is the amp's output tap; with the
+cabs' ratings it sets the load, and the load sets the amp's 120 Hz shelf
+(ohm_lo) and its output level (ohm_vol, 1 / sqrt of the load over the tap,
+0.5-1.6), the same in every _v2 amp.
+
+What is modelled is the chain at a steady density: preset bands, dust cap,
+air LP, resonance peak, mic shelves. The breakup band is a parallel tanh
+that adds nothing at small signal, so it is left out, as are the 20 Hz and
+0.2 dB hysteresis on the dynamic LP and resonance updates. Every section in
+the chain (high-pass, low-pass, peaks, shelves) has its zeros inside or on
+the unit circle, so its impulse response is already the minimum-phase FIR;
+--fir only truncates it, with a short fade.
+"""
+import argparse, csv, math, os, re, sys, time
+import numpy as np
+
+from lms_measure import RESPONSE_HZ, wav_write
+from lms_filters import (_stack, bq_hishelf, bq_hp, bq_loshelf, bq_lp, bq_peak,
+                         sos_response, sosfilt)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE = os.path.join(ROOT, 'lms_core.jsfx-inc')
+MAX_BANDS = 8                   # CAB_MAX_BANDS
+BT_HP, BT_LP, BT_PK = 1, 2, 3   # CAB_BT_*
+RES_DEFAULT = (100.0, 1.5, 2.0) # lms_cab_init: res base freq, gain, q
+TAPS = (4, 8, 16)               # the amps' output tap slider
+POINTS = 512                    # log-spaced response points, plus RESPONSE_HZ
+WIRE = np.array([1.0, 0.0, 0.0, 1.0, 0.0, 0.0])
+
+
+# ---------------------------------------------------------------- table
+
+def cab_table(path=CORE):
+    """[{id, name, count, breakup, bands float [8, 4], ohms}] from
+    lms_cab_table_init and lms_cab_get_ohms."""
+    with open(path, encoding='utf-8', errors='replace') as fh:
+        src = fh.read()
+    body = src[src.index('function lms_cab_table_init()'):]
+    body = body[:body.index('\n);\n')]
+    ohms_src = src[src.index('function lms_cab_get_ohms('):]
+    ohms_src = ohms_src[:ohms_src.index('\n);\n')]
+    ohms = {int(k): float(v) for k, v in
+            re.findall(r'preset_id\s*==\s*(\d+)\s*\?\s*ohms\s*=\s*([\d.]+)', ohms_src)}
+    fallback = float(re.search(r'ohms\s*=\s*([\d.]+);\s*//\s*fallback', ohms_src).group(1))
+
+    table = []
+    for m in re.finditer(r'// ---- Preset (\d+): (.+?) ----(.*?)(?=// ---- Preset|\Z)', body, re.S):
+        pid, name, text = int(m.group(1)), m.group(2).strip(), m.group(3)
+        head = [float(re.search(rf'p\[{i}\]\s*=\s*([\d.]+);', text).group(1)) for i in (0, 1)]
+        bands = np.zeros(MAX_BANDS * 4)
+        for i, v in re.findall(r'b\[(\d+)\]\s*=\s*(-?[\d.]+)', text):
+            bands[int(i)] = float(v)
+        table.append({'id': pid, 'name': name, 'count': int(head[0]),
+                      'breakup': head[1], 'bands': bands.reshape(MAX_BANDS, 4),
+                      'ohms': ohms.get(pid, fallback)})
+    table.sort(key=lambda c: c['id'])
+    if [c['id'] for c in table] != list(range(len(table))):
+        raise ValueError(f'{path}: cab presets are not numbered 0..{len(table) - 1}')
+    return table
+
+
+# ---------------------------------------------------------------- chain
+
+def _wire(shape=()):
+    return np.broadcast_to(WIRE, tuple(shape) + (6,))
+
+
+def band_sos(btype, freq, p1, p2, sr):
+    """lms_cab_set_band over arrays of bands -> [..., 6]."""
+    btype = np.asarray(btype)[..., None]
+    q = np.where(np.asarray(p1) > 0, p1, 1.0)
+    pq = np.where(np.asarray(p2) > 0, p2, 1.0)
+    return np.where(btype == BT_HP, bq_hp(freq, q, sr),
+                    np.where(btype == BT_LP, bq_lp(freq, q, sr),
+                             np.where(btype == BT_PK, bq_peak(freq, np.asarray(p1) * 2, pq, sr),
+                                      WIRE)))
+
+
+def cab_sos(cab, mic=0.0, density=1.0, amount=1.0, sr=48000):
+    """One preset after lms_cab_set + lms_cab_set_mic, held at `density`
+    (amount is cab_breakup_amt) -> [..., 13, 6], broadcast over mic,
+    density and amount. A preset with no bands is a straight wire, mics and
+    all, as lms_cab_proc returns x untouched."""
+    mic, density, amount = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64)
+                                                 for v in (mic, density, amount)))
+    shape = mic.shape
+    if cab['count'] == 0:
+        return _wire(shape + (MAX_BANDS + 5,))
+    bands = cab['bands'].copy()
+    bands[cab['count']:] = 0
+    eq = band_sos(*bands.T, sr)                       # [8, 6]
+
+    brk = cab['breakup']
+    dust = bq_peak(max(5000.0, min(12000.0, brk * 2.5)), 3.0, 0.6, sr)
+    lp_base = max(8000.0, min(16000.0, brk * 5))
+    lp_f = np.clip(lp_base - (density - 1.0) * lp_base * 0.25 * amount, lp_base * 0.6, lp_base)
+    last = bands[cab['count'] - 1]
+    res_f, _, res_q = last[1:] if last[0] == BT_PK else RES_DEFAULT
+    res_gain = np.clip((density - 1.0) * 2.0 * amount, 0.0, 3.0)
+
+    norm = mic / 100
+    hi_cut, lo_cut = -norm * 6.0, -norm * 3.0
+    hi = np.where((hi_cut < -0.1)[..., None], bq_hishelf(3000, hi_cut, 0.7, sr), WIRE)
+    lo = np.where((lo_cut < -0.1)[..., None], bq_loshelf(200, lo_cut, 0.7, sr), WIRE)
+    return _stack(*(np.broadcast_to(s, shape + (6,)) for s in eq),
+                  np.broadcast_to(dust, shape + (6,)), bq_lp(lp_f, 0.4, sr),
+                  bq_peak(res_f, res_gain * 2, res_q, sr), hi, lo)
+
+
+def load_sos(ohms_a, ohms_b, tap, sr):
+    """The amps' load for Cab A and B ratings on one output tap -> [..., 6]:
+    the ohm_lo shelf with ohm_vol folded into its numerator. 0 ohms is no
+    cab; no cab at all is a wire."""
+    a, b, tap = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64)
+                                      for v in (ohms_a, ohms_b, tap)))
+    both = (a > 0) & (b > 0)                  # lms_cab_compute_load
+    load = np.where(both, a * b / np.where(both, a + b, 1.0), np.where(a > 0, a, b))
+    ratio = np.clip(load / tap, 0.25, 4.0)
+    gain = np.clip((1.0 - ratio) * 3.0, -4.0, 4.0)
+    on = (load > 0) & (np.abs(gain) > 0.2)
+    vol = np.where(load > 0, np.clip(1.0 / np.sqrt(ratio), 0.5, 1.6), 1.0)
+    sos = np.where(on[..., None], bq_loshelf(120, gain, 0.7, sr), WIRE)
+    return sos * np.stack([vol, vol, vol] + [np.ones_like(vol)] * 3, axis=-1)
+
+
+# ---------------------------------------------------------------- library
+
+def grid(sr, points=POINTS):
+    """Log-spaced from 10 Hz to just under Nyquist, with RESPONSE_HZ exactly."""
+    f = np.geomspace(10.0, sr / 2 * 0.999, points)
+    return np.unique(np.concatenate((f, [p for p in RESPONSE_HZ if p < sr / 2])))
+
+
+def build(table, sr, mics, densities, amount=1.0, points=POINTS, fir=0):
+    """-> the library as a dict of arrays: cab complex64 [preset, mic,
+    density, freq], load complex64 [A, B, tap, freq], fir float32 [preset,
+    mic, density, taps] when fir > 0."""
+    mics = np.asarray(mics, dtype=np.float64)
+    densities = np.asarray(densities, dtype=np.float64)
+    freqs = grid(sr, points)
+    shape = (len(table), len(mics), len(densities))
+    cab = np.empty(shape + (len(freqs),), dtype=np.complex64)
+    irs = np.empty(shape + (fir,), dtype=np.float32) if fir else None
+    if fir:
+        imp = np.zeros(fir)
+        imp[0] = 1.0
+        fade = np.ones(fir)
+        k = max(1, fir // 8)
+        fade[-k:] = 0.5 + 0.5 * np.cos(np.pi * np.arange(1, k + 1) / k)
+    for p, c in enumerate(table):
+        sos = cab_sos(c, mics[:, None], densities[None, :], amount, sr)   # [M, D, 13, 6]
+        cab[p] = sos_response(sos, freqs, sr)
+        if fir:
+            irs[p] = sosfilt(sos, imp) * fade
+    ohms = np.array([c['ohms'] for c in table])
+    load = sos_response(load_sos(ohms[:, None, None], ohms[None, :, None],
+                                 np.asarray(TAPS, dtype=np.float64)[None, None, :], sr)[..., None, :],
+                        freqs, sr).astype(np.complex64)
+    lib = {'sr': np.int64(sr), 'freqs': freqs, 'mics': mics, 'densities': densities,
+           'amount': np.float64(amount), 'taps': np.asarray(TAPS), 'ohms': ohms,
+           'names': np.array([c['name'] for c in table]), 'cab': cab, 'load': load}
+    if fir:
+        lib['fir'] = irs
+    return lib
+
+
+def load_library(path):
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+
+def _preset(lib, text):
+    names = [str(n) for n in lib['names']]
+    if text.isdigit():
+        p = int(text)
+        if p < len(names):
+            return p
+        raise ValueError(f'no cab preset {p}: 0-{len(names) - 1}')
+    hits = [i for i, n in enumerate(names) if text.lower() in n.lower()]
+    if len(hits) != 1:
+        found = ', '.join(f'{i} {names[i]}' for i in hits) or 'none'
+        raise ValueError(f'{text!r} matches {len(hits)} presets ({found})')
+    return hits[0]
+
+
+def _nearest(values, v):
+    return int(np.argmin(np.abs(np.asarray(values) - v)))
+
+
+def combination(lib, spec, tap=16, density=1.0):
+    """'6@30+8@50' -> (label, complex response [freq], FIR or None), from
+    the library alone: Cab A, Cab B solo or both averaged, behind the
+    load. Mic and density snap to the nearest stored value."""
+    parts = []
+    for s in spec.split('+'):
+        name, _, mic = s.partition('@')
+        parts.append((_preset(lib, name), float(mic or 0)))
+    if len(parts) > 2:
+        raise ValueError(f'{spec}: at most two cabs (A+B)')
+    (a, mic_a), (b, mic_b) = (parts + [(0, 0.0)])[:2]
+    if tap not in lib['taps']:
+        raise ValueError(f'tap {tap}: one of {", ".join(map(str, lib["taps"]))}')
+    d = _nearest(lib['densities'], density)
+    t = int(np.flatnonzero(lib['taps'] == tap)[0])
+    active = [(p, _nearest(lib['mics'], m)) for p, m in ((a, mic_a), (b, mic_b)) if p > 0]
+    if not active:
+        active = [(0, 0)]
+    h = sum(lib['cab'][p, m, d].astype(np.complex128) for p, m in active) / len(active)
+    h = h * lib['load'][a, b, t]
+    ir = None
+    if 'fir' in lib:
+        ir = sum(lib['fir'][p, m, d].astype(np.float64) for p, m in active) / len(active)
+        ir = sosfilt(load_sos(lib['ohms'][a], lib['ohms'][b], tap, int(lib['sr'])), ir)
+    label = '+'.join(f'{p}@{lib["mics"][m]:g}' for p, m in active)
+    return label, h, ir
+
+
+# ---------------------------------------------------------------- commands
+
+def cmd_cabs(a):
+    for c in cab_table():
+        used = c['bands'][:c['count']]
+        desc = ' '.join({BT_HP: 'hp', BT_LP: 'lp', BT_PK: 'pk'}[int(t)] + f'{f:g}'
+                        for t, f in used[:, :2] if int(t) in (BT_HP, BT_LP, BT_PK))
+        print(f'  {c["id"]:>2} {c["name"]:<44} {c["ohms"]:>4g}R  brk {c["breakup"]:>5g}  {desc}')
+
+
+def cmd_build(a):
+    try:
+        table = cab_table(a.core)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    mics = np.arange(0, 100 + 1e-9, a.mic_step)
+    t0 = time.perf_counter()
+    lib = build(table, a.sr, mics, a.density, a.breakup, a.points, a.fir)
+    took = time.perf_counter() - t0
+    np.savez_compressed(a.out, **lib)
+    n = lib['cab'].shape[0] * lib['cab'].shape[1] * lib['cab'].shape[2]
+    print(f'  {len(table)} presets x {len(mics)} mics x {len(a.density)} densities = {n}'
+          f' responses x {len(lib["freqs"])} points'
+          + (f', {a.fir}-tap FIRs' if a.fir else '')
+          + f' in {took * 1000:.0f} ms -> {a.out} ({os.path.getsize(a.out) / 1e6:.1f} MB)')
+
+
+def cmd_show(a):
+    lib = load_library(a.library)
+    try:
+        rows = [combination(lib, s, a.tap, a.density) for s in a.specs]
+    except ValueError as e:
+        sys.exit(str(e))
+    freqs = lib['freqs']
+    pts = [f for f in RESPONSE_HZ if f < lib['sr'] / 2]
+    at = np.searchsorted(freqs, pts)
+    for label, h, _ in rows:
+        print(f'  {label}: ' + ' / '.join(str(lib['names'][int(p.split('@')[0])])
+                                            for p in label.split('+')))
+    print(f'  {"Hz":>7}' + ''.join(f' {label:>13}' for label, _, _ in rows)
+          + (f' {"B - A":>7}' if len(rows) == 2 else ''))
+    mags = [20 * np.log10(np.maximum(np.abs(h), 1e-12)) for _, h, _ in rows]
+    for i, f in zip(at, pts):
+        line = f'  {f:>7g}' + ''.join(f' {m[i]:+7.2f} {math.degrees(np.angle(h[i])):+5.0f}'
+                                      for m, (_, h, _) in zip(mags, rows))
+        if len(rows) == 2:
+            line += f' {mags[1][i] - mags[0][i]:+7.2f}'
+        print(line)
+    print(f'  dB and phase (degrees), tap {a.tap} ohms, density {a.density:g}')
+    if a.csv:
+        with open(a.csv, 'w', newline='') as fh:
+            w = csv.writer(fh)
+            w.writerow(['hz'] + [f'{label}_{k}' for label, _, _ in rows for k in ('db', 'deg')])
+            cols = [freqs] + [c for m, (_, h, _) in zip(mags, rows)
+                              for c in (m, np.degrees(np.angle(h)))]
+            w.writerows([f'{v:.4f}' for v in r] for r in zip(*cols))
+        print(f'  full curves -> {a.csv}')
+
+
+def cmd_export(a):
+    lib = load_library(a.library)
+    try:
+        label, _, ir = combination(lib, a.spec, a.tap, a.density)
+    except ValueError as e:
+        sys.exit(str(e))
+    if ir is None:
+        sys.exit(f'{a.library} has no FIRs: build it with --fir N')
+    wav_write(a.out, ir[:, None], int(lib['sr']))
+    print(f'  {label}: {len(ir)} taps at {int(lib["sr"])} Hz -> {a.out}')
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    sub.add_parser('cabs', help='the preset table as parsed').set_defaults(func=cmd_cabs)
+
+    b = sub.add_parser('build', help='every preset x mic x density -> a library')
+    b.add_argument('-o', '--out', default='cabs.npz')
+    b.add_argument('--sr', type=int, default=48000)
+    b.add_argument('--mic-step', type=float, default=10.0, help='mic distance step, %%')
+    b.add_argument('--density', type=float, nargs='+', default=[1.0],
+                   help='triode density values to hold (1.0-2.5; 1.0 is at rest)')
+    b.add_argument('--breakup', type=float, default=1.0,
+                   help='cab_breakup_amt, the amps\' Spkr Breakup / 100')
+    b.add_argument('--points', type=int, default=POINTS)
+    b.add_argument('--fir', type=int, default=0, help='also keep an N-tap FIR of each')
+    b.add_argument('--core', default=CORE, help=argparse.SUPPRESS)
+    b.set_defaults(func=cmd_build)
+
+    def lookup(s):
+        s.add_argument('--tap', type=int, default=16, help='amp output tap: 4, 8 or 16')
+        s.add_argument('--density', type=float, default=1.0)
+
+    s = sub.add_parser('show', help='responses side by side')
+    s.add_argument('library')
+    s.add_argument('specs', nargs='+', help='PRESET[@MIC][+PRESET[@MIC]]')
+    s.add_argument('--csv', help='write the full curves here')
+    lookup(s)
+    s.set_defaults(func=cmd_show)
+
+    e = sub.add_parser('export', help='one combination\'s FIR as a WAV')
+    e.add_argument('library')
+    e.add_argument('spec')
+    e.add_argument('out')
+    lookup(e)
+    e.set_defaults(func=cmd_export)
+
+    a = p.parse_args()
+    a.func(a)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""The lms_core linear filters, offline.
+
+lms_bq_*, the tone stacks (lms_tmb_*, lms_svt_eq_*, lms_topboost_*),
+lms_dc_* and lms_tone_* are recursive filters with closed-form
+coefficients, so nothing about them needs REAPER to hear or measure. Each
+one here is built from the same formulas as lms_core.jsfx-inc, as
+second-order sections (b0 b1 b2 1 a1 a2). Every knob can be an array:
+1331 tone-stack settings are one [1331, 3, 6] array, not 1331 plugins.
+
+Filtering runs a block at a time instead of a sample at a time. For a
+block of L samples, the output is the zero-state response (a matmul with
+the L x L Toeplitz matrix of the impulse response) plus what the state
+carried in from the last block contributes. That 2-value state is solved
+for every block at once by recursive doubling, so a section costs three
+matmuls and a dozen small array steps however long the signal is.
+
+    python tools/lms_filters.py render di.wav out.wav tmb:lms_oj95_v2,0.7,0.4,0.6 dc:20
+    python tools/lms_filters.py sweep tmb:lms_oj95_v2 --steps 11 --csv oj95.csv
+    python tools/lms_filters.py amps
+
+Stages
+    hp:F[,Q]  lp:F[,Q]  bp:F[,Q]          lms_bq_set_hp / lp / bp (Q 0.707)
+    peak:F,DB,Q  loshelf:F,DB,Q  hishelf:F,DB,Q
+    dc[:F]                                lms_dc_init_freq (20 Hz)
+    tone:F                                lms_tone_set (bypassed at 19999+)
+    tmb:AMP,BASS,MID,TREBLE               lms_tmb_config from AMP's .jsfx
+    svt:BASS,MID,SEL,TREBLE,ULO,UHI       lms_svt_eq_set
+    topboost:BASS,TREBLE                  lms_topboost_set
+Knobs are 0-1 as the plugins pass them (slider / 100).
+"""
+import argparse, csv, glob, itertools, os, re, sys, time
+import numpy as np
+
+from lms_measure import RESPONSE_HZ, Wav, wav_write
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCK = 64                      # samples per block in sosfilt
+
+
+# ---------------------------------------------------------------- coefficients
+# Each returns [..., 6] (or [..., sections, 6]), broadcast over its arguments.
+
+def _section(b0, b1, b2, a1, a2):
+    b0, b1, b2, a1, a2 = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64)
+                                              for v in (b0, b1, b2, a1, a2)))
+    return np.stack([b0, b1, b2, np.ones_like(b0), a1, a2], axis=-1)
+
+
+def _w0(freq, sr):
+    w0 = 2 * np.pi * np.asarray(freq, dtype=np.float64) / sr
+    return np.cos(w0), np.sin(w0)
+
+
+def bq_hp(freq, q, sr):
+    cs, sn = _w0(freq, sr)
+    alpha = sn / (2 * np.asarray(q))
+    a0 = 1 + alpha
+    return _section((1 + cs) / 2 / a0, -(1 + cs) / a0, (1 + cs) / 2 / a0,
+                    -2 * cs / a0, (1 - alpha) / a0)
+
+
+def bq_lp(freq, q, sr):
+    # @cite rbj-cookbook -- biquad coefficient formulae
+    cs, sn = _w0(freq, sr)
+    alpha = sn / (2 * np.asarray(q))
+    a0 = 1 + alpha
+    return _section((1 - cs) / 2 / a0, (1 - cs) / a0, (1 - cs) / 2 / a0,
+                    -2 * cs / a0, (1 - alpha) / a0)
+
+
+def bq_bp(freq, q, sr):
+    cs, sn = _w0(freq, sr)
+    alpha = sn / (2 * np.asarray(q))
+    a0 = 1 + alpha
+    return _section(sn / 2 / a0, 0.0, -sn / 2 / a0, -2 * cs / a0, (1 - alpha) / a0)
+
+
+def bq_peak(freq, gain_db, q, sr):
+    a = 10 ** (np.asarray(gain_db, dtype=np.float64) / 40)
+    cs, sn = _w0(freq, sr)
+    alpha = sn / (2 * np.asarray(q))
+    a0 = 1 + alpha / a
+    return _section((1 + alpha * a) / a0, -2 * cs / a0, (1 - alpha * a) / a0,
+                    -2 * cs / a0, (1 - alpha / a) / a0)
+
+
+def bq_loshelf(freq, gain_db, q, sr):
+    a = 10 ** (np.asarray(gain_db, dtype=np.float64) / 40)
+    cs, sn = _w0(freq, sr)
+    alpha = sn / (2 * np.asarray(q))
+    ap1, am1, beta = a + 1, a - 1, 2 * np.sqrt(a) * alpha
+    a0 = ap1 + am1 * cs + beta
+    return _section(a * (ap1 - am1 * cs + beta) / a0, 2 * a * (am1 - ap1 * cs) / a0,
+                    a * (ap1 - am1 * cs - beta) / a0, -2 * (am1 + ap1 * cs) / a0,
+                    (ap1 + am1 * cs - beta) / a0)
+
+
+def bq_hishelf(freq, gain_db, q, sr):
+    a = 10 ** (np.asarray(gain_db, dtype=np.float64) / 40)
+    cs, sn = _w0(freq, sr)
+    alpha = sn / (2 * np.asarray(q))
+    ap1, am1, beta = a + 1, a - 1, 2 * np.sqrt(a) * alpha
+    a0 = ap1 - am1 * cs + beta
+    return _section(a * (ap1 + am1 * cs + beta) / a0, -2 * a * (am1 + ap1 * cs) / a0,
+                    a * (ap1 + am1 * cs - beta) / a0, 2 * (am1 - ap1 * cs) / a0,
+                    (ap1 - am1 * cs - beta) / a0)
+
+
+def dc(freq, sr):
+    """lms_dc_*: y = x - x1 + r*y1, r = 1 - 2*pi*f/sr."""
+    r = 1 - 2 * np.pi * np.asarray(freq, dtype=np.float64) / sr
+    return _section(1.0, -1.0, 0.0, -r, 0.0)
+
+
+def tone(freq, sr):
+    """lms_tone_*: one-pole lowpass, a straight wire from 19999 Hz up."""
+    freq = np.asarray(freq, dtype=np.float64)
+    c = np.exp(-2 * np.pi * freq / sr)
+    on = freq < 19999
+    return _section(np.where(on, 1 - c, 1.0), 0.0, 0.0, np.where(on, -c, 0.0), 0.0)
+
+
+def tmb(bass, mid, treble, cfg, sr):
+    """lms_tmb_set under lms_tmb_config(*cfg) -> [..., 3, 6]."""
+    (bass_lo, bass_range, bass_db, bass_q, mid_freq, mid_q_lo, mid_q_range, mid_db,
+     treb_lo, treb_range, treb_db, treb_q, xcouple_bass, xcouple_treb) = cfg
+    bass, mid, treble = (np.asarray(v, dtype=np.float64) for v in (bass, mid, treble))
+    mid_gain = (0.5 - mid) * mid_db
+    mid_gain = mid_gain - ((bass - 0.5) * xcouple_bass + (treble - 0.5) * xcouple_treb)
+    return _stack(bq_loshelf(bass_lo + bass * bass_range, (bass - 0.5) * bass_db, bass_q, sr),
+                  bq_peak(mid_freq, mid_gain * 2, mid_q_lo + mid * mid_q_range, sr),
+                  bq_hishelf(treb_lo + treble * treb_range, (treble - 0.5) * treb_db, treb_q, sr))
+
+
+SVT_MIDS = ((220, 1.2), (450, 1.5), (800, 2.0), (1600, 2.5), (3000, 3.0))
+
+
+def svt_eq(bass, mid, mid_sel, treble, ulo, uhi, sr):
+    """lms_svt_eq_set -> [..., 6, 6]."""
+    bass, mid, treble, ulo, uhi = (np.asarray(v, dtype=np.float64)
+                                   for v in (bass, mid, treble, ulo, uhi))
+    sel = np.asarray(mid_sel, dtype=np.int64)
+    mid_freq = np.take([f for f, _ in SVT_MIDS], sel)
+    mid_q = np.take([q for _, q in SVT_MIDS], sel) + (1.0 - mid) * 0.5
+    return _stack(bq_loshelf(80, (bass - 0.5) * 24, 0.6, sr),
+                  bq_peak(mid_freq, (mid - 0.5) * 30 * 2, mid_q, sr),
+                  bq_hishelf(6000, (treble - 0.5) * 20, 0.707, sr),
+                  bq_loshelf(40, np.where(ulo == 1, 2.0, 0.0), 0.7, sr),
+                  bq_peak(500, np.where(ulo == 1, -20.0, 0.0), 1.5, sr),
+                  bq_hishelf(8000, np.where(uhi == 1, 9.0, 0.0), 0.7, sr))
+
+
+def topboost(bass, treble, sr):
+    """lms_topboost_set -> [..., 3, 6]: bass shelf, fixed 1 kHz presence, treble shelf."""
+    bass, treble = (np.asarray(v, dtype=np.float64) for v in (bass, treble))
+    return _stack(bq_loshelf(120, (bass - 0.5) * -16, 0.6, sr),
+                  bq_peak(1000, 4.0, 0.8, sr),
+                  bq_hishelf(3000, (treble - 0.5) * 14, 0.7, sr))
+
+
+def _stack(*sections):
+    """Sections, broadcast against each other -> [..., n, 6], in processing order."""
+    return np.stack(np.broadcast_arrays(*sections), axis=-2)
+
+
+def tmb_configs(root=ROOT):
+    """{plugin: the 14 lms_tmb_config arguments}, read from the .jsfx files."""
+    rx = re.compile(r'lms_tmb_config\(([^)]*)\)')
+    out = {}
+    for path in sorted(glob.glob(os.path.join(root, '*.jsfx'))):
+        with open(path, encoding='utf-8', errors='replace') as fh:
+            for line in fh:
+                m = rx.search(line.split('//', 1)[0])
+                if m:
+                    out[os.path.splitext(os.path.basename(path))[0]] = \
+                        tuple(float(v) for v in m.group(1).split(','))
+                    break
+    return out
+
+
+# ---------------------------------------------------------------- filtering
+
+def _block_matrices(c, L):
+    """For sections c [..., 6]: the L x L zero-state matrix T, the state
+    readout O [..., L, 2], the state update G [..., 2, L] and A^L [..., 2, 2],
+    in transposed direct form II (y = b0 x + s1)."""
+    b0, b1, b2, _, a1, a2 = np.moveaxis(c, -1, 0)
+    shape = b0.shape
+
+    def run(x0, s):
+        """L steps of the recursion with input x0 at n = 0 only."""
+        s1, s2 = s
+        ys, states = [], []
+        for n in range(L):
+            x = x0 if n == 0 else 0.0
+            y = b0 * x + s1
+            s1, s2 = b1 * x - a1 * y + s2, b2 * x - a2 * y
+            ys.append(y)
+            states.append((s1, s2))
+        return np.stack(ys, axis=-1), states
+
+    zero = np.zeros(shape)
+    h, unit = run(np.ones(shape), (zero, zero))
+    k = np.arange(L)
+    lag = k[:, None] - k[None, :]
+    T = np.where(lag >= 0, np.take(h, np.maximum(lag, 0), axis=-1), 0.0)
+    o1, s1 = run(zero, (np.ones(shape), zero))
+    o2, s2 = run(zero, (zero, np.ones(shape)))
+    O = np.stack([o1, o2], axis=-1)
+    AL = np.stack([np.stack(s1[-1], axis=-1), np.stack(s2[-1], axis=-1)], axis=-1)
+    # an input at n leaves the state the impulse's own state has after L-1-n steps
+    G = np.stack([np.stack(unit[L - 1 - n], axis=-1) for n in range(L)], axis=-1)
+    return T, O, G, AL
+
+
+def _scan(AL, U):
+    """State at the start of every block, S[k] = sum over j < k of
+    AL^(k-1-j) U[j], by recursive doubling: log2(blocks) array steps in
+    place of a loop over blocks."""
+    acc = U.copy()
+    P, d, nb = AL, 1, U.shape[-2]
+    while d < nb:
+        acc[..., d:, :] += np.matmul(acc[..., :-d, :], np.swapaxes(P, -1, -2))
+        P = np.matmul(P, P)
+        d *= 2
+    S = np.zeros_like(U)
+    S[..., 1:, :] = acc[..., :-1, :]
+    return S
+
+
+def sosfilt(sos, x, block=BLOCK):
+    """Filter x [..., n] through sos [..., sections, 6], from zero state.
+    Leading dimensions broadcast: one signal through many settings, or
+    many signals through one."""
+    sos = np.asarray(sos, dtype=np.float64)
+    if sos.ndim == 1:
+        sos = sos[None]
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    lead = np.broadcast_shapes(x.shape[:-1], sos.shape[:-2])
+    y = np.broadcast_to(x, lead + (n,))
+    nb = -(-n // block)
+    for i in range(sos.shape[-2]):
+        T, O, G, AL = _block_matrices(np.broadcast_to(sos[..., i, :], lead + (6,)), block)
+        X = np.zeros(lead + (nb * block,))
+        X[..., :n] = y
+        X = X.reshape(lead + (nb, block))
+        Y = np.matmul(X, np.swapaxes(T, -1, -2))
+        S = _scan(AL, np.matmul(X, np.swapaxes(G, -1, -2)))
+        Y += np.matmul(S, np.swapaxes(O, -1, -2))
+        y = Y.reshape(lead + (nb * block,))[..., :n]
+    return y
+
+
+def sos_response(sos, freqs, sr):
+    """Complex response of sos [..., sections, 6] at `freqs` -> [..., len(freqs)]."""
+    sos = np.asarray(sos, dtype=np.float64)
+    z = np.exp(-1j * 2 * np.pi * np.asarray(freqs, dtype=np.float64) / sr)
+    s = sos[..., None, :]
+    num = s[..., 0] + s[..., 1] * z + s[..., 2] * z * z
+    den = s[..., 3] + s[..., 4] * z + s[..., 5] * z * z
+    return np.prod(num / den, axis=-2)
+
+
+# ---------------------------------------------------------------- stages
+
+def stage(spec, sr, amps=None):
+    """'tmb:lms_oj95_v2,0.7,0.4,0.6' -> [sections, 6]."""
+    name, _, args = spec.partition(':')
+    args = [a for a in args.split(',') if a]
+    num = lambda: [float(a) for a in args]
+    try:
+        if name in ('hp', 'lp', 'bp'):
+            f, q = (num() + [0.707])[:2]
+            return {'hp': bq_hp, 'lp': bq_lp, 'bp': bq_bp}[name](f, q, sr)[None]
+        if name in ('peak', 'loshelf', 'hishelf'):
+            f, g, q = num()
+            return {'peak': bq_peak, 'loshelf': bq_loshelf,
+                    'hishelf': bq_hishelf}[name](f, g, q, sr)[None]
+        if name == 'dc':
+            return dc((num() or [20.0])[0], sr)[None]
+        if name == 'tone':
+            return tone(num()[0], sr)[None]
+        if name == 'tmb':
+            amps = tmb_configs() if amps is None else amps
+            if args[0] not in amps:
+                raise ValueError(f'no lms_tmb_config in {args[0]}.jsfx; try: {" ".join(amps)}')
+            b, m, t = (float(a) for a in args[1:4])
+            return tmb(b, m, t, amps[args[0]], sr)
+        if name == 'svt':
+            b, m, sel, t, lo, hi = num()
+            return svt_eq(b, m, int(sel), t, lo, hi, sr)
+        if name == 'topboost':
+            b, t = num()
+            return topboost(b, t, sr)
+    except (IndexError, ValueError, KeyError) as e:
+        raise ValueError(f'{spec}: {e}') from None
+    raise ValueError(f'{spec}: unknown stage {name!r}')
+
+
+def sweep(kind, steps, sr, amps=None):
+    """Every combination of a tone stack's knobs -> (knob names, settings
+    [n, k], sos [n, sections, 6])."""
+    v = np.linspace(0.0, 1.0, steps)
+    if kind.startswith('tmb:'):
+        amps = tmb_configs() if amps is None else amps
+        cfg = amps[kind[4:]]
+        names, grid = ('bass', 'mid', 'treble'), list(itertools.product(v, v, v))
+        g = np.array(grid)
+        return names, g, tmb(g[:, 0], g[:, 1], g[:, 2], cfg, sr)
+    if kind == 'svt':
+        names = ('bass', 'mid', 'mid_sel', 'treble', 'ulo', 'uhi')
+        g = np.array(list(itertools.product(v, v, range(len(SVT_MIDS)), v, (0, 1), (0, 1))))
+        return names, g, svt_eq(*g.T, sr)
+    if kind == 'topboost':
+        g = np.array(list(itertools.product(v, v)))
+        return ('bass', 'treble'), g, topboost(g[:, 0], g[:, 1], sr)
+    if kind == 'tone':
+        f = np.geomspace(200.0, 20000.0, steps)
+        return ('freq',), f[:, None], tone(f, sr)[:, None]
+    raise ValueError(f'cannot sweep {kind!r}: tmb:AMP, svt, topboost or tone')
+
+
+# ---------------------------------------------------------------- commands
+
+def cmd_render(a):
+    w = Wav(a.src)
+    try:
+        sos = np.concatenate([stage(s, w.sr) for s in a.stages], axis=0)
+    except ValueError as e:
+        sys.exit(str(e))
+    x = w.read().T
+    t0 = time.perf_counter()
+    y = sosfilt(sos, x, a.block)
+    took = time.perf_counter() - t0
+    wav_write(a.out, y.T, w.sr, bits=a.bits)
+    print(f'  {len(sos)} section(s), {x.shape[0]} ch, {x.shape[1] / w.sr:.2f} s'
+          f' in {took * 1000:.0f} ms ({x.shape[1] / w.sr / max(took, 1e-9):.0f}x real time)'
+          f' -> {a.out}')
+
+
+def cmd_sweep(a):
+    try:
+        names, grid, sos = sweep(a.stage, a.steps, a.sr)
+    except (KeyError, ValueError) as e:
+        sys.exit(str(e))
+    pts = [f for f in RESPONSE_HZ if f < a.sr / 2]
+    t0 = time.perf_counter()
+    db = 20 * np.log10(np.maximum(np.abs(sos_response(sos, pts, a.sr)), 1e-12))
+    took = time.perf_counter() - t0
+    fh = open(a.csv, 'w', newline='') if a.csv else sys.stdout
+    try:
+        out = csv.writer(fh)
+        out.writerow(list(names) + [f'{f:g}' for f in pts])
+        for g, row in zip(grid, db):
+            out.writerow([f'{v:g}' for v in g] + [f'{v:.2f}' for v in row])
+    finally:
+        if a.csv:
+            fh.close()
+    print(f'  {len(grid)} settings x {len(pts)} points in {took * 1000:.0f} ms'
+          f'{f" -> {a.csv}" if a.csv else ""}', file=sys.stderr)
+
+
+def cmd_amps(a):
+    for name, cfg in tmb_configs().items():
+        print(f'  {name:<24} ' + ' '.join(f'{v:g}' for v in cfg))
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    r = sub.add_parser('render', help='run a WAV through a chain of stages')
+    r.add_argument('src')
+    r.add_argument('out')
+    r.add_argument('stages', nargs='+', metavar='STAGE')
+    r.add_argument('--block', type=int, default=BLOCK, help=f'samples per block (default {BLOCK})')
+    r.add_argument('--bits', type=int, choices=(16, 24, 32), default=32)
+    r.set_defaults(func=cmd_render)
+
+    s = sub.add_parser('sweep', help='response of every knob setting of a tone stack, as CSV')
+    s.add_argument('stage', help='tmb:AMP, svt, topboost or tone')
+    s.add_argument('--steps', type=int, default=11, help='values per knob (default 11)')
+    s.add_argument('--sr', type=int, default=48000)
+    s.add_argument('--csv', help='write here instead of stdout')
+    s.set_defaults(func=cmd_sweep)
+
+    m = sub.add_parser('amps', help='the tone-stack configs found in the .jsfx files')
+    m.set_defaults(func=cmd_amps)
+
+    a = p.parse_args()
+    a.func(a)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,81 +17,222 @@ At 1000 Hz into 48 kHz, alias products stack neatly on top of real harmonics
 and the distortion measurement flatters itself.
 
 Commands
-    gen       write test signals to feed REAPER
-    null      A vs B, inverted and summed: what is left is what changed
-    response  magnitude response from a rendered impulse
-    decay     RT60 by Schroeder backward integration
-    thd       harmonic distortion AND aliasing, reported separately
+    gen            write test signals to feed REAPER
+    null           A vs B, inverted and summed: what is left is what changed
+    response       magnitude response from a rendered impulse
+    decay          RT60 by Schroeder backward integration
+    thd            harmonic distortion AND aliasing, reported separately
+    deconvolve     a rendered sweep split into linear + harmonic IRs
+    analyze-suite  every measurement on one render of gen --suite
+    batch          any of the above over many files, on every core, as a table
+    baseline       keep a batch's results under a name
+    compare        a new batch against a baseline, regressions only
+    cache          size of the on-disk result cache, or clear it
 """
-import argparse, math, os, struct, sys, wave
+import argparse, copy, csv, fnmatch, functools, glob, hashlib, inspect, json, math, os
+import pickle, sqlite3, struct, sys, tempfile, time, wave
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
 
 # ---------------------------------------------------------------- WAV I/O
 # REAPER renders 32-bit float by default and Python's `wave` module refuses
 # float formats, so the header gets parsed by hand.
+#
+# Only the chunk headers are read. The data chunk is memory-mapped and turned
+# into float64 one block at a time, so a 20-minute render costs one block of
+# RAM instead of the file three times over (raw bytes, sliced chunk, floats).
+
+BLOCK = 1 << 16                 # frames per block when streaming a file
+
+_PCM = {(3, 32): ('<f4', 1.0), (3, 64): ('<f8', 1.0),
+        (1, 16): ('<i2', 1 / 32768.0), (1, 32): ('<i4', 1 / 2147483648.0),
+        (1, 24): (np.uint8, 1 / 8388608.0)}
+
+
+class Wav:
+    """A WAV file's data chunk, mapped but not read.
+
+    `len(w)` is frames, `w.sr` the sample rate, `w.channels` the width.
+    `w.read(start, stop)` converts just that span to float64 [n, channels];
+    `w.blocks()` walks the file a block at a time. `w.cues` holds any cue
+    markers as (frame, length, label), length 0 for a plain marker.
+    """
+
+    def __init__(self, path):
+        self.path, self.start = path, 0
+        size = os.path.getsize(path)
+        fmt = data = None
+        cue, adtl = b'', b''
+        with open(path, 'rb') as fh:
+            head = fh.read(12)
+            if head[:4] != b'RIFF' or head[8:12] != b'WAVE':
+                raise ValueError(f'{path}: not a RIFF/WAVE file')
+            pos = 12
+            while pos + 8 <= size:
+                fh.seek(pos)
+                cid, csz = struct.unpack('<4sI', fh.read(8))
+                csz = min(csz, size - pos - 8)   # streamed renders lie here
+                if cid == b'fmt ':
+                    fmt = fh.read(csz)
+                elif cid == b'data':
+                    data = (pos + 8, csz)
+                elif cid == b'cue ':
+                    cue = fh.read(csz)
+                elif cid == b'LIST':
+                    body = fh.read(csz)
+                    if body[:4] == b'adtl':
+                        adtl = body[4:]
+                pos += 8 + csz + (csz & 1)      # chunks are word-aligned
+
+        if fmt is None or data is None:
+            raise ValueError(f'{path}: missing fmt or data chunk')
+
+        tag, ch, sr, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+        if tag == 0xFFFE and len(fmt) >= 40:     # WAVE_FORMAT_EXTENSIBLE
+            tag = struct.unpack('<H', fmt[24:26])[0]
+        if (tag, bits) not in _PCM:
+            raise ValueError(f'{path}: unsupported format tag {tag}, {bits}-bit')
+
+        dtype, self._scale = _PCM[tag, bits]
+        self.sr, self.channels, self.bits = sr, ch, bits
+        self.offset = data[0]
+        frames = data[1] // (ch * bits // 8)
+        shape = (frames, ch, 3) if bits == 24 else (frames, ch)
+        self._map = (np.memmap(path, dtype=dtype, mode='r', offset=data[0], shape=shape)
+                     if frames else np.zeros(shape, dtype=dtype))
+        self.cues = _parse_cues(cue, adtl)
+
+    @classmethod
+    def from_array(cls, x, sr):
+        """An in-memory signal that measure_* can take like a file."""
+        w = cls.__new__(cls)
+        x = np.asarray(x, dtype=np.float64)
+        w._map = x.reshape(len(x), -1)
+        w.path, w.sr, w.channels, w.bits = None, sr, w._map.shape[1], 64
+        w._scale, w.offset, w.start, w.cues = 1.0, 0, 0, []
+        return w
+
+    def segment(self, start, stop):
+        """Frames [start, stop) as a Wav of their own: same mapping, no copy."""
+        w = copy.copy(self)
+        w._map = self._map[max(0, start):max(0, stop)]
+        w.start, w.cues = self.start + max(0, start), []
+        return w
+
+    def __len__(self):
+        return len(self._map)
+
+    def read(self, start=0, stop=None):
+        """Frames [start, stop) as float64 [n, channels]."""
+        raw = self._map[max(0, start):stop]
+        if self.bits == 24:
+            b = raw.astype(np.int32)
+            v = b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)
+            raw = (v << 8) >> 8                  # sign-extend from bit 23
+        return raw.astype(np.float64) * self._scale
+
+    def span(self, start, stop):
+        """Like read, but exactly stop - start frames: zeros outside the file."""
+        x = self.read(max(0, start), max(0, min(stop, len(self))))
+        lead = min(max(0, -start), stop - start)
+        return np.pad(x, ((lead, stop - start - lead - len(x)), (0, 0)))
+
+    def blocks(self, size=BLOCK, start=0, stop=None):
+        """-> (first frame, float64 [n, channels]) for each block in the span."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(max(0, start), stop, size):
+            yield i, self.read(i, min(i + size, stop))
+
+
+def _parse_cues(cue, adtl):
+    """'cue ' and LIST/adtl chunk bodies -> [(frame, length, label)] by frame."""
+    if len(cue) < 4:
+        return []
+    count = struct.unpack('<I', cue[:4])[0]
+    pts = {}
+    for i in range(min(count, (len(cue) - 4) // 24)):
+        cid, _, _, _, _, off = struct.unpack('<II4sIII', cue[4 + 24 * i:28 + 24 * i])
+        pts[cid] = [off, 0, '']
+    pos = 0
+    while pos + 8 <= len(adtl):
+        sid, ssz = struct.unpack('<4sI', adtl[pos:pos + 8])
+        body = adtl[pos + 8:pos + 8 + ssz]
+        cid = struct.unpack('<I', body[:4])[0] if len(body) >= 4 else None
+        if cid in pts and sid in (b'labl', b'note'):
+            pts[cid][2] = body[4:].split(b'\0')[0].decode('utf-8', 'replace')
+        elif cid in pts and sid == b'ltxt' and len(body) >= 8:
+            pts[cid][1] = struct.unpack('<I', body[4:8])[0]
+        pos += 8 + ssz + (ssz & 1)
+    return sorted(tuple(v) for v in pts.values())
+
 
 def wav_read(path):
-    """-> (samples float64 [n, channels], samplerate)"""
-    with open(path, 'rb') as fh:
-        raw = fh.read()
-    if raw[:4] != b'RIFF' or raw[8:12] != b'WAVE':
-        raise ValueError(f'{path}: not a RIFF/WAVE file')
-
-    pos, fmt, data = 12, None, None
-    while pos + 8 <= len(raw):
-        cid = raw[pos:pos + 4]
-        csz = struct.unpack('<I', raw[pos + 4:pos + 8])[0]
-        body = raw[pos + 8:pos + 8 + csz]
-        if cid == b'fmt ':
-            fmt = body
-        elif cid == b'data':
-            data = body
-        pos += 8 + csz + (csz & 1)          # chunks are word-aligned
-
-    if fmt is None or data is None:
-        raise ValueError(f'{path}: missing fmt or data chunk')
-
-    tag, ch, sr, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
-    if tag == 0xFFFE and len(fmt) >= 40:     # WAVE_FORMAT_EXTENSIBLE
-        tag = struct.unpack('<H', fmt[24:26])[0]
-
-    if tag == 3 and bits == 32:
-        x = np.frombuffer(data, dtype='<f4').astype(np.float64)
-    elif tag == 3 and bits == 64:
-        x = np.frombuffer(data, dtype='<f8')
-    elif tag == 1 and bits == 16:
-        x = np.frombuffer(data, dtype='<i2').astype(np.float64) / 32768.0
-    elif tag == 1 and bits == 32:
-        x = np.frombuffer(data, dtype='<i4').astype(np.float64) / 2147483648.0
-    elif tag == 1 and bits == 24:
-        b = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
-        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
-        v = np.where(v & 0x800000, v - 0x1000000, v)
-        x = v.astype(np.float64) / 8388608.0
-    else:
-        raise ValueError(f'{path}: unsupported format tag {tag}, {bits}-bit')
+    """-> (samples float64 [n, channels], samplerate), the whole file at once.
+
+    For anything that might be long, use Wav and walk it in blocks instead.
+    """
+    w = Wav(path)
+    return w.read(), w.sr
+
 
-    return x.reshape(-1, ch) if ch > 1 else x.reshape(-1, 1), sr
+def _chunk(cid, body):
+    return cid + struct.pack('<I', len(body)) + body + b'\0' * (len(body) & 1)
 
 
-def wav_write(path, x, sr):
+def wav_write(path, x, sr, cues=(), bits=32):
+    """32-bit float WAV, or 16/24-bit PCM (rounded, clipped) with `bits`.
+    cues: (frame, length, label) -- a region if length is non-zero, which is
+    how REAPER shows them on import."""
     x = np.asarray(x, dtype=np.float64)
     if x.ndim == 1:
         x = x.reshape(-1, 1)
     n, ch = x.shape
-    payload = x.astype('<f4').tobytes()
-    fmt = struct.pack('<HHIIHH', 3, ch, sr, sr * ch * 4, ch * 4, 32)
+    if bits == 32:
+        tag, payload = 3, x.astype('<f4').tobytes()
+    elif bits in (16, 24):
+        top = (1 << (bits - 1)) - 1
+        pcm = np.clip(np.round(x * (top + 1)), -top - 1, top).astype('<i4')
+        payload = (pcm.astype('<i2').tobytes() if bits == 16 else
+                   pcm.view(np.uint8).reshape(n, ch, 4)[..., :3].tobytes())
+        tag = 1
+    else:
+        raise ValueError(f'cannot write {bits}-bit WAV')
+    fmt = struct.pack('<HHIIHH', tag, ch, sr, sr * ch * bits // 8, ch * bits // 8, bits)
+    extra = b''
+    if cues:
+        pts = b''.join(struct.pack('<II4sIII', i, f, b'data', 0, 0, f)
+                       for i, (f, _, _) in enumerate(cues, 1))
+        adtl = b''
+        for i, (f, length, label) in enumerate(cues, 1):
+            adtl += _chunk(b'labl', struct.pack('<I', i) + label.encode() + b'\0')
+            if length:
+                adtl += _chunk(b'ltxt', struct.pack('<II4sHHHH', i, length, b'rgn ', 0, 0, 0, 0))
+        extra = _chunk(b'cue ', struct.pack('<I', len(cues)) + pts) + _chunk(b'LIST', b'adtl' + adtl)
+    pad = b'\0' * (len(payload) & 1)           # odd 24-bit mono: word-align
     with open(path, 'wb') as fh:
-        fh.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(payload)) + b'WAVE')
+        fh.write(b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(payload) + len(pad)
+                                       + len(extra)) + b'WAVE')
         fh.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
-        fh.write(b'data' + struct.pack('<I', len(payload)) + payload)
+        fh.write(b'data' + struct.pack('<I', len(payload)) + payload + pad)
+        fh.write(extra)
 
 
 def mono(x):
     return x.mean(axis=1) if x.ndim > 1 and x.shape[1] > 1 else x.reshape(-1)
 
 
+def peak_frame(w, start=0, stop=None):
+    """Frame of the loudest sample in the mono mix, found a block at a time."""
+    best, at = -1.0, start
+    for i, blk in w.blocks(start=start, stop=stop):
+        m = np.abs(mono(blk))
+        j = int(np.argmax(m))
+        if m[j] > best:
+            best, at = float(m[j]), i + j
+    return at
+
+
 def db(v, floor=-200.0):
     v = np.asarray(v, dtype=np.float64)
     with np.errstate(divide='ignore'):
@@ -99,77 +240,329 @@ def db(v, floor=-200.0):
     return np.maximum(out, floor)
 
 
+# ---------------------------------------------------------------- cache
+# Re-measuring an unchanged render redoes the same big FFTs. Results are
+# kept on disk under a hash of the audio itself -- not the path -- plus the
+# measurement and its parameters, so a file copied, renamed or re-rendered
+# bit-identically is still a hit, and any change to a sample is a miss.
+# The least recently used entries go once the cache passes its size limit.
+
+CACHE = None                # the Cache in use, or None: set up by main()
+CACHE_VERSION = 2           # bump when a measurement's output changes
+
+
+class Cache:
+    """A directory of pickled results, one file per key, LRU by mtime."""
+
+    def __init__(self, root, limit_mb=512):
+        self.root, self.limit = root, int(limit_mb * 1024 * 1024)
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.pkl')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as fh:
+                value = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        try:
+            os.utime(self._path(key))                   # most recently used
+        except OSError:
+            pass                                        # another worker evicted it
+        return value
+
+    def put(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump(value, fh, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))            # whole or not at all
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def entries(self):
+        """-> [(mtime, size, path)], oldest first."""
+        out = []
+        for e in os.scandir(self.root):
+            if e.name.endswith('.pkl'):
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue                            # another worker evicted it
+                out.append((st.st_mtime, st.st_size, e.path))
+        return sorted(out)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(sz for _, sz, _ in entries)
+        for _, sz, path in entries:
+            if total <= self.limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= sz
+
+    def digest(self, w):
+        """Hash of the audio a Wav covers: its format and its data bytes.
+
+        Hashing is cheap next to an FFT but not free on a long render, so the
+        digest is itself cached against the file's size and mtime.
+        """
+        if w.path is None:                              # Wav.from_array
+            return hashlib.blake2b(np.ascontiguousarray(w._map).tobytes()).hexdigest()
+        st = os.stat(w.path)
+        stat_key = _key('stat', os.path.abspath(w.path), st.st_size, st.st_mtime_ns,
+                        w.start, len(w))
+        d = self.get(stat_key)
+        if d is None:
+            h = hashlib.blake2b(f'{w.sr}/{w.channels}/{w.bits}'.encode())
+            for i in range(0, len(w), BLOCK):
+                h.update(np.ascontiguousarray(w._map[i:i + BLOCK]).tobytes())
+            d = h.hexdigest()
+            self.put(stat_key, d)
+        return d
+
+
+def _key(*parts):
+    return hashlib.blake2b(repr((CACHE_VERSION,) + parts).encode(), digest_size=20).hexdigest()
+
+
+def _set_cache(root, limit_mb):
+    """Process-pool initializer, so workers share the parent's cache."""
+    global CACHE
+    CACHE = Cache(root, limit_mb) if root else None
+
+
+def cached(fn):
+    """Memoise a measurement on disk. Arguments named src, a or b are audio
+    (a path or a Wav) and are keyed by digest; the rest by value."""
+    sig = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kw):
+        if CACHE is None:
+            return fn(*args, **kw)
+        ba = sig.bind(*args, **kw)
+        ba.apply_defaults()
+        parts = [fn.__name__]
+        for name, v in ba.arguments.items():
+            if name in ('src', 'a', 'b'):
+                v = ba.arguments[name] = _wav(v)
+                parts.append(CACHE.digest(v))
+            else:
+                parts.append((name, v))
+        key = _key(*parts)
+        hit = CACHE.get(key)
+        if hit is not None:
+            return hit
+        value = fn(*ba.args, **ba.kwargs)
+        CACHE.put(key, value)
+        return value
+    return wrapper
+
+
+def _wav(src):
+    return src if isinstance(src, Wav) else Wav(src)
+
+
 # ---------------------------------------------------------------- generate
 
-def cmd_gen(a):
-    sr, secs = a.rate, a.seconds
+def sweep(sr, secs, level=-6.0):
+    """The gen --sweep signal -> (x, L), L = secs / ln(f2/f1) in seconds.
+
+    Exponential sweep: constant energy per octave, and the harmonic
+    distortion products separate cleanly in the deconvolved response --
+    harmonic k arrives L*ln(k) seconds ahead of the linear response.
+    """
     n = int(sr * secs)
     t = np.arange(n) / sr
-    amp = 10 ** (a.level / 20.0)
+    f1, f2 = 20.0, min(20000.0, sr * 0.45)
+    k = math.log(f2 / f1)
+    x = 10 ** (level / 20.0) * np.sin(2 * np.pi * f1 * secs / k * (np.exp(t / secs * k) - 1))
+    x *= np.minimum(1, np.minimum(t / 0.02, (secs - t) / 0.05))   # de-click
+    return x, secs / k
+
+
+def impulse(sr, secs, level=-6.0):
+    x = np.zeros(int(sr * secs))
+    x[int(sr * 0.1)] = 10 ** (level / 20.0)    # 100 ms in, so the tail has room
+    return x
+
+
+def tone(sr, secs, f0=997.0, level=-6.0):
+    t = np.arange(int(sr * secs)) / sr
+    x = 10 ** (level / 20.0) * np.sin(2 * np.pi * f0 * t)
+    return x * np.minimum(1, np.minimum(t / 0.02, (secs - t) / 0.02))
+
 
-    if a.impulse:
-        x = np.zeros(n)
-        x[int(sr * 0.1)] = amp            # 100 ms in, so the tail has room
+def cmd_gen(a):
+    sr, secs = a.rate, a.seconds
+    cues = ()
+
+    if a.suite:
+        x, cues = suite(sr, a.gap)
+        secs = len(x) / sr
+        name = 'test_suite'
+    elif a.impulse:
+        x = impulse(sr, secs, a.level)
         name = f'test_impulse_{a.level:+.0f}dB'
     elif a.sweep:
-        # Exponential sweep: constant energy per octave, and the harmonic
-        # distortion products separate cleanly in the deconvolved response.
-        f1, f2 = 20.0, min(20000.0, sr * 0.45)
-        k = math.log(f2 / f1)
-        x = amp * np.sin(2 * np.pi * f1 * secs / k * (np.exp(t / secs * k) - 1))
-        x *= np.minimum(1, np.minimum(t / 0.02, (secs - t) / 0.05))   # de-click
+        x = sweep(sr, secs, a.level)[0]
         name = f'test_sweep_{a.level:+.0f}dB'
     elif a.silence:
-        x = np.zeros(n)
+        x = np.zeros(int(sr * secs))
         name = 'test_silence'
     else:
-        f0 = a.sine
-        x = amp * np.sin(2 * np.pi * f0 * t)
-        x *= np.minimum(1, np.minimum(t / 0.02, (secs - t) / 0.02))
-        name = f'test_sine{f0:g}_{a.level:+.0f}dB'
+        x = tone(sr, secs, a.sine, a.level)
+        name = f'test_sine{a.sine:g}_{a.level:+.0f}dB'
 
     out = a.out or f'{name}.wav'
-    wav_write(out, np.column_stack([x, x]), sr)
+    wav_write(out, np.column_stack([x, x]), sr, cues)
+    if a.suite:
+        print(f'  wrote {out}  ({secs:g}s, {sr} Hz, stereo, {len(cues)} segments)')
+        print(f'  render it through the plugin once, then: analyze-suite <render> --stimulus {out}')
+        return
     print(f'  wrote {out}  ({secs:g}s, {sr} Hz, stereo, peak {a.level:+.1f} dBFS)')
     print(f'  render this through the plugin, then measure the result')
 
 
+# ---------------------------------------------------------------- alignment
+
+FRAC_HALF = 64              # fractional-delay interpolator: 2*64+1 taps
+REFINE = 1 << 16            # frames the sub-sample refinement looks at
+
+
+def frac_delay(y, d, half=FRAC_HALF):
+    """y read d samples late, |d| <= 1: out[i] = y(i + half + d).
+
+    Kaiser-windowed sinc, the window centred on the fractional point so it
+    stays symmetric about it. y must carry `half` extra frames either side;
+    the output is 2*half shorter. d == 0 is an exact copy.
+    """
+    m = np.arange(-half, half + 1) - d
+    w = np.i0(9.0 * np.sqrt(np.maximum(0.0, 1 - (m / (half + 1)) ** 2))) / np.i0(9.0)
+    return np.correlate(y, np.sinc(m) * w, 'valid')
+
+
+def align(A, B, max_shift, gain=True):
+    """Where B sits against A: -> (shift, frac, gain), B(i + shift + frac) * gain ~ A(i).
+
+    The integer shift is the peak of the cross-correlation over the whole
+    overlap, accumulated as a cross-spectrum block by block, so search range
+    costs nothing and memory stays one block. The peak is then refined to a
+    fractional delay, with the least-squares gain at each candidate, by a
+    golden-section search of the residual on an excerpt.
+    """
+    n = min(len(A), len(B))
+    L = BLOCK
+    nfft = 1 << int(math.ceil(math.log2(L + 2 * max_shift)))
+    S = np.zeros(nfft // 2 + 1, dtype=np.complex128)
+    for i, xb in A.blocks(size=L, stop=n):
+        X = np.fft.rfft(mono(xb), nfft)
+        Y = np.fft.rfft(mono(B.span(i - max_shift, i + len(xb) + max_shift)), nfft)
+        S += np.conj(X) * Y
+    c = np.fft.irfft(S, nfft)[:2 * max_shift + 1]      # c[k]: lag k - max_shift
+    k0 = int(np.argmax(c))
+    shift = k0 - max_shift
+    if not np.any(c):
+        return 0, 0.0, 1.0
+
+    lo = max(0, (n - REFINE) // 2)
+    x = mono(A.read(lo, lo + REFINE))
+    yext = mono(B.span(lo + shift - FRAC_HALF, lo + len(x) + shift + FRAC_HALF))
+
+    def fit(d):
+        y = frac_delay(yext, d)
+        yy = float(np.dot(y, y))
+        g = float(np.dot(x, y)) / yy if gain and yy > 0 else 1.0
+        r = x - g * y
+        return float(np.dot(r, r)), g
+
+    # Golden section over one sample either side; the parabola through the
+    # correlation peak is only the first guess it has to beat.
+    if 0 < k0 < len(c) - 1:
+        den = c[k0 - 1] - 2 * c[k0] + c[k0 + 1]
+        seed = 0.5 * (c[k0 - 1] - c[k0 + 1]) / den if den < 0 else 0.0
+    else:
+        seed = 0.0
+    phi = (math.sqrt(5) - 1) / 2
+    a_, b_ = -1.0, 1.0
+    p, q = b_ - phi * (b_ - a_), a_ + phi * (b_ - a_)
+    fp, fq = fit(p)[0], fit(q)[0]
+    for _ in range(40):
+        if fp < fq:
+            b_, q, fq = q, p, fp
+            p = b_ - phi * (b_ - a_)
+            fp = fit(p)[0]
+        else:
+            a_, p, fp = p, q, fq
+            q = a_ + phi * (b_ - a_)
+            fq = fit(q)[0]
+    cands = [(fit(d)[0], d) for d in (0.0, seed, 0.5 * (a_ + b_))]
+    frac = min(cands)[1]
+    return shift, frac, fit(frac)[1]
+
+
 # ---------------------------------------------------------------- null test
+# Each measurement is a measure_* function returning a dict, so batch can run
+# it in a worker and tabulate it; the cmd_* wrapper prints the same dict as
+# prose. measure_* take a path or an open Wav.
 
-def cmd_null(a):
+@cached
+def measure_null(a, b, max_shift=512, gain=True):
     """Invert one against the other. What survives is exactly what changed.
 
-    Plugins delay, so the residual is minimised over an integer-sample shift
-    first -- otherwise a latency of one sample reads as a huge difference and
-    tells you nothing about the processing.
+    Plugins delay, so B is aligned to A first -- otherwise a latency of one
+    sample reads as a huge difference and tells you nothing about the
+    processing. The alignment is sub-sample and gain-matched (see align), so
+    what is left is the processing rather than interpolation error or a level
+    offset; gain=False keeps the level difference in the residual. The
+    residual is streamed over the whole overlap.
     """
-    A, sr_a = wav_read(a.a)
-    B, sr_b = wav_read(a.b)
-    if sr_a != sr_b:
-        sys.exit(f'sample rates differ: {sr_a} vs {sr_b}')
-    x, y = mono(A), mono(B)
-    n = min(len(x), len(y))
-    x, y = x[:n], y[:n]
-
-    best = (None, None)
-    for shift in range(-a.max_shift, a.max_shift + 1):
-        yy = np.roll(y, -shift)
-        m = slice(a.max_shift, n - a.max_shift)
-        r = x[m] - yy[m]
-        rms = math.sqrt(float(np.mean(r * r))) if len(r) else 1.0
-        if best[0] is None or rms < best[0]:
-            best = (rms, shift, r)
-
-    rms, shift, resid = best
-    ref = math.sqrt(float(np.mean(x[a.max_shift:n - a.max_shift] ** 2)))
-    print(f'  aligned at {shift:+d} sample(s)')
-    print(f'  reference RMS   {db(ref):8.2f} dBFS')
-    print(f'  residual RMS    {db(rms):8.2f} dBFS')
-    print(f'  residual peak   {db(np.max(np.abs(resid))):8.2f} dBFS')
-    print(f'  suppression     {db(ref) - db(rms):8.2f} dB')
-    if db(ref) - db(rms) > 100:
+    A, B = _wav(a), _wav(b)
+    if A.sr != B.sr:
+        raise ValueError(f'sample rates differ: {A.sr} vs {B.sr}')
+    n = min(len(A), len(B))
+    shift, frac, g = align(A, B, max_shift, gain=gain)
+
+    count, ref_e, res_e, res_pk = 0, 0.0, 0.0, 0.0
+    for i, xb in A.blocks(start=max_shift, stop=n - max_shift):
+        xb = mono(xb)
+        y = mono(B.span(i + shift - FRAC_HALF, i + shift + len(xb) + FRAC_HALF))
+        r = xb - g * frac_delay(y, frac)
+        count += len(r)
+        ref_e += float(np.dot(xb, xb))
+        res_e += float(np.dot(r, r))
+        res_pk = max(res_pk, float(np.max(np.abs(r))))
+
+    ref = math.sqrt(ref_e / count) if count else 0.0
+    rms = math.sqrt(res_e / count) if count else 1.0
+    return {'shift': shift + frac, 'gain_db': float(db(g)),
+            'ref_db': float(db(ref)), 'residual_db': float(db(rms)),
+            'peak_db': float(db(res_pk)),
+            'suppression_db': float(db(ref) - db(rms))}
+
+
+def cmd_null(a):
+    try:
+        r = measure_null(a.a, a.b, a.max_shift, gain=not a.no_gain)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f'  aligned at {r["shift"]:+.3f} sample(s)')
+    print(f'  gain match      {r["gain_db"]:8.2f} dB')
+    print(f'  reference RMS   {r["ref_db"]:8.2f} dBFS')
+    print(f'  residual RMS    {r["residual_db"]:8.2f} dBFS')
+    print(f'  residual peak   {r["peak_db"]:8.2f} dBFS')
+    print(f'  suppression     {r["suppression_db"]:8.2f} dB')
+    if r['suppression_db'] > 100:
         print('  -> identical. If you expected a difference, the plugin did nothing.')
-    elif db(ref) - db(rms) > 40:
+    elif r['suppression_db'] > 40:
         print('  -> subtle: a real but small change')
     else:
         print('  -> substantial processing')
@@ -177,133 +570,425 @@ def cmd_null(a):
 
 # ---------------------------------------------------------------- response
 
-def cmd_response(a):
+RESPONSE_HZ = (20, 31.5, 50, 80, 125, 200, 315, 500, 800, 1250,
+               2000, 3150, 5000, 8000, 12500, 16000, 20000)
+
+
+@cached
+def response_curve(src, seconds=10.0, window=False):
     """Magnitude response from a rendered impulse.
 
     Point this at a cab, and the 8-band table it was built from should be
-    readable straight off the curve.
+    readable straight off the curve. Only `seconds` after the impulse are
+    read; past that a render is noise floor, and the FFT would hold it all.
+
+    -> (freqs, dB re the peak bin, samples analysed, nfft, sr)
     """
-    X, sr = wav_read(a.file)
-    x = mono(X)
-    peak = int(np.argmax(np.abs(x)))
-    x = x[max(0, peak - 64):]
+    w = _wav(src)
+    sr = w.sr
+    peak = peak_frame(w)
+    x = mono(w.read(max(0, peak - 64), peak + int(seconds * sr)))
     nfft = 1 << int(math.ceil(math.log2(max(len(x), 4096))))
-    mag = np.abs(np.fft.rfft(x * np.hanning(len(x)) if a.window else x, nfft))
+    mag = np.abs(np.fft.rfft(x * np.hanning(len(x)) if window else x, nfft))
     freqs = np.fft.rfftfreq(nfft, 1 / sr)
+    return freqs, db(mag / np.max(mag)), len(x), nfft, sr
+
+
+def smooth(freqs, mag_db, grid, per_octave):
+    """The curve power-averaged over 1/N octave around each grid frequency.
+
+    One cumulative sum of power, and both band edges for every grid point
+    found with searchsorted, so the cost is the FFT's, not bins x points.
+    Where a band is narrower than a bin (the bottom of a short IR) the
+    curve is interpolated instead.
+    """
+    p = 10 ** (mag_db / 10)
+    c = np.concatenate(([0.0], np.cumsum(p)))
+    half = 2 ** (0.5 / per_octave)
+    lo = np.searchsorted(freqs, grid / half)
+    hi = np.searchsorted(freqs, grid * half, side='right')
+    avg = np.where(hi > lo, (c[hi] - c[lo]) / np.maximum(hi - lo, 1), np.interp(grid, freqs, p))
+    return db(np.sqrt(avg))
+
+
+def response_points(freqs, mag_db, sr, smoothing=None):
+    """-> {'20': dB, ...} at the RESPONSE_HZ points below Nyquist."""
+    pts = np.array([f for f in RESPONSE_HZ if f < sr / 2], dtype=np.float64)
+    if smoothing:
+        vals = smooth(freqs, mag_db, pts, smoothing)
+    else:
+        vals = mag_db[np.round(pts / freqs[1]).astype(int)]
+    return {f'{f:g}': float(v) for f, v in zip(pts, vals)}
+
+
+def measure_response(src, seconds=10.0, window=False, smoothing=None):
+    """-> dict: the curve read at the RESPONSE_HZ points, in dB re peak."""
+    freqs, mag_db, n, nfft, sr = response_curve(src, seconds, window)
+    return {'samples': n, 'sr': sr, 'nfft': nfft,
+            'db': response_points(freqs, mag_db, sr, smoothing)}
+
+
+def write_table(path, header, columns, fmt):
+    """Columns to a CSV in a single write, or to .npy as float64 [n, cols].
+
+    The text is formatted by numpy a column at a time and joined once: a
+    long IR's curve is millions of rows, and one fh.write per row was most
+    of the run time.
+    """
+    if path.lower().endswith('.npy'):
+        np.save(path, np.column_stack(columns).astype(np.float64))
+        return
+    cells = [np.char.mod(f, np.asarray(c)) for f, c in zip(fmt, columns)]
+    rows = cells[0]
+    for c in cells[1:]:
+        rows = np.char.add(np.char.add(rows, ','), c)
+    with open(path, 'w') as fh:
+        fh.write(header + '\n' + '\n'.join(rows.tolist()) + '\n')
+
 
-    ref = np.max(mag)
-    print(f'  {len(x)} samples, {sr} Hz, {nfft}-point FFT')
+def cmd_response(a):
+    freqs, mag_db, n, nfft, sr = response_curve(a.file, a.seconds, a.window)
+    print(f'  {n} samples, {sr} Hz, {nfft}-point FFT'
+          + (f', 1/{a.smooth:g}-octave smoothing' if a.smooth else ''))
     print(f'  {"Hz":>9}  {"dB":>8}')
-    for f in [20, 31.5, 50, 80, 125, 200, 315, 500, 800, 1250,
-              2000, 3150, 5000, 8000, 12500, 16000, 20000]:
-        if f >= sr / 2:
-            break
-        i = int(round(f / (sr / nfft)))
-        print(f'  {f:>9g}  {db(mag[i] / ref):8.2f}')
+    for f, v in response_points(freqs, mag_db, sr, a.smooth).items():
+        print(f'  {f:>9}  {v:8.2f}')
     if a.csv:
-        with open(a.csv, 'w') as fh:
-            fh.write('hz,db\n')
-            for f, m in zip(freqs, db(mag / ref)):
-                if 10 <= f <= sr / 2:
-                    fh.write(f'{f:.3f},{m:.4f}\n')
+        if a.smooth or a.points:
+            grid = np.geomspace(10.0, sr / 2, a.points or 512)
+            curve = smooth(freqs, mag_db, grid, a.smooth) if a.smooth \
+                else np.interp(grid, freqs, mag_db)
+            write_table(a.csv, 'hz,db', [grid, curve], ['%.3f', '%.4f'])
+        else:
+            keep = (freqs >= 10) & (freqs <= sr / 2)
+            write_table(a.csv, 'hz,db', [freqs[keep], mag_db[keep]], ['%.3f', '%.4f'])
         print(f'  full curve -> {a.csv}')
 
 
 # ---------------------------------------------------------------- decay
 
-def cmd_decay(a):
+# Band centres: the nominal third-octave series, exact centre 1000*2^(k/3).
+# Octaves are every third one, from 31.5 Hz.
+THIRDS = (25, 31.5, 40, 50, 63, 80, 100, 125, 160, 200, 250, 315, 400, 500, 630,
+          800, 1000, 1250, 1600, 2000, 2500, 3150, 4000, 5000, 6300, 8000, 10000,
+          12500, 16000, 20000)
+BAND_GROUP = 8              # bands inverse-transformed together
+
+
+def band_masks(freqs, per_octave=1):
+    """-> (labels, masks [B, bins]): power-complementary 1/N-octave bands.
+
+    Flat across the band and a raised-cosine crossover half a band wide on a
+    log-frequency axis, so adjacent masks' squares sum to one and no energy
+    is counted twice or lost between bands.
+    """
+    ks = [k for k in range(-16, 14) if per_octave == 3 or k % 3 == 0]
+    fc = np.array([1000 * 2 ** (k / 3) for k in ks])
+    labels = [f'{THIRDS[k + 16]:g}' for k in ks]
+    keep = fc * 2 ** (0.5 / per_octave) < freqs[-1]
+    with np.errstate(divide='ignore'):
+        u = np.abs(np.log2(freqs[None, :] / fc[keep, None])) * per_octave
+    edge = np.clip((u - 0.25) / 0.5, 0.0, 1.0)
+    return [l for l, k in zip(labels, keep) if k], np.cos(0.5 * np.pi * edge)
+
+
+def schroeder_times(e, sr):
+    """Energy envelopes [B, n] -> dict of [B] arrays: edt, t20, t30, c80.
+
+    Every band's backward integral in one cumsum, and each level crossing
+    found for all bands at once. Two-point slopes, as the broadband figure.
+    NaN where a band never decays far enough.
+    """
+    sch = np.cumsum(e[:, ::-1], axis=1)[:, ::-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sch = 10 * np.log10(np.maximum(sch / sch[:, :1], 1e-30))
+    rows = np.arange(len(e))
+
+    def at(level):
+        hit = sch <= level
+        i = np.argmax(hit, axis=1)
+        return np.where(hit.any(axis=1), i, -1), sch[rows, i]
+
+    def rt(hi, lo):
+        (i0, s0), (i1, s1) = (at(hi) if hi < 0 else (np.zeros(len(e), int), sch[:, 0])), at(lo)
+        ok = (i0 >= 0) & (i1 > i0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (s1 - s0) / ((i1 - i0) / sr)
+            return np.where(ok & (slope < 0), -60.0 / slope, np.nan)
+
+    n80 = min(e.shape[1], int(0.08 * sr))
+    early = e[:, :n80].sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c80 = 10 * np.log10(early / (e.sum(axis=1) - early))
+    return {'edt': rt(0, -10), 't20': rt(-5, -25), 't30': rt(-5, -35), 'c80': c80}
+
+
+@cached
+def measure_decay(src, expect=None, bands=None, seconds=10.0):
     """RT60 by Schroeder backward integration.
 
     Black In Bluhm computes an RT60 from room geometry and materials and then
     builds an FDN it HOPES realises it. This measures what the FDN actually
     does, which is a falsifiable prediction the code already makes.
+
+    The broadband backward integral is total energy minus a running forward
+    sum, so it streams: one pass for the total, one to find where it crosses
+    each level. bands=1 or 3 adds octave or third-octave EDT/T20/T30/C80:
+    the room damps per material and per FDN line, and one broadband number
+    hides most of what it predicts. `expect` is a broadband RT60 or a dict
+    of band label -> RT60.
     """
-    X, sr = wav_read(a.file)
-    x = mono(X)
-    x = x[int(np.argmax(np.abs(x))):]
-    e = x * x
-    sch = np.cumsum(e[::-1])[::-1]                      # backward integral
-    sch = 10 * np.log10(np.maximum(sch / sch[0], 1e-30))
+    w = _wav(src)
+    sr = w.sr
+    start = peak_frame(w)
+    n80 = int(0.08 * sr)
+    total = early = 0.0
+    for i, b in w.blocks(start=start):
+        e = mono(b) ** 2
+        total += float(np.sum(e))
+        early += float(np.sum(e[:max(0, start + n80 - i)]))
+
+    levels = (-5.0, -10.0, -25.0, -35.0)
+    cross = {0.0: (0, 0.0)}                             # level -> (frame, dB)
+    done = 0.0
+    for i, blk in w.blocks(start=start):
+        e = mono(blk) ** 2
+        sch = total - done - np.concatenate(([0.0], np.cumsum(e)[:-1]))
+        sch = 10 * np.log10(np.maximum(sch / total, 1e-30)) if total > 0 \
+            else np.full(len(e), -300.0)
+        for lv in levels:
+            if lv not in cross and sch[-1] <= lv:
+                j = int(np.argmax(sch <= lv))
+                cross[lv] = (i - start + j, float(sch[j]))
+        done += float(np.sum(e))
+        if len(cross) == len(levels) + 1:
+            break
 
     def t_between(hi, lo):
-        try:
-            i0 = int(np.argmax(sch <= hi))
-            i1 = int(np.argmax(sch <= lo))
-        except ValueError:
+        if hi not in cross or lo not in cross:
             return None
+        (i0, s0), (i1, s1) = cross[hi], cross[lo]
         if i1 <= i0:
             return None
-        slope = (sch[i1] - sch[i0]) / ((i1 - i0) / sr)   # dB per second
+        slope = (s1 - s0) / ((i1 - i0) / sr)            # dB per second
         return -60.0 / slope if slope < 0 else None
 
     t20, t30 = t_between(-5, -25), t_between(-5, -35)
-    print(f'  {len(x)/sr:.2f}s of decay at {sr} Hz')
+    broad = expect if not isinstance(expect, dict) else None
+    err = (t30 - broad) / broad * 100 if broad and t30 else None
+    c80 = 10 * math.log10(early / (total - early)) if 0 < early < total else None
+    r = {'seconds': (len(w) - start) / sr, 'sr': sr, 'edt': t_between(0.0, -10),
+         't20': t20, 't30': t30, 'c80': c80, 'error_pct': err}
+    if bands:
+        r['bands'] = decay_bands(w, start, int(bands), seconds,
+                                 expect if isinstance(expect, dict) else {})
+    return r
+
+
+def decay_bands(w, start, per_octave, seconds, expect):
+    """Band-by-band decay of the impulse from `start`, `seconds` of it.
+
+    One forward FFT; each group of band masks is applied and inverse
+    transformed together. Zero-phase masks ring both ways, so the read starts
+    a little before the peak and each band is cut at the peak afterwards.
+    """
+    sr = w.sr
+    pre = int(0.01 * sr)
+    x = mono(w.read(max(0, start - pre), start + int(seconds * sr)))
+    pre = min(pre, start)
+    nfft = 1 << int(math.ceil(math.log2(2 * len(x))))   # no circular wrap
+    X = np.fft.rfft(x, nfft)
+    labels, masks = band_masks(np.fft.rfftfreq(nfft, 1 / sr), per_octave)
+
+    out = {}
+    for g in range(0, len(labels), BAND_GROUP):
+        y = np.fft.irfft(X[None, :] * masks[g:g + BAND_GROUP], nfft)[:, pre:len(x)]
+        times = schroeder_times(y * y, sr)
+        for j, label in enumerate(labels[g:g + BAND_GROUP]):
+            b = {k: (None if np.isnan(v[j]) else float(v[j])) for k, v in times.items()}
+            want = expect.get(label)
+            b['error_pct'] = (b['t30'] - want) / want * 100 if want and b['t30'] else None
+            out[label] = b
+    return out
+
+
+def parse_expect(text):
+    """'1.2' -> 1.2; '125=1.4,500=1.1' -> {'125': 1.4, '500': 1.1}."""
+    if text is None or '=' not in text:
+        return float(text) if text else None
+    return {k.strip(): float(v) for k, v in (p.split('=') for p in text.split(','))}
+
+
+def cmd_decay(a):
+    try:
+        expect = parse_expect(a.expect)
+    except ValueError:
+        sys.exit('--expect: a number, or band=seconds pairs like 125=1.4,500=1.1')
+    r = measure_decay(a.file, expect, {'octave': 1, 'third': 3}.get(a.bands), a.seconds)
+    t20, t30 = r['t20'], r['t30']
+    print(f'  {r["seconds"]:.2f}s of decay at {r["sr"]} Hz')
     print(f'  T20 -> RT60   {t20:.3f} s' if t20 else '  T20 unavailable (decay too short)')
     print(f'  T30 -> RT60   {t30:.3f} s' if t30 else '  T30 unavailable (decay too short)')
-    if a.expect and t30:
-        err = (t30 - a.expect) / a.expect * 100
-        print(f'  predicted     {a.expect:.3f} s   -> {err:+.1f}% error')
+    if r['edt']:
+        print(f'  EDT           {r["edt"]:.3f} s')
+    if r['c80'] is not None:
+        print(f'  C80           {r["c80"]:+.2f} dB')
+    if r['error_pct'] is not None:
+        print(f'  predicted     {expect:.3f} s   -> {r["error_pct"]:+.1f}% error')
+    if 'bands' not in r:
+        return
+
+    fmt = lambda v, f: format(v, f) if v is not None else '-'.rjust(7)
+    print()
+    print(f'  {"band Hz":>8} {"EDT s":>7} {"T20 s":>7} {"T30 s":>7} {"C80 dB":>7} {"expect":>7} {"error":>7}')
+    for label, b in r['bands'].items():
+        want = expect.get(label) if isinstance(expect, dict) else None
+        print(f'  {label:>8} {fmt(b["edt"], "7.3f")} {fmt(b["t20"], "7.3f")} '
+              f'{fmt(b["t30"], "7.3f")} {fmt(b["c80"], "+7.2f")} {fmt(want, "7.3f")} '
+              f'{fmt(b["error_pct"], "+6.1f")}{"%" * (b["error_pct"] is not None)}')
 
 
 # ---------------------------------------------------------------- thd/alias
 
-def cmd_thd(a):
+THD_MAX = 1 << 20           # largest single FFT block (~22 s at 48 kHz)
+THD_GROUP = 64              # frames transformed together when streaming
+
+
+def bh4(n):
+    """4-term Blackman-Harris: -92 dB sidelobes.
+
+    A plain Blackman leaks its -58 dB skirt into the unclaimed bins, and
+    against a fundamental this strong that leakage gets counted as aliasing --
+    it reported 0.17% on a synthetic signal containing none.
+    """
+    k = np.arange(n) * (2 * np.pi / n)
+    return (0.35875 - 0.48829 * np.cos(k) + 0.14128 * np.cos(2 * k)
+            - 0.01168 * np.cos(3 * k))
+
+
+def harmonic_split(power, bin_hz, f0, sr, halfwidth=6):
+    """Power spectra [frames, bins] -> (fundamental [F], harmonics [F, K], alias [F]).
+
+    Each band -- f0 and every multiple below Nyquist, `halfwidth` bins either
+    side, wide enough for the BH4 main lobe -- is a row of one 0/1 matrix, so
+    every frame and every harmonic is a single matmul. Whatever no band claims
+    is alias, less a noise floor taken as the median of the unclaimed bins, so
+    a genuinely quiet render is not reported as full of aliasing.
+    """
+    nb = power.shape[1]
+    ks = np.arange(1, int(sr / 2 / f0) + 2)
+    ks = ks[ks * f0 < sr / 2]
+    c = np.round(ks * f0 / bin_hz).astype(int)
+    lo, hi = np.maximum(0, c - halfwidth), np.minimum(nb, c + halfwidth + 1)
+    j = np.arange(nb)
+    bands = (j >= lo[:, None]) & (j < hi[:, None])
+    e = power @ bands.T.astype(np.float64)
+
+    fund, harm = e[:, 0], e[:, 1:]
+    alias = np.maximum(0.0, power.sum(axis=1) - fund - harm.sum(axis=1))
+    rest = np.sqrt(power[:, ~bands.any(axis=0)])
+    if rest.shape[1]:
+        alias = np.maximum(0.0, alias - np.median(rest, axis=1) ** 2 * rest.shape[1])
+    return fund, harm, alias
+
+
+def _pct(part, fund):
+    return np.where(fund > 0, np.sqrt(part / np.where(fund > 0, fund, 1)) * 100, 0.0)
+
+
+def _thd_summary(power, bin_hz, f0, sr):
+    """One spectrum -> the THD dict: fundamental, THD, alias, first 12 harmonics."""
+    fund, harm, alias = harmonic_split(power[None, :], bin_hz, f0, sr)
+    fund_e, harm = float(fund[0]), harm[0]
+    harmonics = {str(k): float(db(math.sqrt(e / fund_e)))
+                 for k, e in enumerate(harm[:12], 2) if e > 0 and fund_e > 0}
+    return {'f0': f0, 'sr': sr, 'bin_hz': bin_hz,
+            'fund_db': float(db(math.sqrt(fund_e))),
+            'thd_pct': float(_pct(harm.sum(), fund_e)),
+            'alias_pct': float(_pct(alias[0], fund_e)), 'harmonics': harmonics}
+
+
+@cached
+def measure_thd(src, f0=997.0, stream=False, frame=16384, overlap=0.5):
     """Harmonic distortion and aliasing, counted separately.
 
     This is the one that answers "is ADAA earning its keep". A nonlinearity
     makes harmonics; those above Nyquist fold back to frequencies that are NOT
     multiples of f0. So: energy on multiples of f0 is harmonic distortion and
     is the point. Everything else above the noise floor is alias, and is not.
+
+    stream=True measures the whole file frame by frame instead of one block
+    from the middle (see thd_frames): the result is the Welch average, plus
+    the spread of the per-frame THD.
     """
-    X, sr = wav_read(a.file)
-    x = mono(X)
-    # Trim fades, then take a power-of-two block from the steady middle.
-    n = 1 << int(math.floor(math.log2(len(x) * 0.6)))
-    start = (len(x) - n) // 2
-    seg = x[start:start + n]
-    # 4-term Blackman-Harris: -92 dB sidelobes. A plain Blackman leaks its
-    # -58 dB skirt into the unclaimed bins, and against a fundamental this
-    # strong that leakage gets counted as aliasing -- it reported 0.17% on a
-    # synthetic signal containing none.
-    k = np.arange(n) * (2 * np.pi / n)
-    w = (0.35875 - 0.48829 * np.cos(k) + 0.14128 * np.cos(2 * k)
-         - 0.01168 * np.cos(3 * k))
-    mag = np.abs(np.fft.rfft(seg * w))
-    bin_hz = sr / n
-
-    f0 = a.f0
-    def band(f, halfwidth=6):        # wide enough for the BH4 main lobe
-        i = int(round(f / bin_hz))
-        lo, hi = max(0, i - halfwidth), min(len(mag), i + halfwidth + 1)
-        return float(np.sum(mag[lo:hi] ** 2)), lo, hi
-
-    fund_e, flo, fhi = band(f0)
-    claimed = np.zeros(len(mag), dtype=bool)
-    claimed[flo:fhi] = True
-
-    harm_e, harm_rows = 0.0, []
-    k = 2
-    while k * f0 < sr / 2:
-        e, lo, hi = band(k * f0)
-        claimed[lo:hi] = True
-        harm_e += e
-        harm_rows.append((k, k * f0, e))
-        k += 1
-
-    total_e = float(np.sum(mag ** 2))
-    alias_e = max(0.0, total_e - fund_e - harm_e)
-
-    # Noise floor: median of everything unclaimed, so a genuinely quiet
-    # render is not reported as full of aliasing.
-    rest = mag[~claimed]
-    floor_e = float(np.median(rest) ** 2 * len(rest)) if len(rest) else 0.0
-    alias_e = max(0.0, alias_e - floor_e)
-
-    thd = math.sqrt(harm_e / fund_e) * 100 if fund_e > 0 else 0.0
-    alias_pct = math.sqrt(alias_e / fund_e) * 100 if fund_e > 0 else 0.0
-
-    print(f'  f0 {f0:g} Hz, {sr} Hz, {n}-point FFT ({bin_hz:.2f} Hz/bin)')
-    print(f'  fundamental      {db(math.sqrt(fund_e)):8.2f} dB')
+    if stream:
+        t, fund_db, thd, alias_pct, r = thd_frames(src, f0, frame, overlap)
+        return r
+    w = _wav(src)
+    sr = w.sr
+    # Trim fades, then take a power-of-two block from the steady middle --
+    # at most THD_MAX of it, which is already far finer than the BH4 lobe.
+    n = min(1 << int(math.floor(math.log2(len(w) * 0.6))), THD_MAX)
+    start = (len(w) - n) // 2
+    seg = mono(w.read(start, start + n))
+    power = np.abs(np.fft.rfft(seg * bh4(n))) ** 2
+    r = _thd_summary(power, sr / n, f0, sr)
+    r['nfft'] = n
+    return r
+
+
+@cached
+def thd_frames(src, f0=997.0, frame=16384, overlap=0.5):
+    """THD and alias against time: BH4 frames slid through the whole file.
+
+    One block from the middle cannot see THD drift while a PSU sags or a bias
+    tracker settles, and its floor estimate is one noisy spectrum. Here every
+    frame is measured, THD_GROUP frames to one FFT call, so memory is one group
+    however long the render. The power spectra are also averaged (Welch) for
+    the summary, leaving out frames 20 dB or more below the median level --
+    fades and gaps would only dilute it.
+
+    -> (times [F] s, fund_db [F], thd_pct [F], alias_pct [F], summary dict)
+    """
+    w = _wav(src)
+    sr = w.sr
+    hop = max(1, int(frame * (1 - overlap)))
+    count = max(0, (len(w) - frame) // hop + 1)
+    if not count:
+        raise ValueError(f'{w.path}: shorter than one {frame}-sample frame')
+    win = bh4(frame)
+    bin_hz = sr / frame
+
+    def groups():
+        for g in range(0, count, THD_GROUP):
+            m = min(THD_GROUP, count - g)
+            x = mono(w.read(g * hop, g * hop + (m - 1) * hop + frame))
+            yield g, np.lib.stride_tricks.sliding_window_view(x, frame)[::hop][:m]
+
+    # Pass 1 is time domain only: frame levels, to gate the average.
+    level = np.concatenate([np.mean(fr * fr, axis=1) for _, fr in groups()])
+    keep = level >= np.median(level) * 0.01
+
+    fund = np.empty(count); harm = np.empty(count); alias = np.empty(count)
+    welch = np.zeros(frame // 2 + 1)
+    for g, fr in groups():
+        power = np.abs(np.fft.rfft(fr * win, axis=1)) ** 2
+        f, h, al = harmonic_split(power, bin_hz, f0, sr)
+        fund[g:g + len(fr)], harm[g:g + len(fr)], alias[g:g + len(fr)] = f, h.sum(axis=1), al
+        welch += power[keep[g:g + len(fr)]].sum(axis=0)
+
+    thd, alias_pct = _pct(harm, fund), _pct(alias, fund)
+    r = _thd_summary(welch / max(1, int(keep.sum())), bin_hz, f0, sr)
+    r.update({'nfft': frame, 'frames': count, 'averaged': int(keep.sum()),
+              'thd_min_pct': float(thd[keep].min()), 'thd_max_pct': float(thd[keep].max()),
+              'thd_first_pct': float(thd[keep][0]), 'thd_last_pct': float(thd[keep][-1])})
+    times = (np.arange(count) * hop + frame / 2) / sr
+    return times, db(np.sqrt(fund)), thd, alias_pct, r
+
+
+def _print_thd(r):
+    thd, alias_pct = r['thd_pct'], r['alias_pct']
+    print(f'  fundamental      {r["fund_db"]:8.2f} dB')
     print(f'  THD              {thd:8.3f} %   ({db(thd/100):.1f} dB)')
     print(f'  aliasing / IMD   {alias_pct:8.3f} %   ({db(alias_pct/100):.1f} dB)')
     if thd > 0 and alias_pct > 0:
@@ -311,9 +996,608 @@ def cmd_thd(a):
               f'(higher is cleaner -- distortion where you asked for it)')
     print()
     print(f'  {"harmonic":>9} {"Hz":>10} {"dB rel f0":>11}')
-    for k, f, e in harm_rows[:12]:
-        if e > 0 and db(math.sqrt(e / fund_e)) > -140:
-            print(f'  {k:>9} {f:>10.1f} {db(math.sqrt(e / fund_e)):>11.2f}')
+    for k, rel in r['harmonics'].items():
+        if rel > -140:
+            print(f'  {k:>9} {int(k) * r["f0"]:>10.1f} {rel:>11.2f}')
+
+
+def cmd_thd(a):
+    if not a.stream:
+        r = measure_thd(a.file, a.f0)
+        print(f'  f0 {r["f0"]:g} Hz, {r["sr"]} Hz, {r["nfft"]}-point FFT ({r["bin_hz"]:.2f} Hz/bin)')
+        _print_thd(r)
+        return
+
+    try:
+        t, fund_db, thd, alias_pct, r = thd_frames(a.file, a.f0, a.frame, a.overlap)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f'  f0 {r["f0"]:g} Hz, {r["sr"]} Hz, {r["frames"]} x {r["nfft"]}-point frames '
+          f'({r["bin_hz"]:.2f} Hz/bin), {r["averaged"]} averaged')
+    _print_thd(r)
+    print()
+    print(f'  THD over time: {r["thd_first_pct"]:.3f} % -> {r["thd_last_pct"]:.3f} %, '
+          f'range {r["thd_min_pct"]:.3f} .. {r["thd_max_pct"]:.3f} %')
+    print(f'  {"s":>9} {"f0 dB":>8} {"THD %":>9} {"alias %":>9}')
+    for i in np.unique(np.linspace(0, len(t) - 1, min(len(t), 24)).astype(int)):
+        print(f'  {t[i]:>9.2f} {fund_db[i]:>8.2f} {thd[i]:>9.3f} {alias_pct[i]:>9.3f}')
+    if a.csv:
+        write_table(a.csv, 's,fund_db,thd_pct,alias_pct', [t, fund_db, thd, alias_pct],
+                    ['%.6g'] * 4)
+        print(f'  every frame -> {a.csv}')
+
+
+# ---------------------------------------------------------------- deconvolve
+# @cite farina-2000 -- exponential-sweep inverse filter, harmonic IR separation
+
+def _band_target(f, f1, f2, nfft):
+    """Minimum-phase band-pass over the sweep's range: raised-cosine edges
+    (half an octave up from f1, 0.15 octave down to f2), flat between. A
+    minimum-phase IR has nothing before its peak, so the linear response
+    can't leak backwards into the harmonic windows."""
+    lf = np.log2(np.maximum(f, 1e-9))
+    lo = np.clip((lf - math.log2(f1)) / 0.5, 0, 1)
+    hi = np.clip((math.log2(f2) - lf) / 0.15, 0, 1)
+    mag = (0.5 - 0.5 * np.cos(np.pi * lo)) * (0.5 - 0.5 * np.cos(np.pi * hi))
+    c = np.fft.irfft(np.log(np.maximum(mag, 1e-6)), nfft)     # real cepstrum
+    c[1:nfft // 2] *= 2
+    c[nfft // 2 + 1:] = 0
+    return np.exp(np.fft.rfft(c, nfft))
+
+
+def deconvolve_sweep(y, sr, secs=4.0, level=-6.0, harmonics=5, tail=2.0, ref=None,
+                     guard=0.02):
+    """Rendered gen --sweep -> (latency frames, [linear IR, h2, h3, ... hN]).
+
+    The inverse filter is regularised (Kirkeby): conj(X) T / (|X|^2 + eps),
+    with T a minimum-phase band-pass over the sweep's range, delayed by the
+    sweep's length. Sweep * inverse is then T itself, so a unity-gain plugin
+    gives a unity linear IR with no pre-ringing, and the eps keeps the band
+    edges, where the sweep has next to no energy, from blowing up. The
+    plain time-reversed inverse rings ahead of the linear peak, which read
+    as an h2 of -35 dB on a straight wire.
+
+    Convolving the render with it puts the linear response at the sweep's
+    length (plus the plugin's latency) and harmonic k L*ln(k) seconds
+    earlier. Each harmonic IR is cut from just before its arrival to
+    `guard` seconds before the next one's; the linear IR runs `tail`
+    seconds. A passthrough reads below -120 dB in every harmonic window.
+
+    Harmonic k's IR is indexed by OUTPUT frequency: its response at f is the
+    k-th harmonic of a tone at f/k.
+    """
+    f1, f2 = 20.0, min(20000.0, sr * 0.45)
+    L = secs / math.log(f2 / f1)
+    x = sweep(sr, secs, level)[0] if ref is None else ref
+    n = len(x)
+    nfft = 1 << int(math.ceil(math.log2(len(y) + n - 1)))
+    f = np.fft.rfftfreq(nfft, 1 / sr)
+    X = np.fft.rfft(x, nfft)
+    P = np.abs(X) ** 2
+    T = _band_target(f, f1, f2, nfft)
+    INV = np.conj(X) * T / (P + 1e-6 * P.max()) * np.exp(-2j * np.pi * f * (n - 1) / sr)
+    h = np.fft.irfft(np.fft.rfft(y, nfft) * INV, nfft)
+
+    # Linear peak: at n - 1 plus T's own peak for no latency; look up to a
+    # second past that.
+    zero = n - 1
+    lag = int(np.argmax(np.abs(np.fft.irfft(T, nfft)[:sr])))
+    peak = zero + int(np.argmax(np.abs(h[zero:zero + sr])))
+    gap = L * math.log(harmonics / (harmonics - 1)) * sr if harmonics > 1 else sr
+    pre = int(min(0.005 * sr, gap / 10))
+    guard = int(min(guard * sr, gap / 4))
+    irs = [h[peak - pre:peak + int(tail * sr)]]
+    for k in range(2, harmonics + 1):
+        a = peak - int(round(L * math.log(k) * sr)) - pre
+        b = peak - int(round(L * math.log(k - 1) * sr)) - guard
+        irs.append(h[max(0, a):max(0, b)])
+    return peak - zero - lag, irs
+
+
+def cmd_deconvolve(a):
+    """Split a rendered sweep into its linear and harmonic impulse responses.
+
+    Each one is written as a WAV next to the render -- the linear IR is the
+    file to hand to `response` and `decay` -- and summarised here.
+    """
+    w = Wav(a.file)
+    sr = w.sr
+    ref = None
+    if a.ref:
+        r = Wav(a.ref)
+        if r.sr != sr:
+            sys.exit(f'sample rates differ: {r.sr} vs {sr}')
+        ref, a.seconds = mono(r.read()), len(r) / sr
+    y = mono(w.read(0, int((a.seconds + a.tail + 1.0) * sr)))
+    if a.harmonics < 1:
+        sys.exit('--harmonics must be at least 1')
+    latency, irs = deconvolve_sweep(y, sr, a.seconds, a.level, a.harmonics, a.tail, ref)
+
+    base = a.out or os.path.splitext(a.file)[0]
+    paths = [f'{base}_ir.wav'] + [f'{base}_h{k}.wav' for k in range(2, len(irs) + 1)]
+    for p, ir in zip(paths, irs):
+        wav_write(p, ir, sr)
+
+    lin = irs[0]
+    nfft = 1 << int(math.ceil(math.log2(max(4096, max(len(ir) for ir in irs)))))
+    mags = [np.abs(np.fft.rfft(ir, nfft)) for ir in irs]
+    ref_mag = float(np.max(mags[0])) or 1.0
+    lin_e = float(np.dot(lin, lin)) or 1.0
+
+    print(f'  latency {latency:+d} sample(s), linear IR peak {db(np.max(np.abs(lin))):.2f} dB')
+    for k, (p, ir) in enumerate(zip(paths, irs), 1):
+        rel = f'{10 * math.log10(max(float(np.dot(ir, ir)), 1e-30) / lin_e):8.2f} dB re linear' \
+            if k > 1 else ''
+        print(f'  {"linear" if k == 1 else f"h{k}":>6}  {len(ir):>7} samples  {rel}  -> {p}')
+    print()
+    print(f'  {"Hz":>9}' + ''.join(f'{"linear" if k == 1 else f"h{k}":>8}'
+                                   for k in range(1, len(irs) + 1)) + '   (dB re linear peak)')
+    for f in RESPONSE_HZ:
+        if f >= sr / 2:
+            break
+        i = int(round(f / (sr / nfft)))
+        print(f'  {f:>9g}' + ''.join(f'{float(db(m[i] / ref_mag)):>8.2f}' for m in mags))
+    print()
+    d = measure_decay(paths[0])
+    print(f'  linear IR: T20 {d["t20"]:.3f} s' if d['t20'] else '  linear IR: T20 unavailable',
+          f' T30 {d["t30"]:.3f} s' if d['t30'] else ' T30 unavailable')
+
+
+# ---------------------------------------------------------------- batch
+# A night of renders is hundreds of files. One process per file re-imports
+# numpy hundreds of times; this imports it once per core and hands the files
+# out. Output is one row per file x measurement, flattened so the same rows
+# go to JSON lines or CSV.
+
+MEASURES = {'null': measure_null, 'response': measure_response,
+            'decay': measure_decay, 'thd': measure_thd}
+
+
+def parse_spec(text, known=MEASURES):
+    """'thd:f0=440' or 'null:ref=dry.wav,max-shift=4096' -> (name, params)."""
+    name, _, rest = text.partition(':')
+    if name not in known:
+        raise ValueError(f'unknown {name!r} (have {", ".join(known)})')
+    params = {}
+    for item in filter(None, rest.split(',')):
+        key, eq, val = item.partition('=')
+        if not eq:
+            raise ValueError(f'{text}: expected key=value, got {item!r}')
+        for conv in (int, float):
+            try:
+                val = conv(val)
+                break
+            except ValueError:
+                pass
+        params[key.strip().replace('-', '_')] = val
+    return name, params
+
+
+def flatten(d, prefix=''):
+    """{'db': {'20': -3}} -> {'db.20': -3}: one column per leaf."""
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            out.update(flatten(v, f'{prefix}{k}.'))
+        else:
+            out[f'{prefix}{k}'] = v
+    return out
+
+
+def _pool(jobs=None):
+    """A process pool whose workers use the same cache as this process."""
+    args = (CACHE.root, CACHE.limit / 1048576) if CACHE else (None, 0)
+    return ProcessPoolExecutor(max_workers=jobs or None, initializer=_set_cache, initargs=args)
+
+
+def _batch_one(job):
+    """Worker: one file, one measurement -> one flat row. Never raises."""
+    path, name, params = job
+    row = {'file': path, 'measure': name}
+    row.update({f'param.{k}': v for k, v in params.items()})
+    kw = dict(params)
+    try:
+        if name == 'null':
+            result = measure_null(kw.pop('ref'), path, **kw)
+        else:
+            result = MEASURES[name](path, **kw)
+        row.update(flatten(result))
+    except (OSError, ValueError, TypeError) as e:
+        row['error'] = str(e)
+    return row
+
+
+def batch_inputs(patterns, manifest=None):
+    """Globs (** recursive) plus a manifest of one path per line -> sorted paths."""
+    paths = set()
+    for pat in patterns:
+        hits = glob.glob(pat, recursive=True)
+        paths.update(hits if hits else [pat] if os.path.exists(pat) else [])
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as fh:
+            for line in fh:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    paths.add(os.path.join(base, line))
+    return sorted(paths)
+
+
+def write_rows(rows, out):
+    """Rows to `out`: CSV if it ends .csv, else JSON lines. None is stdout."""
+    fh = open(out, 'w', newline='') if out else sys.stdout
+    try:
+        if out and out.lower().endswith('.csv'):
+            cols = []
+            for r in rows:
+                cols.extend(k for k in r if k not in cols)
+            wr = csv.DictWriter(fh, fieldnames=cols)
+            wr.writeheader()
+            wr.writerows(rows)
+        else:
+            for r in rows:
+                fh.write(json.dumps(r) + '\n')
+    finally:
+        if out:
+            fh.close()
+
+
+def cmd_batch(a):
+    try:
+        specs = [parse_spec(s) for s in a.measure]
+    except ValueError as e:
+        sys.exit(str(e))
+    if any(name == 'null' and 'ref' not in params for name, params in specs):
+        sys.exit('null needs a reference: null:ref=<file>')
+    paths = batch_inputs(a.inputs, a.manifest)
+    if not paths:
+        sys.exit('no input files matched')
+    jobs = [(p, name, params) for p in paths for name, params in specs]
+
+    with _pool(a.jobs) as ex:
+        rows = list(ex.map(_batch_one, jobs, chunksize=max(1, len(jobs) // 64)))
+
+    write_rows(rows, a.out)
+    bad = sum(1 for r in rows if 'error' in r)
+    print(f'  {len(rows)} measurement(s) over {len(paths)} file(s)'
+          f'{f", {bad} failed" if bad else ""}'
+          f'{f" -> {a.out}" if a.out else ""}', file=sys.stderr)
+
+
+# ---------------------------------------------------------------- suite
+# The slow part of the loop is the REAPER round trip, once per signal. The
+# suite puts every signal in one file, each segment named by a cue region in
+# the same spec syntax batch uses ("sine:f0=997,level=-12"), so one render
+# per plugin setting carries everything and analyze-suite can find it again.
+
+SUITE_LEVELS = (-30, -24, -18, -12, -6, 0)
+SUITE_KINDS = {'silence': (), 'impulse': (), 'sweep': (), 'sine': ()}
+
+
+def suite(sr, gap=2.0):
+    """-> (signal, cues): silence, impulse, sweep, 997 Hz at SUITE_LEVELS.
+
+    Every segment is followed by `gap` seconds of nothing, so tails (a reverb,
+    a compressor releasing) land in their own segment's window and not the
+    next one's. Cue regions cover the signal, not the gap.
+    """
+    parts = [('silence', np.zeros(int(sr * 1.0))),
+             ('impulse:level=-6', impulse(sr, 1.0, -6.0)),
+             ('sweep:seconds=4,level=-6', sweep(sr, 4.0, -6.0)[0])]
+    parts += [(f'sine:f0=997,level={lv}', tone(sr, 2.0, 997.0, lv)) for lv in SUITE_LEVELS]
+    out, cues, pos = [], [], 0
+    for label, x in parts:
+        cues.append((pos, len(x), label))
+        out += [x, np.zeros(int(sr * gap))]
+        pos += len(x) + int(sr * gap)
+    return np.concatenate(out), cues
+
+
+def _suite_one(job):
+    """Worker: one segment of a render -> one row. Never raises."""
+    path, start, stop, length, label = job
+    kind, params = parse_spec(label, SUITE_KINDS)
+    row = {'file': path, 'segment': label, 'kind': kind, 'start': start}
+    try:
+        w = Wav(path)
+        sr = w.sr
+        if kind == 'silence':
+            x = mono(w.read(start, start + length))
+            row['noise_db'] = float(db(math.sqrt(float(np.mean(x * x))) if len(x) else 0.0))
+            row['noise_peak_db'] = float(db(np.max(np.abs(x)) if len(x) else 0.0))
+        elif kind == 'impulse':
+            seg = w.segment(start, stop)
+            row.update(flatten(measure_response(seg, seconds=(stop - start) / sr), 'response.'))
+            row.update(flatten(measure_decay(seg), 'decay.'))
+        elif kind == 'sweep':
+            y = mono(w.read(start, stop))
+            secs, level = params.get('seconds', 4.0), params.get('level', -6.0)
+            tail = (stop - start) / sr - secs - 0.01
+            _, irs = deconvolve_sweep(y, sr, secs, level, tail=tail)
+            # the same deconvolution of the bare stimulus: what a wire reads
+            x = np.zeros(len(y))
+            x[:int(sr * secs)] = sweep(sr, secs, level)[0][:len(y)]
+            _, wire = deconvolve_sweep(x, sr, secs, level, tail=tail)
+            for name, hs in (('h{}_db', irs), ('h{}_floor_db', wire)):
+                lin = float(np.dot(hs[0], hs[0])) or 1.0
+                row.update({name.format(k): 10 * math.log10(max(float(np.dot(h, h)), 1e-30) / lin)
+                            for k, h in enumerate(hs[1:], 2)})
+            row.update(flatten(measure_response(Wav.from_array(irs[0], sr)), 'response.'))
+        elif kind == 'sine':
+            r = measure_thd(w.segment(start, start + length), params.get('f0', 997.0))
+            row.update(flatten(r))
+    except (OSError, ValueError) as e:
+        row['error'] = str(e)
+    return row
+
+
+def analyze_suite(path, stimulus=None, max_shift=8192, jobs=None):
+    """Render of a gen --suite file -> (latency, one row per segment).
+
+    Segment boundaries come from the render's cue regions if it kept them,
+    else from the stimulus. The whole render is aligned to the stimulus once
+    and every boundary shifted by that latency; the segments are then
+    measured in parallel.
+    """
+    w = Wav(path)
+    cues = w.cues
+    shift = 0
+    if stimulus:
+        s = Wav(stimulus)
+        if s.sr != w.sr:
+            raise ValueError(f'sample rates differ: {s.sr} vs {w.sr}')
+        cues = cues or s.cues
+    regions = [c for c in cues if c[1]]
+    if not regions:
+        raise ValueError(f'{path}: no suite regions (pass --stimulus <the gen --suite file>)')
+    if stimulus:
+        # Align on the broadband segments only: the sines carry most of the
+        # energy, and a sine correlates equally well a whole period out.
+        broad = [c for c in regions if c[2].split(':')[0] in ('impulse', 'sweep')] or regions
+        lo, hi = broad[0][0], broad[-1][0] + broad[-1][1]
+        shift = align(s.segment(lo, hi), w.segment(lo, hi + max_shift), max_shift, gain=False)[0]
+
+    bounds = [c[0] for c in regions[1:]] + [len(w) - shift]
+    jobs_ = [(path, f + shift, stop + shift, length, label)
+             for (f, length, label), stop in zip(regions, bounds)]
+    with _pool(jobs) as ex:
+        return shift, list(ex.map(_suite_one, jobs_))
+
+
+def cmd_analyze_suite(a):
+    try:
+        shift, rows = analyze_suite(a.file, a.stimulus, a.max_shift, a.jobs)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f'  latency {shift:+d} sample(s), {len(rows)} segments')
+    for r in rows:
+        print(f'\n  [{r["segment"]}]')
+        if 'error' in r:
+            print(f'    failed: {r["error"]}')
+        elif r['kind'] == 'silence':
+            print(f'    noise floor     {r["noise_db"]:8.2f} dBFS RMS, peak {r["noise_peak_db"]:.2f}')
+        elif r['kind'] == 'sine':
+            print(f'    THD {r["thd_pct"]:8.3f} %   aliasing / IMD {r["alias_pct"]:8.3f} %'
+                  f'   fundamental {r["fund_db"]:.2f} dB')
+        else:
+            if r['kind'] == 'impulse':
+                t20, t30 = r['decay.t20'], r['decay.t30']
+                print(f'    T20 {t20:.3f} s' if t20 else '    T20 unavailable',
+                      f'  T30 {t30:.3f} s' if t30 else '  T30 unavailable')
+            else:
+                hs = [k[:-3] for k in r if k.startswith('h') and k.endswith('_db')
+                      and not k.endswith('_floor_db')]
+                print('    ' + '  '.join(f'{k} {r[k + "_db"]:.1f}' for k in hs)
+                      + ' dB  (re linear; floor on the stimulus '
+                      + ' '.join(f'{r[k + "_floor_db"]:.0f}' for k in hs) + ')')
+            pts = {k[len('response.db.'):]: v for k, v in r.items()
+                   if k.startswith('response.db.')}
+            print('    ' + '  '.join(f'{f}:{v:.1f}' for f, v in pts.items()))
+    if a.out:
+        write_rows(rows, a.out)
+        print(f'\n  every number -> {a.out}')
+
+
+# ---------------------------------------------------------------- baselines
+# "A result you can keep and compare against next month's build" needs
+# somewhere to keep it. A baseline is a named snapshot of batch or
+# analyze-suite rows in one SQLite file, stored long-form -- one row per
+# (item, measurement, metric) -- so any new column is just more rows.
+# The item is the render's file name without extension, which is where
+# plugin and setting live (oj95_drive7.wav), so renders can move between
+# directories from one month to the next and still match.
+
+BASELINE_DB = 'lms_baselines.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS baselines (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, created REAL, source TEXT);
+CREATE TABLE IF NOT EXISTS vals (
+    baseline INTEGER NOT NULL REFERENCES baselines(id) ON DELETE CASCADE,
+    item TEXT NOT NULL, measure TEXT NOT NULL, metric TEXT NOT NULL, value REAL,
+    PRIMARY KEY (baseline, item, measure, metric)) WITHOUT ROWID;
+"""
+
+# (metric glob, absolute, relative): first match wins. A change is a
+# regression when |new - old| > absolute + relative * |old|.
+TOLERANCES = [('*thd*pct', 0.001, 0.10), ('*alias*pct', 0.001, 0.10),
+              ('*error_pct', 2.0, 0.0), ('*t20', 0.0, 0.05), ('*t30', 0.0, 0.05),
+              ('harmonics.*', 1.0, 0.0), ('*db*', 0.5, 0.0), ('*', 0.0, 0.01)]
+
+# (metric glob, dB): levels under the floor on both sides are noise, where
+# run-to-run jitter exceeds any fixed tolerance, and are not compared.
+FLOORS = [('harmonics.*', -120.0), ('h?_db', -120.0), ('h?_floor_db', -120.0)]
+
+_NOT_METRICS = {'file', 'measure', 'segment', 'kind', 'error', 'start'}
+
+
+def read_rows(path):
+    """Rows back from a batch/analyze-suite .jsonl or .csv."""
+    with open(path, newline='') as fh:
+        if path.lower().endswith('.csv'):
+            return list(csv.DictReader(fh))
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def row_values(rows):
+    """Rows -> [(item, measure, metric, value)], numeric leaves only.
+
+    measure carries its parameters ('thd:f0=997'), so the same file measured
+    two ways is two measurements. Rows that failed are skipped.
+    """
+    out = []
+    for r in rows:
+        if r.get('error'):
+            continue
+        item = os.path.splitext(os.path.basename(r.get('file', '')))[0]
+        params = ','.join(f'{k[6:]}={v}' for k, v in r.items() if k.startswith('param.'))
+        measure = r.get('measure') or r.get('segment') or ''
+        measure = f'{measure}:{params}' if params else measure
+        for k, v in r.items():
+            if k in _NOT_METRICS or k.startswith('param.'):
+                continue
+            try:
+                v = float(v) if v not in (None, '') else None
+            except (TypeError, ValueError):
+                continue
+            out.append((item, measure, k, v))
+    return out
+
+
+def baseline_db(path=BASELINE_DB):
+    con = sqlite3.connect(path)
+    con.execute('PRAGMA foreign_keys = ON')
+    con.executescript(SCHEMA)
+    return con
+
+
+def baseline_save(con, name, rows, source=''):
+    """Store rows as baseline `name`, replacing one of that name. -> count."""
+    vals = row_values(rows)
+    with con:
+        con.execute('DELETE FROM baselines WHERE name = ?', (name,))
+        bid = con.execute('INSERT INTO baselines (name, created, source) VALUES (?, ?, ?)',
+                          (name, time.time(), source)).lastrowid
+        con.executemany('INSERT OR REPLACE INTO vals VALUES (?, ?, ?, ?, ?)',
+                        ((bid,) + v for v in vals))
+    return len(vals)
+
+
+def _tolerances(metrics, extra=()):
+    """Unique metric names -> (absolute, relative) arrays, one lookup each."""
+    rules = list(extra) + TOLERANCES
+    tol = [next((a, r) for pat, a, r in rules if fnmatch.fnmatchcase(m, pat)) for m in metrics]
+    return np.array([t[0] for t in tol]), np.array([t[1] for t in tol])
+
+
+def compare(con, name, rows, extra=()):
+    """New rows against baseline `name`.
+
+    -> (regressions [(item, measure, metric, old, new)], compared, missing)
+
+    The join runs in SQLite and the tolerance test is one vectorised
+    comparison over every matched value. Values under their FLOORS level
+    in both are not compared. A value that has appeared or vanished (None
+    on one side only) counts as a regression too.
+    """
+    row = con.execute('SELECT id FROM baselines WHERE name = ?', (name,)).fetchone()
+    if row is None:
+        raise ValueError(f'no baseline named {name!r}')
+    con.execute('CREATE TEMP TABLE IF NOT EXISTS new '
+                '(item TEXT, measure TEXT, metric TEXT, value REAL)')
+    with con:
+        con.execute('DELETE FROM temp.new')
+        con.executemany('INSERT INTO temp.new VALUES (?, ?, ?, ?)', row_values(rows))
+    joined = con.execute(
+        'SELECT v.item, v.measure, v.metric, v.value, n.value FROM vals v '
+        'JOIN temp.new n USING (item, measure, metric) WHERE v.baseline = ? '
+        'ORDER BY v.item, v.measure, v.metric', row).fetchall()
+    missing = con.execute(
+        'SELECT COUNT(*) FROM vals v WHERE v.baseline = ? AND NOT EXISTS '
+        '(SELECT 1 FROM temp.new n WHERE n.item = v.item AND n.measure = v.measure '
+        'AND n.metric = v.metric)', row).fetchone()[0]
+    if not joined:
+        return [], 0, missing
+
+    metric = np.array([j[2] for j in joined])
+    old = np.array([np.nan if j[3] is None else j[3] for j in joined])
+    new = np.array([np.nan if j[4] is None else j[4] for j in joined])
+    names, inv = np.unique(metric, return_inverse=True)
+    t_abs, t_rel = _tolerances(names, extra)
+    floor = np.array([next((f for pat, f in FLOORS if fnmatch.fnmatchcase(m, pat)), -np.inf)
+                      for m in names])[inv]
+    with np.errstate(invalid='ignore'):
+        bad = np.abs(new - old) > t_abs[inv] + t_rel[inv] * np.abs(old)
+        bad &= ~((old < floor) & (new < floor))
+    bad |= np.isnan(old) != np.isnan(new)
+    return [joined[i] for i in np.flatnonzero(bad)], len(joined), missing
+
+
+def parse_tol(text):
+    """'db.*=1' (absolute) or 'thd_pct=5%' (relative) -> (glob, abs, rel)."""
+    pat, _, val = text.rpartition('=')
+    if not pat:
+        raise ValueError(f'{text}: expected metric-glob=value[%]')
+    if val.endswith('%'):
+        return pat, 0.0, float(val[:-1]) / 100
+    return pat, float(val), 0.0
+
+
+def cmd_baseline(a):
+    con = baseline_db(a.db)
+    if a.action == 'save':
+        if not a.name or not a.files:
+            sys.exit('baseline save NAME RESULTS...')
+        rows = [r for f in a.files for r in read_rows(f)]
+        n = baseline_save(con, a.name, rows, ' '.join(a.files))
+        print(f'  baseline {a.name!r}: {n} values from {len(rows)} rows -> {a.db}')
+    elif a.action == 'drop':
+        with con:
+            gone = con.execute('DELETE FROM baselines WHERE name = ?', (a.name,)).rowcount
+        print(f'  dropped {a.name!r}' if gone else f'  no baseline named {a.name!r}')
+    else:
+        for name, created, source, n in con.execute(
+                'SELECT name, created, source, (SELECT COUNT(*) FROM vals WHERE baseline = b.id) '
+                'FROM baselines b ORDER BY created'):
+            print(f'  {name:<24} {time.strftime("%Y-%m-%d %H:%M", time.localtime(created))}'
+                  f'  {n:>8} values  {source}')
+
+
+def cmd_compare(a):
+    con = baseline_db(a.db)
+    try:
+        extra = [parse_tol(t) for t in a.tol]
+        rows = [r for f in a.results for r in read_rows(f)]
+        bad, compared, missing = compare(con, a.baseline, rows, extra)
+    except (ValueError, OSError) as e:
+        sys.exit(str(e))
+    if bad:
+        print(f'  {"item":<28} {"measure":<22} {"metric":<18} {"baseline":>11} {"now":>11}')
+    for item, measure, metric, old, new in bad:
+        fmt = lambda v: f'{v:>11.4g}' if v is not None else f'{"-":>11}'
+        print(f'  {item:<28} {measure:<22} {metric:<18} {fmt(old)} {fmt(new)}')
+    print(f'  {compared} values compared against {a.baseline!r}: '
+          f'{len(bad)} out of tolerance'
+          f'{f", {missing} in the baseline but not measured" if missing else ""}')
+    sys.exit(1 if bad else 0)
+
+
+# ---------------------------------------------------------------- cache command
+
+def cmd_cache(a):
+    if CACHE is None:
+        sys.exit('the cache is off (--no-cache)')
+    entries = CACHE.entries()
+    if a.clear:
+        for _, _, path in entries:
+            os.remove(path)
+        print(f'  cleared {len(entries)} entries from {CACHE.root}')
+        return
+    total = sum(sz for _, sz, _ in entries)
+    print(f'  {CACHE.root}')
+    print(f'  {len(entries)} entries, {total / 1048576:.1f} of {CACHE.limit / 1048576:.0f} MB')
+    if entries:
+        print(f'  least recently used {time.ctime(entries[0][0])}')
 
 
 # ---------------------------------------------------------------- main
@@ -321,6 +1605,11 @@ def cmd_thd(a):
 def main():
     p = argparse.ArgumentParser(description=__doc__,
                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--cache', default=os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'lms_measure'),
+        help='result cache directory (default ~/.cache/lms_measure)')
+    p.add_argument('--cache-mb', type=float, default=512, help='cache size limit (default 512)')
+    p.add_argument('--no-cache', action='store_true', help='measure everything afresh')
     sub = p.add_subparsers(dest='cmd', required=True)
 
     g = sub.add_parser('gen', help='write a test signal to render through REAPER')
@@ -328,6 +1617,9 @@ def main():
     g.add_argument('--impulse', action='store_true')
     g.add_argument('--sweep', action='store_true')
     g.add_argument('--silence', action='store_true')
+    g.add_argument('--suite', action='store_true',
+                   help='everything in one file, segments marked by cue regions')
+    g.add_argument('--gap', type=float, default=2.0, help='--suite: silence after each segment')
     g.add_argument('--level', type=float, default=-6.0, help='dBFS peak (default -6)')
     g.add_argument('--seconds', type=float, default=4.0)
     g.add_argument('--rate', type=int, default=48000)
@@ -337,25 +1629,86 @@ def main():
     n = sub.add_parser('null', help='A vs B: what is left is what changed')
     n.add_argument('a'); n.add_argument('b')
     n.add_argument('--max-shift', type=int, default=512, help='latency search, samples')
+    n.add_argument('--no-gain', action='store_true', help='do not level-match B to A')
     n.set_defaults(func=cmd_null)
 
     r = sub.add_parser('response', help='magnitude response from a rendered impulse')
     r.add_argument('file')
-    r.add_argument('--csv', help='write the full curve here')
+    r.add_argument('--csv', help='write the full curve here (.csv, or .npy for binary)')
+    r.add_argument('--smooth', type=float, help='1/N-octave smoothing, e.g. 3, 6, 12, 24')
+    r.add_argument('--points', type=int,
+                   help='--csv on a log-frequency grid of this many points (512 if smoothing)')
     r.add_argument('--window', action='store_true', help='window before the FFT')
+    r.add_argument('--seconds', type=float, default=10.0,
+                   help='impulse length to analyse (default 10)')
     r.set_defaults(func=cmd_response)
 
     d = sub.add_parser('decay', help='RT60 from a rendered impulse')
     d.add_argument('file')
-    d.add_argument('--expect', type=float, help='predicted RT60 in seconds, to compare')
+    d.add_argument('--expect', help='predicted RT60 in seconds, or per band: 125=1.4,500=1.1')
+    d.add_argument('--bands', choices=('octave', 'third'), help='also EDT/T20/T30/C80 per band')
+    d.add_argument('--seconds', type=float, default=10.0,
+                   help='--bands: impulse length to filter (default 10)')
     d.set_defaults(func=cmd_decay)
 
     t = sub.add_parser('thd', help='harmonic distortion and aliasing, separately')
     t.add_argument('file')
     t.add_argument('--f0', type=float, default=997.0)
+    t.add_argument('--stream', action='store_true',
+                   help='whole file, frame by frame: THD over time plus a Welch average')
+    t.add_argument('--frame', type=int, default=16384, help='--stream frame length')
+    t.add_argument('--overlap', type=float, default=0.5, help='--stream frame overlap (0..1)')
+    t.add_argument('--csv', help='--stream: write every frame here')
     t.set_defaults(func=cmd_thd)
 
+    v = sub.add_parser('deconvolve', help='rendered sweep -> linear and harmonic IRs')
+    v.add_argument('file')
+    v.add_argument('--ref', help='the dry sweep as fed to REAPER (default: regenerate it)')
+    v.add_argument('--seconds', type=float, default=4.0, help='sweep length, as given to gen')
+    v.add_argument('--level', type=float, default=-6.0, help='sweep level, as given to gen')
+    v.add_argument('--harmonics', type=int, default=5, help='split out h2..hN (default 5)')
+    v.add_argument('--tail', type=float, default=2.0, help='linear IR length, seconds')
+    v.add_argument('--out', help='output prefix (default: the render, minus .wav)')
+    v.set_defaults(func=cmd_deconvolve)
+
+    s = sub.add_parser('analyze-suite', help='measure every segment of a rendered --suite')
+    s.add_argument('file')
+    s.add_argument('--stimulus', help='the gen --suite file fed to REAPER')
+    s.add_argument('--max-shift', type=int, default=8192, help='latency search, samples')
+    s.add_argument('--out', help='also write the rows, .csv or .jsonl')
+    s.add_argument('--jobs', type=int, help='worker processes (default: all cores)')
+    s.set_defaults(func=cmd_analyze_suite)
+
+    b = sub.add_parser('batch', help='measure many files in parallel, write a table')
+    b.add_argument('inputs', nargs='*', help='files or globs (** recurses)')
+    b.add_argument('--manifest', help='text file, one path per line (relative to it)')
+    b.add_argument('-m', '--measure', action='append', required=True,
+                   help='name[:key=val,...], e.g. thd:f0=997, null:ref=dry.wav; repeatable')
+    b.add_argument('--out', help='.csv or .jsonl (default: JSON lines to stdout)')
+    b.add_argument('--jobs', type=int, help='worker processes (default: all cores)')
+    b.set_defaults(func=cmd_batch)
+
+    bl = sub.add_parser('baseline', help='keep batch results under a name')
+    bl.add_argument('action', choices=('save', 'list', 'drop'))
+    bl.add_argument('name', nargs='?')
+    bl.add_argument('files', nargs='*', help='batch / analyze-suite output, .jsonl or .csv')
+    bl.add_argument('--db', default=BASELINE_DB, help=f'baseline store (default {BASELINE_DB})')
+    bl.set_defaults(func=cmd_baseline)
+
+    cp = sub.add_parser('compare', help='new results against a baseline: regressions only')
+    cp.add_argument('baseline')
+    cp.add_argument('results', nargs='+', help='batch / analyze-suite output, .jsonl or .csv')
+    cp.add_argument('--tol', action='append', default=[],
+                    help="metric-glob=abs or =rel%%, e.g. 'db.*=1' 'thd_pct=5%%'; repeatable")
+    cp.add_argument('--db', default=BASELINE_DB, help=f'baseline store (default {BASELINE_DB})')
+    cp.set_defaults(func=cmd_compare)
+
+    c = sub.add_parser('cache', help='show or clear the result cache')
+    c.add_argument('--clear', action='store_true')
+    c.set_defaults(func=cmd_cache)
+
     a = p.parse_args()
+    _set_cache(None if a.no_cache else a.cache, a.cache_mb)
     a.func(a)
 
 
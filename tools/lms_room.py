@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""Black In Bluhm's room, offline.
+
+lms_room.jsfx turns the room sliders into early reflections and a Sabine
+RT60, and from those into the delays, feedback and damping of a four-line
+FDN. Whether that FDN meets the RT60 it is given could only be checked one
+REAPER render at a time. This derives the same parameters from the sliders
+and the material table (read out of lms_room.jsfx), renders the wet impulse
+response of many rooms at once with block-processed delay lines, and
+measures each one as lms_measure.py decay would:
+
+    python tools/lms_room.py params --set width=8 --set wall=concrete
+    python tools/lms_room.py render room.wav --set walls=6 --set floor=carpet
+    python tools/lms_measure.py decay room.wav --bands octave
+    python tools/lms_room.py sweep --rooms 2000 --csv rooms.csv
+
+Commands
+    params   what @block derives for one room: taps, RT60, FDN
+    render   one room's impulse response as a WAV
+    sweep    random rooms -> predicted RT60 against the measured T30
+
+A room is the sliders by name, each --set KEY=VALUE: walls, width, depth,
+height, wall, floor, ceiling (a material by name or number), src_x, src_y,
+src_angle, mic_x, mic_y, mic_angle, pattern (omni, cardioid, figure-8,
+hypercardioid) and tail (%). Unset sliders keep the plugin's defaults in
+params and render; sweep draws all but tail at random. --late measures the
+FDN's output alone, the early taps left out of the mix: how far the tail
+itself is from the RT60, rather than the room as heard.
+
+What is modelled is Single mode's wet path at 100% mix once the 30 ms
+smoothing has settled: the direct, first-order, floor and ceiling taps
+through the cubic read and the 1 kHz two-band split, wet_norm, the four
+allpasses, the FDN, the 30 Hz high-pass and the +-4 clip. The compressor
+and Room Juice are off, as they are by default.
+
+The FDN is the one @block designs: line i is fdn_d_i samples long (rounded;
+the lines have no fractional read), behind the Hadamard matrix, the damping
+one-pole and its own fdn_fb_i. lms_room.jsfx as shipped never allocates the
+lines. FDN_LEN0-3, FDN_MAX and fdn_buf0-3 are never assigned, so all four
+lines are address 0, the head of delay_buf. fdn_fb comes out of @slider as
+exp(0) = 1, and every sample leaves the diffused input alone in that one
+cell. The late output is then 2 * fdn_late_gain times the input one sample
+late: no tail. --as-shipped renders that instead (less the one sample in
+32768 where delay_buf's own write lands on the same cell).
+"""
+import argparse, csv, math, os, re, sys, time
+import numpy as np
+
+from lms_measure import schroeder_times, wav_write
+from lms_filters import bq_hp, sosfilt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN = os.path.join(ROOT, 'lms_room.jsfx')
+SPEED = 343.0                   # SPEED_OF_SOUND
+AIR_LO = 0.003 * 0.3            # AIR_ABS_COEFF * 0.3
+AIR_HI = 0.003 * 1.5
+MARGIN = 0.15                   # room_margin
+EAR = 2.4                       # source + mic height: both 1.2 m off the floor
+MAX_DELAY = 32768 - 4           # DELAY_BUF_SIZE - 4
+TAP_FLOOR = 0.00001             # @sample skips taps quieter than this
+XOVER_HZ = 1000.0
+AP_LEN = (113, 167, 211, 263)
+AP_G = 0.5
+FDN_IN = 0.06                   # fdn_in = (wet_l + wet_r) * 0.06
+FDN_BLOCK = 128                 # samples per FDN step, at most the shortest line
+HADAMARD = 0.5 * np.array([[1, 1, 1, 1], [1, -1, 1, -1], [1, 1, -1, -1], [1, -1, -1, 1]])
+CLIP = 4.0
+CHUNK = 1 << 22                 # rooms x samples rendered together
+PATTERNS = ('omni', 'cardioid', 'figure-8', 'hypercardioid')
+
+# slider defaults, and the ranges sweep draws from (tail stays at its default)
+DEFAULTS = {'walls': 4, 'width': 5.0, 'depth': 4.0, 'height': 2.8,
+            'wall': 2, 'floor': 1, 'ceiling': 0,
+            'src_x': 2.5, 'src_y': 1.0, 'src_angle': 0.0,
+            'mic_x': 2.5, 'mic_y': 3.0, 'mic_angle': 180.0,
+            'pattern': 1, 'tail': 50.0}
+LIMITS = {'walls': (3, 12), 'width': (2.0, 15.0), 'depth': (2.0, 15.0),
+          'height': (2.0, 6.0), 'wall': (0, 7), 'floor': (0, 7), 'ceiling': (0, 7),
+          'src_angle': (-180.0, 180.0), 'mic_angle': (-180.0, 180.0),
+          'pattern': (0, 3)}
+WHOLE = ('walls', 'wall', 'floor', 'ceiling', 'pattern')
+
+
+# ---------------------------------------------------------------- room
+
+def materials(path=PLUGIN):
+    """(names, absorption float [8, 4]: lo, mid, hi, air) from the Wall
+    Material slider and the mat_table writes in @init."""
+    with open(path, encoding='utf-8', errors='replace') as fh:
+        src = fh.read()
+    names = re.search(r'^slider5:[^{]*\{([^}]*)\}', src, re.M).group(1).split(',')
+    table = np.full(len(names) * 4, np.nan)
+    for i, v in re.findall(r'mat_table\[(\d+)\]\s*=\s*([\d.]+);', src):
+        table[int(i)] = float(v)
+    if np.isnan(table).any():
+        raise ValueError(f'{path}: mat_table does not cover {len(names)} materials')
+    return [n.strip().lower() for n in names], table.reshape(-1, 4)
+
+
+def parse_room(sets, names, base=DEFAULTS):
+    """['width=8', 'wall=concrete', ...] -> slider dict over `base`."""
+    room = dict(base)
+    for s in sets:
+        key, _, text = s.partition('=')
+        key, text = key.strip(), text.strip().lower()
+        if key not in DEFAULTS:
+            raise ValueError(f'{key}: not a room slider ({", ".join(DEFAULTS)})')
+        choices = names if key in ('wall', 'floor', 'ceiling') else \
+            PATTERNS if key == 'pattern' else None
+        if choices and not text.lstrip('-').isdigit():
+            hits = [i for i, n in enumerate(choices) if n.startswith(text)]
+            if len(hits) != 1:
+                raise ValueError(f'{key}={text}: one of {", ".join(choices)}')
+            room[key] = hits[0]
+        else:
+            room[key] = int(text) if key in WHOLE else float(text)
+    return room
+
+
+def polygon(walls, width, depth):
+    """-> (start [walls, 2], end [walls, 2], outward normal [walls, 2],
+    length [walls]), as build_polygon: the rectangle, or `walls` points on
+    the ellipse the rectangle bounds."""
+    c = np.array([width, depth]) * 0.5
+    if walls == 4:
+        p = np.array([[0.0, 0.0], [width, 0.0], [width, depth], [0.0, depth]])
+    else:
+        a = np.arange(walls) * (2 * math.pi / walls)
+        p = c + c * np.stack([np.cos(a), np.sin(a)], axis=-1)
+    q = np.roll(p, -1, axis=0)
+    d = q - p
+    ln = np.maximum(np.hypot(d[:, 0], d[:, 1]), 0.001)
+    n = np.stack([-d[:, 1], d[:, 0]], axis=-1) / ln[:, None]
+    mid = (p + q) * 0.5
+    inward = ((mid + n * 0.01 - c) ** 2).sum(axis=1) < ((mid - c) ** 2).sum(axis=1)
+    n[inward] *= -1
+    return p, q, n, ln
+
+
+def place(x, y, poly, width, depth):
+    """A source or mic position as @block leaves it: inside the bounding box
+    by room_margin, then pulled toward the centre until it is inside every
+    wall by the same margin (at most 16 steps)."""
+    x = max(MARGIN, min(width - MARGIN, x))
+    y = max(MARGIN, min(depth - MARGIN, y))
+    p, _, n, _ = poly
+    for _ in range(16):
+        if (((x, y) - p) * n).sum(axis=1).max() <= -MARGIN:
+            break
+        x, y = x * 0.85 + width * 0.075, y * 0.85 + depth * 0.075
+    return x, y
+
+
+def _wrap(a):
+    """One step into +-pi, as the plugin does it."""
+    return a - 2 * math.pi if a > math.pi else a + 2 * math.pi if a < -math.pi else a
+
+
+def mic_gain(arrival, mic_a, pattern):
+    rel = _wrap(arrival - mic_a)
+    return (1.0, max(0.0, 0.5 * (1 + math.cos(rel))), math.cos(rel),
+            max(0.0, 0.25 + 0.75 * math.cos(rel)))[pattern]
+
+
+def source_gain(emission, src_a):
+    return 0.5 + 0.5 * math.cos(_wrap(emission - src_a))
+
+
+def prox_boost(dist, pattern):
+    return 1.0 if pattern == 0 else min(1 + (1.5 if pattern == 2 else 0.8) / max(0.3, dist), 4.0)
+
+
+def params(room, sr, mats):
+    """Everything @block derives from the sliders -> dict.
+
+    taps float [T, 5] (delay in samples, lo_l, lo_r, hi_l, hi_r) are the
+    direct, first-order, floor and ceiling slots @sample plays; wet_norm,
+    rt60, fdn_d [4], fdn_fb [4], fdn_damp and fdn_late_gain as @block sets
+    them; src and mic where the clamp put them.
+    """
+    names, table = mats
+    lo_refl = 1 - table[:, :2].mean(axis=1)                 # mat_lo_refl
+    hi_refl = 1 - table[:, 2:].mean(axis=1)
+    avg_abs = table.mean(axis=1)                            # mat_avg_abs
+    nw, W, D, H = int(room['walls']), room['width'], room['depth'], room['height']
+    wall, floor, ceil, pat = int(room['wall']), int(room['floor']), int(room['ceiling']), int(room['pattern'])
+    poly = polygon(nw, W, D)
+    sx, sy = place(room['src_x'], room['src_y'], poly, W, D)
+    mx, my = place(room['mic_x'], room['mic_y'], poly, W, D)
+    src_a, mic_a = math.radians(room['src_angle']), math.radians(room['mic_angle'])
+
+    slots = []
+
+    def refl(dist, lo, hi, pan):
+        delay = min(dist / SPEED * sr, MAX_DELAY)
+        slots.append((delay, max(abs(lo), abs(hi)), lo * (1 - pan), lo * pan,
+                      hi * (1 - pan), hi * pan))
+
+    # direct
+    dist = max(math.hypot(mx - sx, my - sy), 0.01)
+    arrival = math.atan2(my - sy, mx - sx)
+    base = mic_gain(arrival + math.pi, mic_a, pat) * source_gain(arrival, src_a) / dist
+    refl(dist, base * math.exp(-AIR_LO * dist) * prox_boost(dist, pat),
+         base * math.exp(-AIR_HI * dist), 0.5)
+
+    # first order: the source mirrored in each wall, heard if the path
+    # from the mic to the image crosses that wall
+    p, q, _, ln = poly
+    for (ax, ay), (bx, by) in zip(p, q):
+        dx, dy = bx - ax, by - ay
+        t = ((sx - ax) * dx + (sy - ay) * dy) / max(dx * dx + dy * dy, 0.0001)
+        ix, iy = 2 * (ax + t * dx) - sx, 2 * (ay + t * dy) - sy
+        ex, ey = ix - mx, iy - my
+        denom = ex * dy - ey * dx
+        if abs(denom) < 1e-10:
+            continue
+        s = ((ax - mx) * dy - (ay - my) * dx) / denom
+        u = ((ax - mx) * ey - (ay - my) * ex) / denom
+        if not (-0.001 <= s <= 1.001 and -0.001 <= u <= 1.001):
+            continue
+        dist = max(math.hypot(ex, ey), 0.01)
+        arrival = math.atan2(my - iy, mx - ix)
+        emission = math.atan2(iy - sy, ix - sx)
+        base = mic_gain(arrival + math.pi, mic_a, pat) * source_gain(emission, src_a) / dist
+        refl(dist, base * lo_refl[wall] * math.exp(-AIR_LO * dist),
+             base * hi_refl[wall] * math.exp(-AIR_HI * dist),
+             0.5 + 0.4 * math.sin(_wrap(arrival + math.pi - mic_a)))
+
+    # floor and ceiling, source and mic both at ear height
+    horiz = math.hypot(mx - sx, my - sy)
+    arrival = math.atan2(my - sy, mx - sx)
+    for mat, rise in ((floor, EAR), (ceil, 2 * H - EAR)):
+        dist = math.hypot(horiz, rise)
+        if dist > 0.01 and dist / SPEED * sr < MAX_DELAY:
+            base = 0.8 / dist * mic_gain(arrival + math.pi, mic_a, pat)
+            refl(dist, base * lo_refl[mat] * math.exp(-AIR_LO * dist),
+                 base * hi_refl[mat] * math.exp(-AIR_HI * dist),
+                 0.5 + 0.3 * math.sin(_wrap(arrival + math.pi - mic_a)))
+
+    slots = np.array(slots)
+    power = float((slots[:, 1] ** 2).sum())
+    g = slots[:, 2:]
+    heard = (np.abs(g[:, 0]) + np.abs(g[:, 2]) > TAP_FLOOR) | (np.abs(g[:, 1]) + np.abs(g[:, 3]) > TAP_FLOOR)
+
+    # Sabine
+    volume = W * D * H
+    area = max(float((ln * H).sum()) * avg_abs[wall] + W * D * (avg_abs[floor] + avg_abs[ceil]), 0.01)
+    rt60 = min(10.0, max(0.05, 0.161 * volume / area))
+
+    fdn_d = np.array([W, D, math.hypot(W, D), 2 * H]) / SPEED * sr
+    fdn_fb = np.exp(-6.9078 * fdn_d / (sr * rt60)) if rt60 > 0.05 else np.zeros(4)
+    mats3 = [wall, floor, ceil]
+    ratio = hi_refl[mats3].mean() / max(0.01, lo_refl[mats3].mean())
+    return {'taps': slots[heard][:, [0, 2, 3, 4, 5]],
+            'wet_norm': 1 / math.sqrt(power) if power > 0.0001 else 1.0,
+            'rt60': rt60, 'volume': volume, 'area': area,
+            'fdn_d': fdn_d, 'fdn_fb': fdn_fb,
+            'fdn_damp': max(0.05, min(0.7, 0.15 + 0.5 * max(0.0, 1 - ratio))),
+            'fdn_late_gain': 0.35 * room['tail'] / 100 * min(1.5, rt60),
+            'src': (sx, sy), 'mic': (mx, my)}
+
+
+# ---------------------------------------------------------------- render
+
+def hermite(t):
+    """lms_interp_cubic's weights on x0..x3 at fraction t -> [..., 4]."""
+    t = np.asarray(t, dtype=np.float64)[..., None]
+    a = np.array([-0.5, 1.5, -1.5, 0.5])
+    b = np.array([1.0, -2.5, 2.0, -0.5])
+    c = np.array([-0.5, 0.0, 0.5, 0.0])
+    return ((a * t + b) * t + c) * t + np.array([0.0, 1.0, 0.0, 0.0])
+
+
+def early(ps, sr, n):
+    """Impulse through every room's taps -> wet float [R, 2, n], wet_norm
+    applied.
+
+    An impulse read at a fractional delay is the four Hermite weights around
+    it, so each tap is four samples placed with np.bincount. The per-tap
+    1 kHz one-pole is linear and the gains are constant, so
+    sum(LP(tap) * lo + (tap - LP(tap)) * hi) is one LP of sum(tap * (lo - hi))
+    plus sum(tap * hi): one filter per channel instead of one per tap.
+    """
+    R = len(ps)
+    room = np.concatenate([np.full(len(p['taps']), r) for r, p in enumerate(ps)])
+    taps = np.concatenate([p['taps'] for p in ps])
+    base = np.floor(-taps[:, 0])
+    w = hermite(-taps[:, 0] - base)                         # [T, 4] on x0..x3
+    at = (1 - np.arange(4))[None, :] - base[:, None]        # sample each weight lands on
+    keep = (at >= 0) & (at < n)
+    split = np.zeros((2, R * 2 * n))
+    for ch in (0, 1):
+        lo, hi = taps[:, 1 + ch], taps[:, 3 + ch]
+        idx = ((room * 2 + ch)[:, None] * n + at)[keep].astype(np.int64)
+        split[0] += np.bincount(idx, (w * (lo - hi)[:, None])[keep], R * 2 * n)
+        split[1] += np.bincount(idx, (w * hi[:, None])[keep], R * 2 * n)
+    c = math.exp(-2 * math.pi * XOVER_HZ / sr)
+    wet = sosfilt([1 - c, 0.0, 0.0, 1.0, -c, 0.0], split[0].reshape(R, 2, n)) \
+        + split[1].reshape(R, 2, n)
+    return wet * np.array([p['wet_norm'] for p in ps])[:, None, None]
+
+
+def allpass(x):
+    """The four series Schroeder allpasses, over [..., n], one line length
+    at a time: a block of L samples needs only the block before it."""
+    n = x.shape[-1]
+    for L in AP_LEN:
+        nb = -(-n // L)
+        X = np.zeros(x.shape[:-1] + (nb * L,))
+        X[..., :n] = x
+        X = X.reshape(x.shape[:-1] + (nb, L))
+        Y = np.empty_like(X)
+        v = np.zeros(x.shape[:-1] + (L,))
+        for k in range(nb):
+            Y[..., k, :] = v - AP_G * X[..., k, :]
+            v = X[..., k, :] + AP_G * Y[..., k, :]
+        x = Y.reshape(x.shape[:-1] + (nb * L,))[..., :n]
+    return x
+
+
+def fdn(x, lengths, fb, damp, block=FDN_BLOCK):
+    """Input [R, n] through each room's four lines -> (d0 + d2, d1 + d3)
+    as float [R, 2, n].
+
+    Block-processed: with the block no longer than the shortest line,
+    everything a block reads was written by earlier blocks, so a block is
+    one gather from the ring, one Hadamard product and one damping pass for
+    all rooms and lines together. The damping one-pole over a block is a
+    per-room lower-triangular matrix plus the carried state times damp^k.
+    """
+    R, n = x.shape
+    B = int(min(block, lengths.min()))
+    P = 1 << int(math.ceil(math.log2(lengths.max() + B)))
+    nb = -(-n // B)
+    X = np.zeros((R, nb * B))
+    X[:, :n] = x
+    k = np.arange(B)
+    lag = k[:, None] - k[None, :]
+    d = np.asarray(damp, dtype=np.float64)[:, None, None]
+    T = np.where(lag >= 0, (1 - d) * d ** np.maximum(lag, 0), 0.0)   # [R, B, B]
+    Tt = np.swapaxes(T, -1, -2)
+    carry = d[:, :, 0] ** (k + 1)                                     # [R, B]
+    fb = np.asarray(fb, dtype=np.float64)[..., None]
+    ring = np.zeros((R, 4, P))
+    lp = np.zeros((R, 4))
+    out = np.empty((R, 2, nb * B))
+    for s in range(0, nb * B, B):
+        taps = np.take_along_axis(ring, (s + k - lengths[..., None]) & (P - 1), axis=-1)
+        lpb = np.matmul(np.matmul(HADAMARD, taps), Tt) + lp[..., None] * carry[:, None, :]
+        ring[..., (s + k) & (P - 1)] = lpb * fb + X[:, None, s:s + B]
+        lp = lpb[..., -1]
+        out[:, 0, s:s + B] = taps[:, 0] + taps[:, 2]
+        out[:, 1, s:s + B] = taps[:, 1] + taps[:, 3]
+    return out[..., :n]
+
+
+def render(ps, sr, n, shipped=False, late_only=False):
+    """Impulse responses of rooms `ps` (from params) -> float [R, 2, n].
+    late_only leaves the early taps out of the output (they still feed the
+    FDN), for the decay of the tail by itself."""
+    wet = early(ps, sr, n)
+    x = allpass((wet[:, 0] + wet[:, 1]) * FDN_IN)
+    if shipped:
+        late = np.zeros_like(wet)
+        late[..., 1:] = 2 * x[:, None, :-1]
+    else:
+        lengths = np.maximum(1, np.rint([p['fdn_d'] for p in ps])).astype(np.int64)
+        late = fdn(x, lengths, [p['fdn_fb'] for p in ps], [p['fdn_damp'] for p in ps])
+    late *= np.array([p['fdn_late_gain'] for p in ps])[:, None, None]
+    wet = late if late_only else wet + late
+    return np.clip(sosfilt(bq_hp(30.0, 0.707, sr), wet), -CLIP, CLIP)
+
+
+def ir_length(p, sr, longest):
+    """Samples to render: half as long again as the predicted RT60, so a
+    T30 reads from the Schroeder curve well clear of the end."""
+    return int(min(longest, 1.5 * p['rt60'] + 0.2) * sr)
+
+
+def decay(ir, sr):
+    """[R, 2, n] -> schroeder_times of each mono mix from its peak, as
+    lms_measure.py decay reads the file, plus rt60 (T30, or T20 where the
+    render is too short for it) and the total energy."""
+    m = ir.mean(axis=1)
+    n = m.shape[-1]
+    at = np.argmax(np.abs(m), axis=1)[:, None] + np.arange(n)
+    e = np.where(at < n, np.take_along_axis(m, np.minimum(at, n - 1), axis=1), 0.0) ** 2
+    t = schroeder_times(e, sr)
+    t['energy'] = e.sum(axis=1)
+    t['rt60'] = np.where(np.isnan(t['t30']), t['t20'], t['t30'])
+    return t
+
+
+# ---------------------------------------------------------------- sweep
+
+def draw(rng, fixed):
+    """A random room: each unfixed slider uniform over its range, the source
+    and mic uniform over the room's bounding box."""
+    room = dict(DEFAULTS, **fixed)
+    for key, (lo, hi) in LIMITS.items():
+        room[key] = fixed[key] if key in fixed else \
+            int(rng.integers(lo, hi + 1)) if key in WHOLE else float(rng.uniform(lo, hi))
+    for key, dim in (('src_x', 'width'), ('src_y', 'depth'), ('mic_x', 'width'), ('mic_y', 'depth')):
+        room[key] = fixed[key] if key in fixed else \
+            float(rng.uniform(MARGIN, room[dim] - MARGIN))
+    return room
+
+
+def sweep(rooms, sr, mats, longest, shipped=False, late_only=False):
+    """-> (params list, measured dict of [R] arrays), rendering rooms of
+    similar length together, at most CHUNK samples at a time."""
+    ps = [params(r, sr, mats) for r in rooms]
+    lengths = np.array([ir_length(p, sr, longest) for p in ps])
+    order = np.argsort(lengths, kind='stable')
+    got = {}
+    i = 0
+    while i < len(order):
+        j = i + 1
+        while j < len(order) and (j - i + 1) * lengths[order[j]] <= CHUNK:
+            j += 1
+        n = lengths[order[j - 1]]
+        idx = order[i:j]
+        t = decay(render([ps[k] for k in idx], sr, n, shipped, late_only), sr)
+        for key, v in t.items():
+            got.setdefault(key, np.full(len(ps), np.nan))[idx] = v
+        i = j
+    return ps, got
+
+
+def room_args(room, names):
+    """The --set arguments that give `room`."""
+    out = []
+    for key, v in room.items():
+        if key in ('wall', 'floor', 'ceiling'):
+            v = names[v]
+        elif key == 'pattern':
+            v = PATTERNS[v]
+        out.append(f'--set {key}={v:.4g}' if isinstance(v, float) else f'--set {key}={v}')
+    return ' '.join(out)
+
+
+# ---------------------------------------------------------------- main
+
+def _room(a):
+    try:
+        mats = materials(a.plugin)
+        return parse_room(a.set, mats[0]), mats
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+
+
+def cmd_params(a):
+    room, mats = _room(a)
+    p = params(room, a.sr, mats)
+    names = mats[0]
+    print(f'  {room["walls"]} walls, {room["width"]:g} x {room["depth"]:g} x {room["height"]:g} m,'
+          f' {names[room["wall"]]} / {names[room["floor"]]} / {names[room["ceiling"]]},'
+          f' {PATTERNS[room["pattern"]]}')
+    print(f'  source  ({p["src"][0]:.2f}, {p["src"][1]:.2f})   mic  ({p["mic"][0]:.2f}, {p["mic"][1]:.2f})')
+    print(f'  Sabine  {p["volume"]:.1f} m3 / {p["area"]:.2f} m2 -> RT60 {p["rt60"]:.3f} s')
+    print()
+    print(f'  {"tap ms":>8} {"lo L":>8} {"lo R":>8} {"hi L":>8} {"hi R":>8}')
+    for d, *g in p['taps']:
+        print(f'  {d / a.sr * 1000:8.2f}' + ''.join(f' {v:8.4f}' for v in g))
+    print(f'  wet_norm {p["wet_norm"]:.4f}')
+    print()
+    print(f'  {"line":>8} {"samples":>8} {"ms":>8} {"fb":>8}')
+    for i, (d, fb) in enumerate(zip(p['fdn_d'], p['fdn_fb'])):
+        print(f'  {i:>8} {d:8.1f} {d / a.sr * 1000:8.2f} {fb:8.4f}')
+    print(f'  damp {p["fdn_damp"]:.3f}   late gain {p["fdn_late_gain"]:.3f}   at {a.sr} Hz')
+
+
+def cmd_render(a):
+    room, mats = _room(a)
+    p = params(room, a.sr, mats)
+    n = int(a.seconds * a.sr) if a.seconds else ir_length(p, a.sr, a.longest)
+    t0 = time.perf_counter()
+    ir = render([p], a.sr, n, a.as_shipped, a.late)
+    took = time.perf_counter() - t0
+    wav_write(a.out, ir[0].T, a.sr)
+    t = decay(ir, a.sr)
+    meas = t['rt60'][0]
+    print(f'  {n / a.sr:.2f} s at {a.sr} Hz in {took * 1000:.0f} ms -> {a.out}')
+    print(f'  predicted RT60 {p["rt60"]:.3f} s   measured '
+          + (f'{meas:.3f} s ({(meas - p["rt60"]) / p["rt60"] * 100:+.1f}%)'
+             if not np.isnan(meas) else 'unavailable (decay too short)'))
+
+
+def cmd_sweep(a):
+    try:
+        mats = materials(a.plugin)
+        fixed = parse_room(a.set, mats[0], {})
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    names = mats[0]
+    rng = np.random.default_rng(a.seed)
+    rooms = [draw(rng, fixed) for _ in range(a.rooms)]
+    t0 = time.perf_counter()
+    ps, got = sweep(rooms, a.sr, mats, a.longest, a.as_shipped, a.late)
+    took = time.perf_counter() - t0
+    pred = np.array([p['rt60'] for p in ps])
+    meas = got['rt60']
+    err = (meas - pred) / pred * 100
+    ok = ~np.isnan(err)
+    secs = sum(ir_length(p, a.sr, a.longest) for p in ps) / a.sr
+    print(f'  {len(ps)} rooms, {secs:.0f} s of impulse response at {a.sr} Hz in {took:.1f} s'
+          f' ({secs / max(took, 1e-9):.0f}x real time)'
+          + ('  [as shipped]' if a.as_shipped else '') + ('  [late only]' if a.late else ''))
+    silent = got['energy'] == 0
+    if silent.any():
+        print(f'  {int(silent.sum())} rooms silent: every tap in the mic\'s null')
+    if (~ok & ~silent).any():
+        print(f'  {int((~ok & ~silent).sum())} rooms never decayed 25 dB')
+
+    def row(label, m):
+        e = err[m & ok]
+        if not len(e):
+            return
+        p10, p50, p90 = np.percentile(e, (10, 50, 90))
+        print(f'  {label:<18} {len(e):>6} {p50:+8.1f} {p10:+8.1f} {p90:+8.1f} {np.abs(e).mean():8.1f}')
+
+    print()
+    print(f'  {"error %":<18} {"rooms":>6} {"median":>8} {"p10":>8} {"p90":>8} {"mean |e|":>8}')
+    row('all', ok)
+    print()
+    edges = (0.05, 0.3, 0.6, 1.2, 2.5, 5.0, 10.01)
+    for lo, hi in zip(edges, edges[1:]):
+        row(f'RT60 {lo:g}-{min(hi, 10):g} s', (pred >= lo) & (pred < hi))
+    for key in ('wall', 'floor', 'ceiling'):
+        print()
+        v = np.array([r[key] for r in rooms])
+        for i, name in enumerate(names):
+            row(f'{key} {name}', v == i)
+
+    if ok.any():
+        print()
+        print('  furthest off:')
+        for i in np.argsort(-np.abs(np.where(ok, err, 0)))[:a.worst]:
+            print(f'  {pred[i]:6.3f} s -> {meas[i]:6.3f} s ({err[i]:+6.1f}%)  {room_args(rooms[i], names)}')
+    if a.csv:
+        with open(a.csv, 'w', newline='') as fh:
+            w = csv.writer(fh)
+            w.writerow(list(DEFAULTS) + ['rt60', 'edt', 't20', 't30', 'c80', 'error_pct',
+                                         'fdn_damp', 'fdn_late_gain'])
+            for r, p, k in zip(rooms, ps, range(len(ps))):
+                w.writerow([r[key] for key in DEFAULTS]
+                           + [f'{v:.4f}' for v in (p['rt60'], got['edt'][k], got['t20'][k],
+                                                   got['t30'][k], got['c80'][k], err[k],
+                                                   p['fdn_damp'], p['fdn_late_gain'])])
+        print(f'  every room -> {a.csv}')
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    def common(s):
+        s.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                       help='a room slider (repeatable)')
+        s.add_argument('--sr', type=int, default=48000)
+        s.add_argument('--plugin', default=PLUGIN, help=argparse.SUPPRESS)
+
+    def rendering(s):
+        s.add_argument('--as-shipped', action='store_true',
+                       help='the late path as lms_room.jsfx runs it: FDN lines unallocated')
+        s.add_argument('--late', action='store_true',
+                       help='the FDN output alone, without the early taps')
+        s.add_argument('--longest', type=float, default=16.0,
+                       help='cap on the render length, seconds')
+
+    s = sub.add_parser('params', help='what @block derives for one room')
+    common(s)
+    s.set_defaults(func=cmd_params)
+
+    r = sub.add_parser('render', help='one room\'s impulse response as a WAV')
+    r.add_argument('out')
+    r.add_argument('--seconds', type=float, help='default: 1.5 x the predicted RT60 + 0.2')
+    common(r)
+    rendering(r)
+    r.set_defaults(func=cmd_render)
+
+    w = sub.add_parser('sweep', help='random rooms: predicted RT60 against measured')
+    w.add_argument('--rooms', type=int, default=500)
+    w.add_argument('--seed', type=int, default=0)
+    w.add_argument('--worst', type=int, default=5, help='rooms to list furthest off')
+    w.add_argument('--csv', help='write every room here')
+    common(w)
+    rendering(w)
+    w.set_defaults(func=cmd_sweep)
+
+    a = p.parse_args()
+    a.func(a)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""The lms_core saturators, offline, with their anti-aliasing as a choice.
+
+Of the saturation suite, only lms_sat_harmonics runs its nonlinearity
+through lms_adaa_eval. warm, hot, tape, rect and fuzz (lms_sat_da_proc)
+clip with a plain tanh per sample. Whether those should get ADAA,
+oversampling, or both is a question of alias suppressed per unit of CPU,
+and that is what this measures: each curve in every mode, on a sine,
+alias level from lms_measure's thd split against time per sample.
+
+    python tools/lms_sat.py table --sr 96000 --f0 2999
+    python tools/lms_sat.py render di.wav out.wav fuzz --mode adaa+os4 --drive 0.7
+
+Modes
+    plain         the curve sample by sample, as lms_sat_da_proc does it
+    adaa          first-order ADAA with lms_adaa_eval's crossfade zone
+    osN           N x oversampled (2, 4, 8): polyphase up, curve, polyphase down
+    adaa+osN      both
+
+What is reproduced is lms_sat_da_proc: the coupling-cap bias shift, drive
+and the density-driven drive boost, the asymmetric tanh and its ceilings,
+grid conduction, the Miller LP, the air shelf and the DC blocker. The
+4-band density tracker is not left at rest: on a 997 Hz sine the total
+envelope is some 16 times the low band's, so hd_density pins at 2.5 and the
+Miller LP sits at 8 kHz, and a mid density near 1 lifts the pre-clip gain
+by ~1.4. Both change the alias figure, so the tracker runs offline, once
+per signal, ahead of the stage: the drive boost goes in sample by sample,
+and the Miller cutoff and Q and the air shelf are held at their median over
+the signal -- on the table's tone, their steady state. The cap charge
+switches at b > 0.1 and aliases as surely as the curve, so it runs inside
+the stage at the oversampled rate. The grid conduction gate is taken as
+open. lms_sat_harmonics is reproduced whole.
+
+The times are numpy's, not EEL's, and leave the tracker out: it runs once
+at the base rate whatever the mode. The ratios between modes carry over
+(curve evaluations times N, plus the filter taps); the absolute numbers
+do not.
+"""
+import argparse, csv, glob, math, os, re, time
+import numpy as np
+
+from lms_measure import Wav, _thd_summary, bh4, db, wav_write
+from kit_prep import resample
+from lms_filters import bq_hishelf, bq_hp, bq_lp, dc, sosfilt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OS_HALF = 8                     # polyphase taps either side, at the base rate
+ADAA_LO, ADAA_HI = 0.00001, 0.0001   # lms_adaa_eval's crossfade zone
+MILLER_BASE_HZ = 8000.0         # miller_base_freq: the cutoff at full density
+SETTLE_S = 0.5                  # ten time constants of the DC blocker, before measuring
+
+# lms_sat_<name>: drive multiplier, pos_hard, neg_hard, pos_ceil, neg_ceil,
+# gc_thresh, gc_amount -- the arguments each passes to lms_sat_da_proc.
+CURVES = {
+    'warm': (1.0, 1.2, 0.9, 0.85, 1.00, 0.30, 0.15),
+    'hot':  (2.0, 1.8, 1.4, 0.75, 0.95, 0.25, 0.18),
+    'tape': (1.5, 0.8, 0.8, 0.95, 0.95, 0.35, 0.12),
+    'rect': (3.0, 2.0, 0.5, 0.70, 0.40, 0.20, 0.20),
+    'fuzz': (4.0, 2.5, 2.0, 0.60, 0.55, 0.15, 0.25),
+}
+SATURATORS = tuple(CURVES) + ('harmonics',)
+MODES = ('plain', 'adaa', 'os2', 'os4', 'os8', 'adaa+os2', 'adaa+os4', 'adaa+os8')
+
+
+# ---------------------------------------------------------------- curves
+# Each nonlinearity comes with its antiderivative, for ADAA.
+
+def _logcosh(v):
+    a = np.abs(v)
+    return a + np.log1p(np.exp(-2 * a)) - math.log(2)
+
+
+def clip_curve(pos_hard, neg_hard, pos_ceil, neg_ceil):
+    """lms_sat_da_proc step 4: tanh(b * hard) * ceil, each side its own.
+    -> (f, F), F(0) = 0 so the two halves meet."""
+    def f(u):
+        return np.where(u >= 0, np.tanh(u * pos_hard) * pos_ceil,
+                        np.tanh(u * neg_hard) * neg_ceil)
+
+    def F(u):
+        return np.where(u >= 0, _logcosh(u * pos_hard) * (pos_ceil / pos_hard),
+                        _logcosh(u * neg_hard) * (neg_ceil / neg_hard))
+    return f, F
+
+
+def adaa(u, f, F, prev=0.0):
+    """lms_adaa_eval over a whole signal: (F(u) - F(u1)) / (u - u1), blended
+    into f(midpoint) as |du| falls from ADAA_HI to ADAA_LO."""
+    u1 = np.concatenate(([prev], u[:-1]))
+    du = u - u1
+    adu = np.abs(du)
+    mid = f((u + u1) * 0.5)
+    q = (F(u) - F(u1)) / np.where(adu > 0, du, 1.0)
+    blend = np.clip((adu - ADAA_LO) / (ADAA_HI - ADAA_LO), 0.0, 1.0)
+    return mid + blend * (q - mid)
+
+
+def grid_conduction(b, thresh, amount):
+    """Step 5 with the peak-envelope gate open: a soft clamp above thresh."""
+    return np.where(b > thresh, thresh + np.tanh((b - thresh) * 3.0) * amount, b)
+
+
+# lms_sat_harmonics: x|x| and x^3, each with its antiderivative
+EVEN = (lambda v: v * np.abs(v), lambda v: v * v * np.abs(v) / 3)
+ODD = (lambda v: v ** 3, lambda v: v ** 4 / 4)
+
+
+# ---------------------------------------------------------------- tracker
+
+def _follow(rows, att, rel):
+    """The tracker's attack/release envelope over each row of |x| [k, n]."""
+    out = np.empty_like(rows)
+    for i, row in enumerate(rows):
+        e, env = 0.0, out[i]
+        for j, v in enumerate(row.tolist()):
+            e = att * e + (1 - att) * v if v > e else rel * e + (1 - rel) * v
+            env[j] = e
+    return out
+
+
+def _smooth(x, coeff, start):
+    """One-pole from `start`, as the plugin's parameter smoothing."""
+    return start + sosfilt([1 - coeff, 0.0, 0.0, 1.0, -coeff, 0.0], np.asarray(x) - start)
+
+
+def densities(b, sr):
+    """lms_sat_da_hd_proc over a pre-clip signal -> (density, mid, hi, air),
+    each float [n] and smoothed as the plugin smooths them."""
+    bands = np.stack([sosfilt(bq_lp(250, 0.7, sr), b),
+                      sosfilt(np.stack([bq_lp(2000, 0.7, sr), bq_hp(250, 0.7, sr)]), b),
+                      sosfilt(bq_hp(2000, 0.7, sr), b), sosfilt(bq_hp(5000, 0.7, sr), b), b])
+    lo, mid, hi, air, total = _follow(np.abs(bands), math.exp(-1 / (sr * 0.002)),
+                                      math.exp(-1 / (sr * 0.080)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw = np.where(lo > 0.0001, np.clip(total / lo, 1.0, 2.5), 1.0)
+        part = [np.where(total > 0.0001, np.clip(v / total, 0.0, 1.0), 0.0) for v in (mid, hi, air)]
+    k = math.exp(-1 / (sr * 0.030))
+    return (_smooth(raw, k, 1.0),) + tuple(_smooth(v, k, 0.0) for v in part)
+
+
+def cap_charge(b, sr, block=64):
+    """Step 1's coupling-cap charge over b (input plus bias) -> float [n].
+
+    c = k c + g with k and g set by b alone (charge while b > 0.1, drain
+    otherwise), so it is linear in c: each block of `block` samples is
+    solved from zero with a running product, and the blocks are joined
+    by carrying each one's end value into the next.
+    """
+    b = np.asarray(b, dtype=np.float64)
+    n = len(b)
+    up, down = math.exp(-1 / (sr * 0.0005)), math.exp(-1 / (sr * 0.030))
+    on = b > 0.1
+    k = np.ones(-(-n // block) * block)
+    g = np.zeros_like(k)
+    k[:n] = np.where(on, up, down)
+    g[:n] = np.where(on, (1 - up) * 0.12 * b, 0.0)
+    k, g = k.reshape(-1, block), g.reshape(-1, block)
+    P = np.cumprod(k, axis=1)
+    local = P * np.cumsum(g / P, axis=1)
+    start = np.empty(len(k))
+    c = 0.0
+    for i, (p, e) in enumerate(zip(P[:, -1].tolist(), local[:, -1].tolist())):
+        start[i] = c
+        c = p * c + e
+    return (local + P * start[:, None]).ravel()[:n]
+
+
+def track(x, sr, kind, drive=0.5, bias=0.0):
+    """What lms_sat_da_proc's density tracker does with `x` -> dict:
+    boost float [n] (the drive boost at each sample), miller_hz, miller_q
+    and air_db (their medians).
+
+    The tracker sees the gained pre-clip signal, boost included, and the
+    boost follows the tracker's mid density a sample late. Two passes
+    settle that loop: the densities are ratios of envelopes, so the boost
+    only moves them where an envelope is near the 0.0001 floors.
+    """
+    b = np.asarray(x, dtype=np.float64) + bias * 0.1
+    pre = (b - cap_charge(b, sr)) * (1.0 + drive * CURVES[kind][0] * 4.0)
+    boost = np.ones_like(b)
+    for _ in range(2):
+        density, mid, hi, air = densities(pre * boost, sr)
+        boost = 1.0 + 0.4 * np.concatenate(([0.0], mid[:-1]))
+    lp = np.clip(MILLER_BASE_HZ + (2.5 - density) * 6000, MILLER_BASE_HZ - 1500, 20000)
+    lp = _smooth(lp, math.exp(-1 / (sr * 0.150)), MILLER_BASE_HZ)
+    return {'boost': boost, 'miller_hz': float(np.median(lp)),
+            'miller_q': float(np.median(np.clip(0.6 + hi * 0.35, 0.6, 0.95))),
+            'air_db': float(np.median(np.clip(-air * 3.0, -3.0, 0.0)))}
+
+
+# ---------------------------------------------------------------- engine
+
+def _oversampled(x, sr, n, fn):
+    """fn at n x the rate: polyphase up, fn, polyphase down. The decimator's
+    taps run at the high rate, so it gets n times as many."""
+    if n == 1:
+        return fn(x)
+    up = resample(x[:, None], sr, sr * n, OS_HALF)[:, 0]
+    return resample(fn(up)[:, None], sr * n, sr, OS_HALF * n)[:len(x), 0]
+
+
+def parse_mode(mode):
+    """'adaa+os4' -> (True, 4)."""
+    if mode not in MODES:
+        raise ValueError(f'unknown mode {mode!r}: {", ".join(MODES)}')
+    m = re.search(r'os(\d)', mode)
+    return mode.startswith('adaa'), int(m.group(1)) if m else 1
+
+
+def saturate(x, sr, kind, mode='plain', drive=0.5, bias=0.0, even=0.5, odd=0.5, side=None):
+    """float [n] -> float [n]: one saturator in one mode. `side` is track()
+    of the same x, drive and bias, worked out here if not given."""
+    use_adaa, n = parse_mode(mode)
+    x = np.asarray(x, dtype=np.float64)
+    if kind == 'harmonics':
+        def stage(v):
+            out = v.copy()
+            for mix, scale, (f, F) in ((even, 0.3, EVEN), (odd, 0.2, ODD)):
+                out += mix * scale * (adaa(v, f, F) if use_adaa else f(v))
+            return out
+        return _oversampled(x, sr, n, stage)
+
+    mul, pos_hard, neg_hard, pos_ceil, neg_ceil, gc_thresh, gc_amount = CURVES[kind]
+    f, F = clip_curve(pos_hard, neg_hard, pos_ceil, neg_ceil)
+    side = side or track(x, sr, kind, drive, bias)
+    gain = (1.0 + drive * mul * 4.0) * np.repeat(side['boost'], n)
+
+    def stage(v):
+        u = (v - cap_charge(v, sr * n)) * gain[:len(v)]
+        return grid_conduction(adaa(u, f, F) if use_adaa else f(u), gc_thresh, gc_amount)
+    y = _oversampled(x + bias * 0.1, sr, n, stage)
+    post = np.stack([bq_lp(min(side['miller_hz'], 0.45 * sr), side['miller_q'], sr),
+                     bq_hishelf(5000, side['air_db'], 0.7, sr),
+                     dc(20.0 / (2 * math.pi), sr)])   # dc_r = 1 - 20 / srate
+    return sosfilt(post, y)
+
+
+def consumers(root=ROOT):
+    """{saturator: [plugins]} from the lms_sat_<name>( calls in the .jsfx files."""
+    rx = re.compile(r'lms_sat_(' + '|'.join(SATURATORS) + r')\(')
+    out = {k: [] for k in SATURATORS}
+    for path in sorted(glob.glob(os.path.join(root, '*.jsfx'))):
+        with open(path, encoding='utf-8', errors='replace') as fh:
+            found = set(rx.findall(fh.read()))
+        for k in sorted(found):
+            out[k].append(os.path.splitext(os.path.basename(path))[0])
+    return out
+
+
+# ---------------------------------------------------------------- measure
+
+def alias_of(y, sr, f0):
+    """THD / alias dict of a steady tone, measured as lms_measure thd does:
+    one power-of-two BH4 block from the middle."""
+    n = 1 << int(math.floor(math.log2(len(y) * 0.6)))
+    start = (len(y) - n) // 2
+    power = np.abs(np.fft.rfft(y[start:start + n] * bh4(n))) ** 2
+    return _thd_summary(power, sr / n, f0, sr)
+
+
+def time_per_sample(fn, x, repeat=3):
+    """Best of `repeat` runs, ns per input sample."""
+    fn(x[:4096])
+    best = math.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(x)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(x) * 1e9
+
+
+def _head(side, n):
+    """track() output for the first n samples of its signal."""
+    return side and dict(side, boost=side['boost'][:n])
+
+
+def table(sats, modes, sr, f0, level_db, drive, seconds=1.0):
+    """-> rows: (saturator, mode, alias dB, THD %, ns/sample, x plain)."""
+    settle = int(sr * SETTLE_S)
+    t = np.arange(settle + int(sr * seconds)) / sr
+    x = 10 ** (level_db / 20) * np.sin(2 * np.pi * f0 * t)
+    rows = []
+    for kind in sats:
+        base = None
+        side = track(x, sr, kind, drive) if kind in CURVES else None
+        for mode in modes:
+            fn = lambda v, k=kind, m=mode: saturate(v, sr, k, m, drive=drive,
+                                                    side=_head(side, len(v)))
+            r = alias_of(fn(x)[settle:], sr, f0)
+            ns = time_per_sample(fn, x)
+            base = base or ns
+            rows.append((kind, mode, float(db(r['alias_pct'] / 100)), r['thd_pct'], ns, ns / base))
+    return rows
+
+
+# ---------------------------------------------------------------- commands
+
+def cmd_table(a):
+    rows = table(a.sat, a.mode, a.sr, a.f0, a.level, a.drive, a.seconds)
+    print(f'  {a.f0:g} Hz at {a.level:g} dBFS, drive {a.drive:g}, {a.sr} Hz')
+    print(f'  {"sat":<10} {"mode":<9} {"alias dB":>9} {"THD %":>8} {"ns/smp":>8}'
+          f' {"x plain":>8} {"core %":>7}')
+    for kind, mode, alias, thd, ns, rel in rows:
+        print(f'  {kind:<10} {mode:<9} {alias:9.1f} {thd:8.2f} {ns:8.1f} {rel:8.1f}'
+              f' {ns * a.sr / 1e7:7.2f}')
+    print('  core %: one channel of this engine at the table\'s rate')
+    used = consumers()
+    for kind in a.sat:
+        if used.get(kind):
+            print(f'  {kind:<10} used by {", ".join(used[kind])}')
+    if a.csv:
+        with open(a.csv, 'w', newline='') as fh:
+            w = csv.writer(fh)
+            w.writerow(['sat', 'mode', 'alias_db', 'thd_pct', 'ns_per_sample', 'x_plain'])
+            w.writerows([k, m, f'{al:.2f}', f'{th:.3f}', f'{ns:.1f}', f'{rel:.2f}']
+                        for k, m, al, th, ns, rel in rows)
+
+
+def cmd_render(a):
+    w = Wav(a.src)
+    x = w.read()
+    t0 = time.perf_counter()
+    y = np.stack([saturate(x[:, c], w.sr, a.sat, a.mode, a.drive, a.bias, a.even, a.odd)
+                  for c in range(x.shape[1])], axis=1)
+    took = time.perf_counter() - t0
+    wav_write(a.out, y, w.sr, bits=a.bits)
+    print(f'  {a.sat} {a.mode}: {len(x) / w.sr:.2f} s x {x.shape[1]} ch in {took * 1000:.0f} ms'
+          f' -> {a.out}')
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    t = sub.add_parser('table', help='alias level against cost, every saturator and mode')
+    t.add_argument('--sat', nargs='+', choices=SATURATORS, default=list(SATURATORS))
+    t.add_argument('--mode', nargs='+', choices=MODES, default=list(MODES))
+    t.add_argument('--sr', type=int, default=96000)
+    t.add_argument('--f0', type=float, default=997.0)
+    t.add_argument('--level', type=float, default=-6.0, help='sine level, dBFS')
+    t.add_argument('--drive', type=float, default=0.5)
+    t.add_argument('--seconds', type=float, default=1.0)
+    t.add_argument('--csv', help='also write the rows here')
+    t.set_defaults(func=cmd_table)
+
+    r = sub.add_parser('render', help='run a WAV through one saturator in one mode')
+    r.add_argument('src')
+    r.add_argument('out')
+    r.add_argument('sat', choices=SATURATORS)
+    r.add_argument('--mode', choices=MODES, default='plain')
+    r.add_argument('--drive', type=float, default=0.5)
+    r.add_argument('--bias', type=float, default=0.0)
+    r.add_argument('--even', type=float, default=0.5, help='harmonics: even mix')
+    r.add_argument('--odd', type=float, default=0.5, help='harmonics: odd mix')
+    r.add_argument('--bits', type=int, choices=(16, 24, 32), default=32)
+    r.set_defaults(func=cmd_render)
+
+    a = p.parse_args()
+    a.func(a)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""lms_yin_detect, offline, on whole files.
+
+The plugins run YIN once per block with a direct double loop over the
+last W + tau_max samples: W * tau_max multiply-adds per detection, about
+290k at 48 kHz. Here the difference function comes from one FFT cross-
+correlation per frame and every frame of a file goes through at once;
+the CMND, absolute threshold, walk to the dip's minimum, parabolic
+refinement, range check and smoothing are lms_yin_detect's, step for step.
+
+    python tools/lms_yin.py track vox.wav --csv vox_pitch.csv
+    python tools/lms_yin.py tune corpus/*.wav --threshold 0.1 0.15 0.2 0.25
+    python tools/lms_yin.py bench --sr 48000
+
+Commands
+    track   per-frame pitch, confidence and MIDI, as pd.freq etc. would read
+    tune    how each threshold behaves on a corpus: voiced %, jumps, accuracy
+    bench   FFT against the direct loop: agreement, time and operation count
+
+A frame is what the plugin sees when it detects at the end of a block:
+the last W + tau_max samples of the (L + R) / 2 mix, zeros before the
+file starts. --hop is the block size; the plugins' skip-when-locked logic
+is not modelled, so every block is a detection.
+"""
+import argparse, csv, math, os, sys, time
+import numpy as np
+
+from lms_measure import Wav, mono
+from lms_filters import sosfilt
+
+# @cite decheveigne-kawahara-2002 -- YIN f0 estimator
+W = 480                         # lms_yin_init integration window
+MIN_FREQ = 80.0                 # lms_pitch_detector and lms_faker: lms_yin_init(5000, 80)
+MAX_FREQ = 1100.0               # lms_yin_detect range check
+THRESHOLD = 0.15                # lms_yin_init default, lms_pitch_detector slider1
+SMOOTH_ALPHA = 0.7
+GATE = 0.5                      # confidence the plugins act on
+HOP = 512
+CHUNK = 2048                    # frames per FFT batch
+
+
+# ---------------------------------------------------------------- frames
+
+def lags(sr, min_freq=MIN_FREQ):
+    """(tau_min, tau_max) as lms_yin_init sets them."""
+    return math.ceil(sr / 1000), math.ceil(sr / min_freq)
+
+
+def frames(x, hop, span):
+    """Float [F, span] views: the detector's linear copy at the end of each
+    hop-sample block. Row i ends at sample (i + 1) * hop."""
+    xp = np.concatenate((np.zeros(span), x))
+    return np.lib.stride_tricks.sliding_window_view(xp, span)[hop::hop]
+
+
+def difference(fr, tau_max, w=W):
+    """d(tau) = sum_j (x[j] - x[j + tau])^2, j < w, for every row at once:
+    the two energies from a running sum, the cross term from the FFT."""
+    n = 1 << (fr.shape[1] - 1).bit_length()
+    cross = np.fft.irfft(np.conj(np.fft.rfft(fr[:, :w], n)) * np.fft.rfft(fr, n), n)
+    e = np.zeros((len(fr), fr.shape[1] + 1))
+    np.cumsum(fr * fr, axis=1, out=e[:, 1:])
+    tau = np.arange(tau_max + 1)
+    d = e[:, w:w + 1] + (e[:, tau + w] - e[:, tau]) - 2 * cross[:, :tau_max + 1]
+    d[:, 0] = 0.0
+    return np.maximum(d, 0.0)
+
+
+def difference_direct(fr, tau_max, w=W):
+    """The plugin's double loop, batched over rows only."""
+    d = np.zeros((len(fr), tau_max + 1))
+    for tau in range(1, tau_max + 1):
+        delta = fr[:, :w] - fr[:, tau:tau + w]
+        d[:, tau] = np.einsum('ij,ij->i', delta, delta)
+    return d
+
+
+def cmnd(d):
+    """Step 2: cumulative mean normalised difference, 1 where the sum is 0."""
+    run = np.cumsum(d[:, 1:], axis=1)
+    out = np.ones_like(d)
+    tau = np.arange(1, d.shape[1])
+    out[:, 1:] = np.where(run > 0, d[:, 1:] * tau / np.where(run > 0, run, 1.0), 1.0)
+    return out
+
+
+# ---------------------------------------------------------------- detect
+
+def pick(dp, sr, tau_min, threshold=THRESHOLD):
+    """Steps 3-6 on CMND rows -> (raw Hz, confidence), 0 where the plugin
+    reports nothing."""
+    rows = np.arange(len(dp))
+    tau_max = dp.shape[1] - 1
+    seg = dp[:, tau_min:]
+    below = seg < threshold
+    hit = below.any(axis=1)
+    first = below.argmax(axis=1)
+    # walk forward while the next lag is lower: stop at the first rise
+    rising = np.ones_like(below)
+    rising[:, :-1] = seg[:, 1:] >= seg[:, :-1]
+    stop = (rising & (np.arange(seg.shape[1]) >= first[:, None])).argmax(axis=1)
+    low = seg.argmin(axis=1)
+    found = hit | (seg[rows, low] < 2)      # the fallback starts from min_val = 2
+    best = np.where(hit, stop, low) + tau_min
+    best_val = np.where(found, dp[rows, best], 1.0)
+    best = np.where(found, best, -1)
+
+    inner = (best > tau_min) & (best < tau_max)
+    b = np.clip(best, 1, tau_max - 1)
+    s0, s1, s2 = dp[rows, b - 1], dp[rows, b], dp[rows, b + 1]
+    denom = 2 * (2 * s1 - s2 - s0)
+    ok = inner & (np.abs(denom) > 0.0001)
+    tau = np.where(ok, best + (s2 - s0) / np.where(ok, denom, 1.0), best)
+
+    conf = np.clip(1 - best_val, 0.0, 1.0)
+    raw = np.where(tau > 0, sr / np.where(tau > 0, tau, 1.0), 0.0)
+    out = (raw < sr / tau_max * 0.95) | (raw > MAX_FREQ)
+    return np.where(out, 0.0, raw), np.where(out, 0.0, conf)
+
+
+def smooth(raw, conf, alpha=SMOOTH_ALPHA):
+    """Step 7: a one-pole over the confident frames only; prev_freq carries
+    across the gaps, freq reads 0 inside them."""
+    voiced = (conf > GATE) & (raw > 0)
+    freq = np.zeros_like(raw)
+    r = raw[voiced]
+    if len(r):
+        one_pole = [alpha, 0.0, 0.0, 1.0, alpha - 1.0, 0.0]
+        freq[voiced] = sosfilt(one_pole, r - r[0]) + r[0]
+    return freq
+
+
+def midi(freq):
+    """Step 8 -> (midi_note, midi_int, cents), 0 where freq is 0."""
+    m = np.where(freq > 0, 69 + 12 * np.log2(np.where(freq > 0, freq, 440.0) / 440), 0.0)
+    mi = np.floor(m + 0.5)
+    return m, mi.astype(np.int64), (m - mi) * 100
+
+
+def cmnd_chunks(x, sr, hop=HOP, min_freq=MIN_FREQ, direct=False):
+    """CMND rows for every frame of x, CHUNK frames at a time."""
+    tau_min, tau_max = lags(sr, min_freq)
+    fr = frames(x, hop, W + tau_max)
+    diff = difference_direct if direct else difference
+    for i in range(0, len(fr), CHUNK):
+        yield cmnd(diff(fr[i:i + CHUNK], tau_max))
+
+
+def track(x, sr, threshold=THRESHOLD, hop=HOP, min_freq=MIN_FREQ, chunks=None):
+    """Mono float [n] -> dict of per-frame arrays: t, freq (pd.freq), raw,
+    confidence, midi_note, midi_int, cents. Pass chunks from cmnd_chunks to
+    reuse them across thresholds."""
+    tau_min, _ = lags(sr, min_freq)
+    parts = [pick(dp, sr, tau_min, threshold)
+             for dp in (chunks if chunks is not None else cmnd_chunks(x, sr, hop, min_freq))]
+    raw = np.concatenate([p[0] for p in parts]) if parts else np.zeros(0)
+    conf = np.concatenate([p[1] for p in parts]) if parts else np.zeros(0)
+    freq = smooth(raw, conf)
+    m, mi, cents = midi(freq)
+    return {'t': np.arange(1, len(raw) + 1) * hop / sr, 'freq': freq, 'raw': raw,
+            'confidence': conf, 'midi_note': m, 'midi_int': mi, 'cents': cents}
+
+
+def note_number(text):
+    """'A4', 'C#3', 'Eb2' or a MIDI number -> float MIDI."""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    names = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+    head, rest = text[0].upper(), text[1:]
+    if head not in names:
+        raise ValueError(f'not a note: {text}')
+    shift = 0
+    while rest[:1] in ('#', 'b'):
+        shift += 1 if rest[0] == '#' else -1
+        rest = rest[1:]
+    return float(names[head] + shift + 12 * (int(rest) + 1))
+
+
+def summary(r, expect=None):
+    """Corpus row for one track: voiced %, median confidence when voiced,
+    jumps (semitone-plus steps between voiced neighbours) and, given the
+    expected note, % within 50 cents of it and % an octave out."""
+    voiced = r['freq'] > 0
+    m = r['midi_note'][voiced]
+    row = {'voiced_pct': 100 * voiced.mean() if len(voiced) else 0.0,
+           'conf': float(np.median(r['confidence'][voiced])) if voiced.any() else 0.0,
+           'jumps_pct': 100 * float((np.abs(np.diff(m)) > 1).mean()) if len(m) > 1 else 0.0,
+           'median_midi': float(np.median(m)) if len(m) else 0.0}
+    if expect is not None and len(m):
+        off = m - expect
+        row['in_tune_pct'] = 100 * float((np.abs(off) <= 0.5).mean())
+        row['octave_pct'] = 100 * float((np.abs(np.abs(off) - 12) <= 0.5).mean())
+    return row
+
+
+# ---------------------------------------------------------------- commands
+
+def _load(path):
+    w = Wav(path)
+    return mono(w.read()), w.sr
+
+
+def cmd_track(a):
+    for path in a.files:
+        x, sr = _load(path)
+        t0 = time.perf_counter()
+        r = track(x, sr, a.threshold, a.hop, a.min_freq)
+        took = time.perf_counter() - t0
+        voiced = r['freq'] > 0
+        pct = 100 * voiced.mean() if len(voiced) else 0.0
+        print(f'  {os.path.basename(path)}: {len(r["t"])} frames, {pct:.0f}% voiced,'
+              f' {len(x) / sr:.1f} s in {took * 1000:.0f} ms'
+              f' ({len(x) / sr / max(took, 1e-9):.0f}x real time)')
+        if voiced.any():
+            print(f'    median {np.median(r["freq"][voiced]):.1f} Hz,'
+                  f' confidence {np.median(r["confidence"][voiced]):.2f}')
+        if a.csv:
+            out = a.csv if len(a.files) == 1 else \
+                os.path.splitext(path)[0] + '_pitch.csv'
+            keys = ('t', 'freq', 'raw', 'confidence', 'midi_note', 'midi_int', 'cents')
+            with open(out, 'w', newline='') as fh:
+                w = csv.writer(fh)
+                w.writerow(['time_s', 'freq_hz', 'raw_hz', 'confidence', 'midi_note',
+                            'midi_int', 'cents'])
+                w.writerows(zip(*(np.round(r[k], 4) if r[k].dtype.kind == 'f' else r[k]
+                                  for k in keys)))
+            print(f'    -> {out}')
+
+
+def cmd_tune(a):
+    expect = note_number(a.expect) if a.expect else None
+    rows = []
+    for path in a.files:
+        x, sr = _load(path)
+        chunks = list(cmnd_chunks(x, sr, a.hop, a.min_freq))
+        for th in a.threshold:
+            r = summary(track(x, sr, th, a.hop, a.min_freq, chunks), expect)
+            rows.append((os.path.basename(path), th, r))
+    extra = expect is not None
+    print(f'  {"file":<28} {"thresh":>6} {"voiced%":>8} {"conf":>5} {"jumps%":>7}'
+          f' {"midi":>6}' + (f' {"tune%":>6} {"oct%":>5}' if extra else ''))
+    for name, th, r in rows:
+        print(f'  {name[:28]:<28} {th:6.2f} {r["voiced_pct"]:8.1f} {r["conf"]:5.2f}'
+              f' {r["jumps_pct"]:7.1f} {r["median_midi"]:6.1f}'
+              + (f' {r.get("in_tune_pct", 0):6.1f} {r.get("octave_pct", 0):5.1f}' if extra else ''))
+    if len(a.files) > 1:
+        for th in a.threshold:
+            rs = [r for _, t, r in rows if t == th]
+            print(f'  {"(all)":<28} {th:6.2f} {np.mean([r["voiced_pct"] for r in rs]):8.1f}'
+                  f' {np.mean([r["conf"] for r in rs]):5.2f}'
+                  f' {np.mean([r["jumps_pct"] for r in rs]):7.1f}')
+
+
+def test_voice(sr, secs):
+    """A glide from 110 to 660 Hz with five harmonics, vibrato, and a gap
+    of noise every second: something for both branches of step 3."""
+    t = np.arange(int(sr * secs)) / sr
+    f = 110 * 6 ** (t / secs) * (1 + 0.01 * np.sin(2 * np.pi * 5.5 * t))
+    ph = 2 * np.pi * np.cumsum(f) / sr
+    x = sum(np.sin(k * ph) / k for k in range(1, 6)) * 0.3
+    gap = (t % 1.0) > 0.85
+    return np.where(gap, np.random.default_rng(0).normal(0, 0.05, len(t)), x)
+
+
+def cmd_bench(a):
+    if a.file:
+        x, sr = _load(a.file)
+    else:
+        sr = a.sr
+        x = test_voice(sr, a.seconds)
+    tau_min, tau_max = lags(sr, a.min_freq)
+    span = W + tau_max
+    n = 1 << (span - 1).bit_length()
+    results = {}
+    for name, direct in (('fft', False), ('direct', True)):
+        t0 = time.perf_counter()
+        chunks = list(cmnd_chunks(x, sr, a.hop, a.min_freq, direct))
+        r = track(x, sr, a.threshold, a.hop, a.min_freq, chunks)
+        results[name] = (r, time.perf_counter() - t0)
+    (rf, tf), (rd, td) = results['fft'], results['direct']
+    frames_n = len(rf['t'])
+    same = np.abs(rf['raw'] - rd['raw']) <= 1e-6 * np.maximum(rd['raw'], 1)
+    print(f'  {frames_n} frames, W {W}, tau {tau_min}-{tau_max}, FFT size {n}, {sr} Hz')
+    print(f'  agreement: {100 * same.mean():.2f}% of frames,'
+          f' max |raw Hz| difference {np.abs(rf["raw"] - rd["raw"]).max():.2e}')
+    for name, took in (('fft', tf), ('direct', td)):
+        print(f'  {name:<7} {took * 1e6 / frames_n:8.1f} us/frame'
+              f'  {len(x) / sr / max(took, 1e-9):7.0f}x real time')
+    # the plugin's cost is the difference function; count its operations
+    direct_ops = 2 * W * tau_max                        # one multiply, one add per term
+    fft_ops = 3 * 2.5 * n * math.log2(n) + 8 * n + 4 * span   # 2 rfft + irfft, product, energies
+    print(f'  difference function, flops per detection: direct {direct_ops:,.0f},'
+          f' FFT ~{fft_ops:,.0f} ({direct_ops / fft_ops:.1f}x fewer)')
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    def common(s):
+        s.add_argument('--hop', type=int, default=HOP, help='block size: one detection per hop')
+        s.add_argument('--min-freq', type=float, default=MIN_FREQ,
+                       help=f'lms_yin_init min_freq (default {MIN_FREQ:g})')
+
+    t = sub.add_parser('track', help='per-frame pitch, confidence and MIDI')
+    t.add_argument('files', nargs='+')
+    t.add_argument('--threshold', type=float, default=THRESHOLD)
+    t.add_argument('--csv', help='write the frames here (with several files: FILE_pitch.csv)')
+    common(t)
+    t.set_defaults(func=cmd_track)
+
+    u = sub.add_parser('tune', help='thresholds against a corpus')
+    u.add_argument('files', nargs='+')
+    u.add_argument('--threshold', type=float, nargs='+',
+                   default=[0.05, 0.1, 0.15, 0.2, 0.3, 0.5])
+    u.add_argument('--expect', help='the note every file should read: A3, C#4, or MIDI')
+    common(u)
+    u.set_defaults(func=cmd_tune)
+
+    b = sub.add_parser('bench', help='FFT against the direct loop')
+    b.add_argument('file', nargs='?', help='default: a generated glide')
+    b.add_argument('--sr', type=int, default=48000)
+    b.add_argument('--seconds', type=float, default=10.0)
+    b.add_argument('--threshold', type=float, default=THRESHOLD)
+    common(b)
+    b.set_defaults(func=cmd_bench)
+
+    a = p.parse_args()
+    try:
+        a.func(a)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Offline DRUMBANGER pattern renderer.
+
+Hearing a pattern, or checking that a change to the plugin didn't change
+what a pattern sounds like, meant playing it in REAPER in real time. This
+mixes it straight from the pattern and the kit's pool samples, many times
+faster than real time, into a WAV for lms_measure.py null:
+
+    python tools/pattern_render.py beat.txt --kit Kit1-808 --bpm 96 --swing 40 -o py.wav
+    python tools/lms_measure.py null reaper.wav py.wav
+
+A pattern file is the sequencer's memory as text: one line per step, 16
+velocities (0-127) per line, pads left to right -- the step * 16 + pad
+layout of the gmem pattern block at 700010 and of the mirror at 1000. A
+dump of the whole mirror (512 lines: 8 patterns of 64 steps) works too;
+--pattern picks one. '#' starts a comment. scripts/drumbanger_dump_pattern.lua
+writes the plugin's current pattern in this form, from the mirror, at the
+pattern's bar count, and prints the command line to render it.
+
+What is modelled is the plugin's dry path: the swing split, velocity / 127,
+the 64-sample fade-in on every trigger and the crossfade tail when a pad
+retriggers itself (pads are monophonic), pitch by linear interpolation,
+equal-power pan, pad and master volume. Per-pad filters, sub-steps, ties,
+choke and link groups, p-locks and the output bus are not: render the
+REAPER side with them off. The plugin also fires steps at block
+boundaries; --block N does the same for a null against a real render.
+"""
+import argparse, math, os, sys, time
+import numpy as np
+
+from lms_measure import Wav, wav_write
+from kit_prep import PAD_BUF_FRAMES, POOL, SR, pool_wavs
+
+NUM_PADS = 16
+STEPS_PER_BAR = 16              # 4/4, as the plugin's NUM_STEPS
+MIRROR_STEPS = 64               # per pattern in the gmem mirror
+XFADE_LEN = 64                  # lms_drumbanger.jsfx XFADE_LEN
+PAD_VOL = 0.8                   # slider10-25 defaults
+MASTER_VOL = 0.8                # slider4 default
+
+
+# ---------------------------------------------------------------- pattern
+
+def load_pattern(path, pattern=0):
+    """-> int [steps, 16] velocities."""
+    rows = []
+    with open(path) as fh:
+        for n, line in enumerate(fh, 1):
+            line = line.split('#', 1)[0].replace(',', ' ').split()
+            if not line:
+                continue
+            if len(line) != NUM_PADS:
+                raise ValueError(f'{path}:{n}: {len(line)} values, expected {NUM_PADS}')
+            rows.append([int(float(v)) for v in line])
+    grid = np.clip(np.array(rows, dtype=np.int64).reshape(-1, NUM_PADS), 0, 127)
+    if len(grid) == 8 * MIRROR_STEPS:
+        grid = grid[pattern * MIRROR_STEPS:(pattern + 1) * MIRROR_STEPS]
+        # the mirror holds 64 steps whatever the bar count: keep the bars in use
+        used = np.flatnonzero(grid.any(axis=1))
+        bars = (int(used[-1]) // STEPS_PER_BAR + 1) if len(used) else 1
+        grid = grid[:bars * STEPS_PER_BAR]
+    return grid
+
+
+def step_times(steps, bpm, swing, sr, block=0):
+    """Sample offset of each step. Within a beat, steps 0-1 share the first
+    8th and 2-3 the second; swing moves the split from 2.0 to 3.8 steps."""
+    step = 60.0 / bpm / 4.0 * sr
+    split = 2.0 + swing / 100.0 * 1.8
+    within = np.array([0.0, split / 2, split, split + (4.0 - split) / 2])
+    g = np.arange(steps)
+    t = ((g // 4) * 4 + within[g % 4]) * step
+    if block > 0:
+        # the plugin sees a new step at the first block that starts past it
+        return (np.ceil(t / block - 1e-9) * block).astype(np.int64)
+    return np.round(t).astype(np.int64)
+
+
+# ---------------------------------------------------------------- voices
+
+def voice(x, rate):
+    """Stereo float [n, 2] as one trigger plays it: read at `rate` source
+    samples per output sample with linear interpolation, faded in over the
+    first XFADE_LEN source samples."""
+    n = len(x)
+    pos = np.arange(int(math.ceil(n / rate))) * rate
+    pos = pos[pos < n]
+    idx = pos.astype(np.int64)
+    frac = (pos - idx)[:, None]
+    y = x[idx] + frac * (x[np.minimum(idx + 1, n - 1)] - x[idx])
+    return y * np.minimum(pos / XFADE_LEN, 1.0)[:, None]
+
+
+def place(out, v, starts, gains):
+    """Add every trigger of one pad into `out` in a single pass. Each hit
+    plays until the next one, then fades out over XFADE_LEN samples; all
+    hits become one index/weight list for np.bincount per channel."""
+    if not len(starts) or not len(v):
+        return
+    gap = np.append(np.diff(starts), len(v))
+    length = np.minimum(len(v), gap + XFADE_LEN)
+    length = np.minimum(length, len(out) - starts)
+    hit = np.repeat(np.arange(len(starts)), length)
+    j = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    env = np.clip((gap[hit] + XFADE_LEN - j) / XFADE_LEN, 0.0, 1.0) * gains[hit]
+    at = starts[hit] + j
+    lo, hi = int(at.min()), int(at.max()) + 1
+    for c in range(out.shape[1]):
+        out[lo:hi, c] += np.bincount(at - lo, weights=v[j, c] * env, minlength=hi - lo)
+
+
+def render(grid, samples, bpm, swing=0.0, sr=SR, vol=None, pan=None, pitch=None,
+           master=MASTER_VOL, loops=1, block=0):
+    """-> float [n, 2]. `samples` is 16 (float [n, ch], rate) pairs or None."""
+    vol = np.full(NUM_PADS, PAD_VOL) if vol is None else np.asarray(vol, dtype=np.float64)
+    pan = np.zeros(NUM_PADS) if pan is None else np.asarray(pan, dtype=np.float64)
+    pitch = np.zeros(NUM_PADS) if pitch is None else np.asarray(pitch, dtype=np.float64)
+    grid = np.tile(grid, (loops, 1))
+    starts = step_times(len(grid), bpm, swing, sr, block)
+    end = int(starts[-1] + 60.0 / bpm / 4.0 * sr) if len(grid) else 0
+
+    voices = [None] * NUM_PADS
+    for p, s in enumerate(samples):
+        if s is not None and grid[:, p].any():
+            x, rate = s
+            x = x[:PAD_BUF_FRAMES]
+            x = np.repeat(x[:, :1], 2, axis=1) if x.shape[1] == 1 else x[:, :2]
+            voices[p] = voice(x, 2 ** (pitch[p] / 12) * rate / sr)
+            end = max(end, int(starts[np.flatnonzero(grid[:, p])[-1]]) + len(voices[p]))
+
+    out = np.zeros((end, 2))
+    for p, v in enumerate(voices):
+        if v is None:
+            continue
+        hits = np.flatnonzero(grid[:, p])
+        a = math.pi / 4 * (pan[p] + 1)
+        place(out, v * [math.cos(a), math.sin(a)], starts[hits],
+              grid[hits, p] / 127.0 * vol[p])
+    return out * master
+
+
+# ---------------------------------------------------------------- main
+
+def kit_samples(pool, kit, overrides=()):
+    """16 (float [n, ch], rate) or None: the kit folder's WAVs in manifest
+    order, then any PAD=FILE overrides."""
+    files = [os.path.join(pool, kit, f) for f in pool_wavs(os.path.join(pool, kit))
+             if '/' not in f][:NUM_PADS] if kit else []
+    files += [None] * (NUM_PADS - len(files))
+    for o in overrides:
+        pad, _, f = o.partition('=')
+        files[int(pad) - 1] = f
+    out = []
+    for f in files:
+        if f is None:
+            out.append(None)
+            continue
+        w = Wav(f)
+        out.append((w.read(), w.sr))
+    return out
+
+
+def pad_values(text, default):
+    """'0.8' for every pad, or 16 comma-separated values."""
+    if text is None:
+        return np.full(NUM_PADS, default)
+    v = [float(t) for t in text.split(',')]
+    if len(v) == 1:
+        return np.full(NUM_PADS, v[0])
+    if len(v) != NUM_PADS:
+        sys.exit(f'expected 1 or {NUM_PADS} values, got {len(v)}: {text}')
+    return np.array(v)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('pattern', help='pattern file: one line per step, 16 velocities')
+    p.add_argument('-o', '--out', default='pattern.wav')
+    p.add_argument('--pool', default=POOL, help=f'pool folder (default {POOL})')
+    p.add_argument('--kit', help='kit folder in the pool; its WAVs are pads 01-16')
+    p.add_argument('--sample', action='append', default=[], metavar='PAD=FILE',
+                   help='put FILE on pad PAD (1-16), over the kit')
+    p.add_argument('--pattern', dest='index', type=int, default=0,
+                   help='which pattern (0-7) when the file is the whole mirror')
+    p.add_argument('--bpm', type=float, default=120.0)
+    p.add_argument('--swing', type=float, default=0.0, help='swing %% (0-100)')
+    p.add_argument('--loops', type=int, default=1, help='times through the pattern')
+    p.add_argument('--sr', type=int, default=SR)
+    p.add_argument('--vol', help=f'pad volume 0-1: one value or 16 (default {PAD_VOL})')
+    p.add_argument('--pan', help='pad pan -1..1: one value or 16 (default 0)')
+    p.add_argument('--pitch', help='pad pitch in semitones: one value or 16 (default 0)')
+    p.add_argument('--master', type=float, default=MASTER_VOL,
+                   help=f'master volume (default {MASTER_VOL})')
+    p.add_argument('--block', type=int, default=0,
+                   help='fire steps on N-sample block boundaries, like the plugin')
+    p.add_argument('--bits', type=int, choices=(16, 24, 32), default=32)
+    a = p.parse_args()
+
+    try:
+        grid = load_pattern(a.pattern, a.index)
+        samples = kit_samples(a.pool, a.kit, a.sample)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    t0 = time.perf_counter()
+    y = render(grid, samples, a.bpm, a.swing, a.sr, pad_values(a.vol, PAD_VOL),
+               pad_values(a.pan, 0.0), pad_values(a.pitch, 0.0), a.master, a.loops, a.block)
+    took = time.perf_counter() - t0
+    wav_write(a.out, y, a.sr, bits=a.bits)
+    hits = int((grid > 0).sum()) * a.loops
+    print(f'  {len(grid)} steps x {a.loops}, {hits} hits, {len(y) / a.sr:.2f} s'
+          f' in {took * 1000:.0f} ms ({len(y) / a.sr / max(took, 1e-9):.0f}x real time)'
+          f' -> {a.out}')
+    peak = float(np.abs(y).max()) if len(y) else 0.0
+    if peak > 1.0:
+        print(f'  peak {20 * math.log10(peak):+.1f} dBFS: clips unless written as float',
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()